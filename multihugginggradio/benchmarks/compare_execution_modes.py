@@ -0,0 +1,152 @@
+"""
+Compare the execution modes of a model on CPU.
+
+For each execution mode, the model is loaded, run on the same inputs and compared against fp32:
+- latency: median milliseconds per input, after one warm-up pass.
+- memory: bytes used by the model weights.
+- top-1 agreement: fraction of inputs with the same top-1 prediction as fp32 (class for image
+  classification, next token for chat).
+
+Example usage:
+```
+python -m benchmarks.compare_execution_modes --task "Image Classification" --model google/vit-base-patch16-224
+python -m benchmarks.compare_execution_modes --task Chat --model databricks/dolly-v2-3b --modes fp32 int8
+```
+"""
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+import torch
+
+from multihugginggradio.models.chat_llm import ChatLLM
+from multihugginggradio.models.execution_mode import EXECUTION_MODES
+from multihugginggradio.models.image_class_model import ImageClassModel
+
+# Prompts used to compare the next token predicted by the chat models
+CHAT_PROMPTS = [
+    'Hello! How are you today?',
+    'What is the capital of France?',
+    'Write a short poem about the sea.',
+    'Explain what a neural network is.',
+    'The quick brown fox jumps over the lazy dog.',
+    'List three fruits that are red.',
+    'How many legs does a spider have?',
+    'Translate "good morning" to Portuguese.',
+]
+
+
+def load_model(task: str, model_name: str, execution_mode: str):
+    """
+    Load a model of a task in an execution mode.
+    """
+    if task == 'Image Classification':
+        return ImageClassModel(model_name, execution_mode=execution_mode)
+    if task == 'Chat':
+        return ChatLLM(model_name, execution_mode=execution_mode)
+
+    raise ValueError(f'Unsupported task {task}')
+
+
+def predict_top1(task: str, model, model_input) -> int:
+    """
+    Run one input through the model and return its top-1 prediction.
+    """
+    if task == 'Image Classification':
+        _, logits = model.infer(model_input, return_logits=True)
+        return int(logits.argmax(-1))
+
+    input_ids = model.model.tokenizer(model_input, return_tensors='pt')['input_ids']
+    with torch.inference_mode():
+        logits = model.model.model(input_ids.to(model.model.model.device)).logits
+
+    return int(logits[0, -1].argmax(-1))
+
+
+def benchmark_mode(task: str, model_name: str, execution_mode: str, inputs: list) -> dict:
+    """
+    Measure the latency, memory and predictions of a model in an execution mode.
+    """
+    model = load_model(task, model_name, execution_mode)
+    memory = model.memory_footprint()
+
+    # Warm up once, then time each input
+    predict_top1(task, model, inputs[0])
+    latencies, predictions = [], []
+    for model_input in inputs:
+        start_time = time.perf_counter()
+        predictions.append(predict_top1(task, model, model_input))
+        latencies.append(time.perf_counter() - start_time)
+
+    model.release()
+
+    return {
+        'execution_mode': execution_mode,
+        'latency_ms': statistics.median(latencies) * 1000,
+        'memory_bytes': memory,
+        'predictions': predictions,
+    }
+
+
+def compare_execution_modes(task: str, model_name: str, modes: list, num_inputs: int = 16) -> list:
+    """
+    Benchmark a model in several execution modes and compare each of them against fp32.
+
+    Returns:
+        list: A report per execution mode with the median latency, weight memory, top-1 agreement with
+              fp32 and the latency speedup and memory ratio relative to fp32.
+    """
+    if task == 'Image Classification':
+        rng = np.random.default_rng(0)
+        inputs = [rng.integers(0, 256, (224, 224, 3), dtype=np.uint8) for _ in range(num_inputs)]
+    else:
+        inputs = [CHAT_PROMPTS[index % len(CHAT_PROMPTS)] for index in range(num_inputs)]
+
+    # fp32 is the reference of the comparison
+    modes = ['fp32'] + [mode for mode in modes if mode != 'fp32']
+    reports = [benchmark_mode(task, model_name, mode, inputs) for mode in modes]
+
+    reference = reports[0]
+    reference_predictions = reference['predictions']
+    for report in reports:
+        matches = sum(a == b for a, b in zip(report.pop('predictions'), reference_predictions))
+        report['top1_agreement'] = matches / len(inputs)
+        report['speedup'] = reference['latency_ms'] / report['latency_ms']
+        report['memory_ratio'] = report['memory_bytes'] / reference['memory_bytes']
+
+    return reports
+
+
+def format_report(reports: list) -> str:
+    """
+    Format the reports as a text table.
+    """
+    lines = [
+        f"{'mode':<6} {'latency (ms)':>13} {'speedup':>8} {'memory (MB)':>12} {'memory ratio':>13} {'top-1 agreement':>16}"
+    ]
+    for report in reports:
+        lines.append(
+            f"{report['execution_mode']:<6} {report['latency_ms']:>13.2f} {report['speedup']:>8.2f} "
+            f"{report['memory_bytes'] / 1e6:>12.1f} {report['memory_ratio']:>13.2f} {report['top1_agreement']:>16.1%}"
+        )
+
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the execution modes of a model on CPU.')
+    parser.add_argument('--task', choices=['Image Classification', 'Chat'], default='Image Classification')
+    parser.add_argument('--model', default='google/vit-base-patch16-224', help='Name or path of the model.')
+    parser.add_argument('--modes', nargs='+', choices=EXECUTION_MODES, default=list(EXECUTION_MODES))
+    parser.add_argument('--num-inputs', type=int, default=16, help='Number of inputs timed per execution mode.')
+    parser.add_argument('--output', help='Optional path of a JSON file to write the reports to.')
+    args = parser.parse_args()
+
+    reports = compare_execution_modes(args.task, args.model, args.modes, args.num_inputs)
+    print(format_report(reports))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(reports, file, indent=4)
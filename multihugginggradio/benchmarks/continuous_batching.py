@@ -0,0 +1,124 @@
+"""
+Throughput of a chat model under concurrent users, with and without continuous batching.
+
+For each number of users, every user runs one conversation turn in its own thread, all at once, like the chat
+handlers of the interface. The model answers them either with a `generate` call per user (max batch size 1, the
+users compete for the model), or with the continuous batcher decoding the generations of all the users together.
+The benchmark reports the total generated tokens per second over all the users and the median seconds per
+response, and checks that both runs give the same responses.
+
+Example usage:
+```
+python -m benchmarks.continuous_batching --model databricks/dolly-v2-3b
+python -m benchmarks.continuous_batching --model my_model --users 1 4 8 16 --max-tokens 64 --execution-mode fp32
+```
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+
+from multihugginggradio.models.chat_llm import ChatLLM
+
+# Prompts of the users, the users beyond their number reuse them with different maximum numbers of tokens
+PROMPTS = [
+    'Explain what a hash table is.',
+    'Write a short poem about the sea.',
+    'What are the benefits of regular exercise?',
+    'Describe the water cycle.',
+    'How does a compiler work?',
+    'Give me three ideas for a birthday party.',
+    'Why is the sky blue?',
+    'Summarize the plot of Romeo and Juliet.',
+]
+
+
+def run_users(model: ChatLLM, num_users: int, max_tokens: int) -> dict:
+    """
+    Run one conversation turn per user, each user in its own thread.
+
+    Returns:
+        dict: The responses, the total generated tokens per second and the median seconds per response.
+    """
+    responses, num_tokens, durations = [None] * num_users, [0] * num_users, [0.0] * num_users
+
+    def answer(user):
+        stats = {}
+        start_time = time.perf_counter()
+        # Each user asks for a different number of tokens, so the generations finish at different steps
+        *_, responses[user] = model.infer_stream(
+            PROMPTS[user % len(PROMPTS)], max_tokens=max_tokens - user % 4 * max_tokens // 8, stats=stats,
+            session_id=f'user-{user}-{time.perf_counter()}',
+        )
+        durations[user] = time.perf_counter() - start_time
+        num_tokens[user] = stats['num_tokens']
+
+    threads = [threading.Thread(target=answer, args=(user,)) for user in range(num_users)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    total_time = time.perf_counter() - start_time
+
+    return {
+        'responses': responses,
+        'tokens_per_second': sum(num_tokens) / total_time,
+        'median_seconds': statistics.median(durations),
+    }
+
+
+def benchmark_users(model_name: str, execution_mode: str, users: list, max_tokens: int) -> list:
+    """
+    Measure the throughput of a chat model for each number of users, with and without continuous batching.
+
+    Returns:
+        list: A report per number of users.
+    """
+    runs = {}
+    for max_batch_size in (1, max(users)):
+        model = ChatLLM(model_name, execution_mode=execution_mode, max_batch_size=max_batch_size)
+        model.warmup()
+        runs[max_batch_size] = [run_users(model, num_users, max_tokens) for num_users in users]
+        model.release()
+
+    reports = []
+    for num_users, serial, batched in zip(users, runs[1], runs[max(users)]):
+        reports.append({
+            'model_name': model_name,
+            'users': num_users,
+            'serial_tokens_per_second': serial['tokens_per_second'],
+            'batched_tokens_per_second': batched['tokens_per_second'],
+            'speedup': batched['tokens_per_second'] / serial['tokens_per_second'],
+            'serial_median_seconds': serial['median_seconds'],
+            'batched_median_seconds': batched['median_seconds'],
+            'same_responses': serial['responses'] == batched['responses'],
+        })
+
+    return reports
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the chat throughput with and without continuous batching.')
+    parser.add_argument('--model', default='databricks/dolly-v2-3b', help='Name or path of the chat model.')
+    parser.add_argument('--execution-mode', default='bf16', help='Execution mode of the model.')
+    parser.add_argument('--users', nargs='+', type=int, default=[1, 2, 4, 8], help='Numbers of concurrent users.')
+    parser.add_argument('--max-tokens', type=int, default=64, help='Maximum number of tokens of the longest responses.')
+    parser.add_argument('--output', help='Optional path of a JSON file to write the reports to.')
+    args = parser.parse_args()
+
+    reports = benchmark_users(args.model, args.execution_mode, args.users, args.max_tokens)
+
+    print(f"{'model':<30} {'users':>5} {'serial (tok/s)':>15} {'batched (tok/s)':>16} {'speedup':>8} "
+          f"{'serial p50 (s)':>15} {'batched p50 (s)':>16} {'same':>5}")
+    for report in reports:
+        print(f"{os.path.basename(report['model_name'].rstrip('/'))[:30]:<30} {report['users']:>5} "
+              f"{report['serial_tokens_per_second']:>15.1f} {report['batched_tokens_per_second']:>16.1f} "
+              f"{report['speedup']:>7.2f}x {report['serial_median_seconds']:>15.2f} "
+              f"{report['batched_median_seconds']:>16.2f} {str(report['same_responses']):>5}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(reports, file, indent=4)
@@ -0,0 +1,87 @@
+"""
+Measure the seconds per image of each image generation preset of the configuration.
+
+Each preset is run on the same prompts after one warm-up generation. Without `--model`, a tiny
+randomly initialized Stable Diffusion pipeline is built in a temporary directory, so the benchmark
+runs offline and measures the relative cost of the presets rather than the real generation time.
+
+Example usage:
+```
+python -m benchmarks.image_gen_presets
+python -m benchmarks.image_gen_presets --model CompVis/stable-diffusion-v1-4 --execution-mode bf16 --num-images 2
+```
+"""
+import argparse
+import json
+import statistics
+import tempfile
+import time
+
+from benchmarks.tiny_models import build_tiny_image_gen_model
+from multihugginggradio.models.image_gen_model import ImageGenModel
+from multihugginggradio.utils.config.config import UIConfig
+
+# Prompts generated with every preset
+PROMPTS = [
+    'A lighthouse on a cliff at sunset',
+    'A bowl of fruit on a wooden table',
+    'A cat sleeping on a red sofa',
+]
+
+
+def benchmark_presets(model_name: str, presets: dict, execution_mode: str = 'fp32', num_images: int = 3) -> list:
+    """
+    Generate images with every preset and time them.
+
+    Returns:
+        list: A report per preset with its settings and the median and mean seconds per image.
+    """
+    model = ImageGenModel(model_name, execution_mode=execution_mode, presets=presets)
+    model.warmup()
+
+    reports = []
+    for name, settings in presets.items():
+        durations = []
+        for index in range(num_images):
+            start_time = time.perf_counter()
+            model.infer(PROMPTS[index % len(PROMPTS)], seed=index, preset=name)
+            durations.append(time.perf_counter() - start_time)
+
+        reports.append({
+            'preset': name,
+            **settings,
+            'median_seconds_per_image': statistics.median(durations),
+            'mean_seconds_per_image': statistics.mean(durations),
+        })
+
+    model.release()
+
+    return reports
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the seconds per image of each image generation preset.')
+    parser.add_argument('--model', help='Name or path of the pipeline. Defaults to a tiny local pipeline.')
+    parser.add_argument('--config', default='config.yaml', help='Configuration file with the presets.')
+    parser.add_argument('--execution-mode', default='fp32', help='Execution mode of the pipeline.')
+    parser.add_argument('--num-images', type=int, default=3, help='Number of images generated per preset.')
+    parser.add_argument('--output', help='Optional path of a JSON file to write the reports to.')
+    args = parser.parse_args()
+
+    presets = {
+        name: {'num_inference_steps': preset['NUM_INFERENCE_STEPS'], 'scheduler': preset['SCHEDULER']}
+        for name, preset in UIConfig.get_config(args.config)['IMAGE_GENERATION']['PRESETS'].items()
+    }
+
+    with tempfile.TemporaryDirectory() as tiny_model_path:
+        model_name = args.model or build_tiny_image_gen_model(tiny_model_path)
+        reports = benchmark_presets(model_name, presets, args.execution_mode, args.num_images)
+
+    print(f"{'preset':<10} {'steps':>6} {'scheduler':<16} {'seconds/image':>14}")
+    for report in reports:
+        print(f"{report['preset']:<10} {report['num_inference_steps']:>6} {report['scheduler']:<16} "
+              f"{report['median_seconds_per_image']:>14.3f}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(reports, file, indent=4)
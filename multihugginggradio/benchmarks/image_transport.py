@@ -0,0 +1,150 @@
+"""
+Compare the transports of images between processes: pickling the pixels through a pipe, as the model
+workers would otherwise do, and passing handles of shared memory segments (see SharedImagePool).
+
+For each image size, the parent sends images to a new worker process and the worker sends them back:
+- to worker: the worker gets the image of a request, like a classification input. With shared memory it
+  reads the pixels in place.
+- from worker: the worker sends an image to the parent, like a generated image. With shared memory the
+  parent copies the pixels once out of the segment of the worker, which reuses the segment afterwards.
+
+The worker reads one pixel per image on arrival, so both transports deliver an array the receiver can use.
+
+Example usage:
+```
+python -m benchmarks.image_transport
+python -m benchmarks.image_transport --sizes 512 1024 --repeats 200
+```
+"""
+import argparse
+import json
+import multiprocessing
+import statistics
+import time
+
+import numpy as np
+
+from multihugginggradio.utils.transport.shared_images import SharedImagePool
+
+
+def run_worker(connection, shared: bool):
+    """
+    Receive images from the parent and send images back, until the parent sends None.
+    """
+    pool = SharedImagePool() if shared else None
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+
+        direction, value = message
+        if direction == 'to_worker':
+            image = pool.open(value) if shared else value
+            connection.send(int(image[0, 0, 0]))
+        elif direction == 'from_worker':
+            shape = value
+            image = np.full(shape, 7, dtype=np.uint8)
+            connection.send(pool.put(image) if shared else image)
+        else:
+            pool.release(value)
+
+    if pool is not None:
+        pool.close()
+
+
+def time_transport(size: int, repeats: int, shared: bool) -> dict:
+    """
+    Time the transfers of square RGB images of a size in both directions with one of the transports.
+
+    Returns:
+        dict: The median milliseconds per transfer in each direction.
+    """
+    context = multiprocessing.get_context('spawn')
+    connection, child_connection = context.Pipe()
+    process = context.Process(target=run_worker, args=(child_connection, shared))
+    process.start()
+    child_connection.close()
+
+    pool = SharedImagePool() if shared else None
+    image = np.random.default_rng(0).integers(0, 256, (size, size, 3), dtype=np.uint8)
+    to_worker, from_worker = [], []
+    try:
+        # The first transfers map the segments, they are not timed
+        for index in range(repeats + 1):
+            start_time = time.perf_counter()
+            if shared:
+                handle = pool.put(image)
+                connection.send(('to_worker', handle))
+                connection.recv()
+                pool.release(handle)
+            else:
+                connection.send(('to_worker', image))
+                connection.recv()
+            to_worker_seconds = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            connection.send(('from_worker', image.shape))
+            received = connection.recv()
+            if shared:
+                handle, received = received, pool.get(received)
+                connection.send(('release', handle))
+            from_worker_seconds = time.perf_counter() - start_time
+
+            if index > 0:
+                to_worker.append(to_worker_seconds)
+                from_worker.append(from_worker_seconds)
+    finally:
+        connection.send(None)
+        process.join()
+        if pool is not None:
+            pool.close()
+
+    return {
+        'to_worker_ms': statistics.median(to_worker) * 1000,
+        'from_worker_ms': statistics.median(from_worker) * 1000,
+    }
+
+
+def benchmark_transports(sizes: list, repeats: int) -> list:
+    """
+    Compare the pickle and shared memory transports for each image size.
+
+    Returns:
+        list: A report per size with the median milliseconds per transfer of each transport and direction,
+              and the speedup of the shared memory transport.
+    """
+    reports = []
+    for size in sizes:
+        pickled = time_transport(size, repeats, shared=False)
+        shared = time_transport(size, repeats, shared=True)
+        reports.append({
+            'size': size,
+            'megabytes': size * size * 3 / 1e6,
+            'pickle': pickled,
+            'shared_memory': shared,
+            'to_worker_speedup': pickled['to_worker_ms'] / shared['to_worker_ms'],
+            'from_worker_speedup': pickled['from_worker_ms'] / shared['from_worker_ms'],
+        })
+
+    return reports
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the pickle and shared memory transports of images.')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[224, 512, 1024], help='Widths of the square RGB images.')
+    parser.add_argument('--repeats', type=int, default=100, help='Number of transfers timed per size and direction.')
+    parser.add_argument('--output', help='Optional path of a JSON file to write the reports to.')
+    args = parser.parse_args()
+
+    reports = benchmark_transports(args.sizes, args.repeats)
+
+    print(f"{'size':>5} {'MB':>6} {'direction':<12} {'pickle (ms)':>12} {'shared (ms)':>12} {'speedup':>8}")
+    for report in reports:
+        for direction in ('to_worker', 'from_worker'):
+            print(f"{report['size']:>5} {report['megabytes']:>6.2f} {direction:<12} "
+                  f"{report['pickle'][direction + '_ms']:>12.3f} {report['shared_memory'][direction + '_ms']:>12.3f} "
+                  f"{report[direction + '_speedup']:>7.1f}x")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(reports, file, indent=4)
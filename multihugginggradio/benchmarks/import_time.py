@@ -0,0 +1,93 @@
+"""
+Measure the time and memory taken to import the interface.
+
+Each measurement runs in a new Python process, so nothing is cached between runs:
+- lazy: imports the interface only, as the application does at startup. The model wrappers of the
+  tasks are imported when their first model is loaded.
+- eager: also imports the model wrappers of the enabled tasks, as the interface did before the task
+  plugins, which is the startup cost the lazy import saves.
+
+Example usage:
+```
+python -m benchmarks.import_time
+python -m benchmarks.import_time --tasks Chat --repeats 5
+```
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+from multihugginggradio.models.task_registry import TASKS
+
+# Code run in each new process, printing the import time, peak memory and heavy libraries imported
+IMPORT_CODE = '''
+import json, resource, sys, time
+start_time = time.perf_counter()
+import multihugginggradio.interface.gradio_ui
+from multihugginggradio.models.task_registry import TASKS
+for task in {tasks!r}:
+    TASKS.get_model_class(task)
+print(json.dumps({{
+    'seconds': time.perf_counter() - start_time,
+    'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    'heavy_modules': [name for name in ('torch', 'transformers', 'diffusers') if name in sys.modules],
+}}))
+'''
+
+
+def measure_import(tasks: list) -> dict:
+    """
+    Import the interface and the model wrappers of the given tasks in a new process.
+
+    Returns:
+        dict: The import time in seconds, the peak resident memory in bytes and the heavy libraries imported.
+    """
+    output = subprocess.run(
+        [sys.executable, '-c', IMPORT_CODE.format(tasks=list(tasks))],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+    return json.loads(output.splitlines()[-1])
+
+
+def benchmark_import(tasks: list, repeats: int = 3) -> list:
+    """
+    Compare the lazy import of the interface with the eager import of the model wrappers of the tasks.
+
+    Returns:
+        list: A report per strategy with the median import time and peak memory and the heavy libraries imported.
+    """
+    reports = []
+    for strategy, imported_tasks in (('lazy', []), ('eager', tasks)):
+        runs = [measure_import(imported_tasks) for _ in range(repeats)]
+        reports.append({
+            'strategy': strategy,
+            'median_seconds': statistics.median(run['seconds'] for run in runs),
+            'median_max_rss_bytes': statistics.median(run['max_rss_bytes'] for run in runs),
+            'heavy_modules': runs[-1]['heavy_modules'],
+        })
+
+    return reports
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the time and memory taken to import the interface.')
+    parser.add_argument('--tasks', nargs='+', choices=list(TASKS), default=list(TASKS), help='Tasks imported eagerly.')
+    parser.add_argument('--repeats', type=int, default=3, help='Number of processes measured per strategy.')
+    parser.add_argument('--output', help='Optional path of a JSON file to write the reports to.')
+    args = parser.parse_args()
+
+    reports = benchmark_import(args.tasks, args.repeats)
+
+    print(f"{'strategy':<8} {'seconds':>8} {'max RSS (MB)':>13}  heavy modules")
+    for report in reports:
+        print(f"{report['strategy']:<8} {report['median_seconds']:>8.2f} {report['median_max_rss_bytes'] / 1e6:>13.1f}  "
+              f"{', '.join(report['heavy_modules']) or '-'}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(reports, file, indent=4)
@@ -0,0 +1,306 @@
+"""
+Offline micro-benchmark suite of the model wrappers on tiny randomly initialized models.
+
+The tiny models are built from the suite configuration (see micro_suite.yaml) in a temporary directory,
+so the suite runs without downloading checkpoints. Each task runs in its own new process, which builds
+and loads its model, runs warm-up requests and then times the measured requests:
+- latency: p50, p95 and mean milliseconds per request.
+- throughput: requests per second (and generated tokens per second for chat).
+- load: seconds to load the model.
+- memory: peak resident memory of the process in bytes.
+
+The reports are written to JSON with `--output`. With `--baseline`, each metric is compared against a
+stored report, and the suite exits with an error if any metric is worse than the baseline by more than
+the regression threshold.
+
+Example usage:
+```
+python -m benchmarks.micro_suite --output baseline.json
+python -m benchmarks.micro_suite --baseline baseline.json --threshold 0.25
+python -m benchmarks.micro_suite --tasks Chat "Image Classification"
+```
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+
+from benchmarks.tiny_models import (
+    build_tiny_chat_model,
+    build_tiny_image_class_model,
+    build_tiny_image_gen_model,
+)
+from multihugginggradio.utils.config.config import Config
+
+# Default configuration of the suite, next to this file
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'micro_suite.yaml')
+
+# Configuration section of each task
+TASK_SECTIONS = {
+    'Chat': 'CHAT',
+    'Image Classification': 'IMAGE_CLASSIFICATION',
+    'Image Generation': 'IMAGE_GENERATION',
+}
+
+# Whether a higher value of each metric is better, the other metrics are better when lower
+HIGHER_IS_BETTER = {
+    'latency_ms_p50': False,
+    'latency_ms_p95': False,
+    'latency_ms_mean': False,
+    'requests_per_second': True,
+    'tokens_per_second': True,
+    'load_seconds': False,
+    'peak_rss_bytes': False,
+}
+
+
+def run_chat(model_path: str, settings: dict, warmup_requests: int) -> dict:
+    """
+    Build a tiny chat model and time chat requests, each in a new conversation.
+    """
+    from multihugginggradio.models.chat_llm import ChatLLM
+
+    build_tiny_chat_model(model_path, num_layers=settings['NUM_LAYERS'], hidden_size=settings['HIDDEN_SIZE'])
+
+    start_time = time.perf_counter()
+    model = ChatLLM(model_path, execution_mode=settings['EXECUTION_MODE'])
+    load_seconds = time.perf_counter() - start_time
+
+    def request(index: int) -> int:
+        stats = {}
+        for _ in model.infer_stream('Hello! How are you?', max_tokens=settings['MAX_TOKENS'], stats=stats,
+                                    session_id=f'benchmark_{index}'):
+            pass
+        return stats['num_tokens']
+
+    for index in range(warmup_requests):
+        request(-1 - index)
+
+    latencies, num_tokens = time_requests(request, settings['NUM_REQUESTS'])
+    model.release()
+
+    report = summarize(latencies, load_seconds)
+    report['tokens_per_second'] = sum(num_tokens) / sum(latencies)
+
+    return report
+
+
+def run_image_classification(model_path: str, settings: dict, warmup_requests: int) -> dict:
+    """
+    Build a tiny image classification model and time classifications of random images.
+    """
+    from multihugginggradio.models.image_class_model import ImageClassModel
+
+    build_tiny_image_class_model(
+        model_path, num_labels=settings['NUM_LABELS'], num_layers=settings['NUM_LAYERS'],
+        hidden_size=settings['HIDDEN_SIZE'],
+    )
+
+    start_time = time.perf_counter()
+    model = ImageClassModel(model_path, execution_mode=settings['EXECUTION_MODE'])
+    load_seconds = time.perf_counter() - start_time
+
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, (224, 224, 3), dtype=np.uint8) for _ in range(settings['NUM_REQUESTS'])]
+
+    for _ in range(warmup_requests):
+        model.infer(images[0])
+
+    latencies, _ = time_requests(lambda index: model.infer(images[index]), settings['NUM_REQUESTS'])
+    model.release()
+
+    return summarize(latencies, load_seconds)
+
+
+def run_image_generation(model_path: str, settings: dict, warmup_requests: int) -> dict:
+    """
+    Build a tiny diffusion pipeline and time image generations with different seeds.
+    """
+    from multihugginggradio.models.image_gen_model import ImageGenModel
+
+    build_tiny_image_gen_model(model_path, sample_size=settings['SAMPLE_SIZE'])
+
+    start_time = time.perf_counter()
+    model = ImageGenModel(model_path, execution_mode=settings['EXECUTION_MODE'])
+    load_seconds = time.perf_counter() - start_time
+
+    def request(index: int):
+        return model.infer('A lighthouse on a cliff at sunset', seed=index,
+                           num_inference_steps=settings['NUM_INFERENCE_STEPS'], scheduler=settings['SCHEDULER'])
+
+    for index in range(warmup_requests):
+        request(-1 - index)
+
+    latencies, _ = time_requests(request, settings['NUM_REQUESTS'])
+    model.release()
+
+    return summarize(latencies, load_seconds)
+
+
+# Benchmark function of each task
+TASK_BENCHMARKS = {
+    'Chat': run_chat,
+    'Image Classification': run_image_classification,
+    'Image Generation': run_image_generation,
+}
+
+
+def time_requests(request, num_requests: int) -> tuple:
+    """
+    Run requests one after the other and time each of them.
+
+    Returns:
+        tuple: The seconds taken by each request and the value it returned.
+    """
+    latencies, outputs = [], []
+    for index in range(num_requests):
+        start_time = time.perf_counter()
+        outputs.append(request(index))
+        latencies.append(time.perf_counter() - start_time)
+
+    return latencies, outputs
+
+
+def summarize(latencies: list, load_seconds: float) -> dict:
+    """
+    Compute the latency percentiles and the throughput of timed requests.
+    """
+    return {
+        'latency_ms_p50': float(np.percentile(latencies, 50)) * 1000,
+        'latency_ms_p95': float(np.percentile(latencies, 95)) * 1000,
+        'latency_ms_mean': statistics.mean(latencies) * 1000,
+        'requests_per_second': len(latencies) / sum(latencies),
+        'load_seconds': load_seconds,
+    }
+
+
+def run_task(task: str, settings: dict, warmup_requests: int) -> dict:
+    """
+    Benchmark a task in the current process, with its tiny model built in a temporary directory.
+
+    Returns:
+        dict: The metrics of the task, including the peak resident memory of the process.
+    """
+    with tempfile.TemporaryDirectory() as model_path:
+        report = TASK_BENCHMARKS[task](model_path, settings, warmup_requests)
+
+    # The peak resident memory is reported in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    report['peak_rss_bytes'] = max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+    return report
+
+
+def run_suite(config: dict, tasks: list) -> dict:
+    """
+    Benchmark each task in a new process, so the peak memory of a task does not include the other tasks.
+
+    Returns:
+        dict: The environment of the run and the metrics of each task.
+    """
+    results = {}
+    for task in tasks:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            results[task] = executor.submit(run_task, task, config[TASK_SECTIONS[task]], config['WARMUP_REQUESTS']).result()
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'platform': platform.platform(),
+            'num_threads': torch.get_num_threads(),
+        },
+        'results': results,
+    }
+
+
+def compare_reports(report: dict, baseline: dict, threshold: float, checked_metrics: list = None) -> list:
+    """
+    Compare the metrics of a report against a baseline report.
+
+    Parameters:
+        report (dict): The report of the current run.
+        baseline (dict): The stored report to compare against.
+        threshold (float): Relative change in the worse direction above which a metric is a regression.
+        checked_metrics (list): The metrics that can be regressions, the other ones are only compared.
+                                Defaults to None, which checks every metric.
+
+    Returns:
+        list: A comparison per task and metric present in both reports, with the baseline and current
+              values, the relative change (positive when worse) and whether it is a regression.
+    """
+    comparisons = []
+    for task, metrics in report['results'].items():
+        baseline_metrics = baseline['results'].get(task, {})
+        for metric, value in metrics.items():
+            baseline_value = baseline_metrics.get(metric)
+            if not baseline_value:
+                continue
+
+            change = (value - baseline_value) / baseline_value
+            worse_change = -change if HIGHER_IS_BETTER.get(metric, False) else change
+            comparisons.append({
+                'task': task,
+                'metric': metric,
+                'baseline': baseline_value,
+                'current': value,
+                'change': worse_change,
+                'regression': worse_change > threshold and (checked_metrics is None or metric in checked_metrics),
+            })
+
+    return comparisons
+
+
+def format_comparisons(comparisons: list) -> str:
+    """
+    Format the comparisons as a text table.
+    """
+    lines = [f"{'task':<22} {'metric':<20} {'baseline':>14} {'current':>14} {'worse by':>9}"]
+    for comparison in comparisons:
+        lines.append(
+            f"{comparison['task']:<22} {comparison['metric']:<20} {comparison['baseline']:>14.4g} "
+            f"{comparison['current']:>14.4g} {comparison['change']:>9.1%}{'  REGRESSION' if comparison['regression'] else ''}"
+        )
+
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the model wrappers on tiny randomly initialized models.')
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help='Configuration of the tiny models and the requests.')
+    parser.add_argument('--tasks', nargs='+', choices=list(TASK_BENCHMARKS), default=list(TASK_BENCHMARKS))
+    parser.add_argument('--output', help='Optional path of a JSON file to write the report to.')
+    parser.add_argument('--baseline', help='Optional path of a stored JSON report to compare against.')
+    parser.add_argument('--threshold', type=float, help='Regression threshold, overriding the configuration.')
+    args = parser.parse_args()
+
+    config = Config.get_config(args.config)
+    report = run_suite(config, args.tasks)
+    print(json.dumps(report, indent=4))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=4)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+        threshold = args.threshold if args.threshold is not None else config['REGRESSION_THRESHOLD']
+        comparisons = compare_reports(report, baseline, threshold, config['REGRESSION_METRICS'])
+        print(format_comparisons(comparisons))
+
+        regressions = [comparison for comparison in comparisons if comparison['regression']]
+        if regressions:
+            print(f'{len(regressions)} metrics regressed by more than {threshold:.0%}')
+            sys.exit(1)
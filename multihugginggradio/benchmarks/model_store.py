@@ -0,0 +1,148 @@
+"""
+Startup benchmark of the models of the interface configuration, loaded from their checkpoints and from a
+ModelStore of converted models.
+
+Each configured model of the enabled tasks is loaded three times, each time in a new process:
+- checkpoint: loaded from its checkpoint with `from_pretrained`, as without a store.
+- cold: converted into the store (any previous conversion is deleted first) and loaded from it.
+- warm: loaded from the weights converted by the cold load.
+
+For each load, the benchmark reports the seconds to load the model, the seconds of its warm-up request (which
+also reads the pages of the mapped weights that were not read yet), and the peak resident memory of the process.
+The models are loaded with the execution mode of the configuration. The checkpoints of the Hub are downloaded
+before the first load, so the download is not timed.
+
+Example usage:
+```
+python -m benchmarks.model_store
+python -m benchmarks.model_store --config my_config.yaml --store-dir model_store --tasks Chat
+```
+"""
+import argparse
+import inspect
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from multihugginggradio.models.model_store import ModelStore
+from multihugginggradio.models.task_registry import TASKS
+from multihugginggradio.utils.config.config import UIConfig
+
+# Loads measured for each model, in order
+LOADS = ('checkpoint', 'cold', 'warm')
+
+
+def run_load(task: str, model_name: str, execution_mode: str, store: ModelStore) -> dict:
+    """
+    Load a model in the current process, then run its warm-up request.
+
+    Returns:
+        dict: The seconds to load the model, the seconds of the warm-up request and the peak resident memory
+              of the process.
+    """
+    model_class = TASKS.get_model_class(task)
+
+    start_time = time.perf_counter()
+    model = model_class(model_name, execution_mode=execution_mode, store=store)
+    load_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    model.warmup()
+    warmup_seconds = time.perf_counter() - start_time
+    model.release()
+
+    # The peak resident memory is reported in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return {
+        'load_seconds': load_seconds,
+        'warmup_seconds': warmup_seconds,
+        'peak_rss_bytes': max_rss if sys.platform == 'darwin' else max_rss * 1024,
+    }
+
+
+def benchmark_model(task: str, model_name: str, execution_mode: str, store: ModelStore) -> dict:
+    """
+    Measure the checkpoint, cold and warm loads of a model, each in a new process.
+
+    Returns:
+        dict: The metrics of each load, and the speedup of the warm load over the checkpoint load.
+    """
+    # Download the checkpoint and delete any previous conversion, so the cold load converts the model
+    run_in_process(run_load, task, model_name, execution_mode, None)
+    shutil.rmtree(store.path(model_name, execution_mode), ignore_errors=True)
+
+    report = {'task': task, 'model_name': model_name, 'execution_mode': execution_mode}
+    for load in LOADS:
+        report[load] = run_in_process(run_load, task, model_name, execution_mode, store if load != 'checkpoint' else None)
+    report['warm_speedup'] = report['checkpoint']['load_seconds'] / report['warm']['load_seconds']
+
+    return report
+
+
+def run_in_process(function, *args):
+    """
+    Run a function in a new process, so its peak memory does not include the previous loads.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(function, *args).result()
+
+
+def benchmark_models(config: dict, store: ModelStore, tasks: list = None) -> list:
+    """
+    Benchmark the loads of every available model of the enabled tasks of an interface configuration.
+
+    Returns:
+        list: A report per model.
+    """
+    reports = []
+    for task in tasks or config['ENABLED_TASKS']:
+        for model_name in config['AVAILABLE_MODELS'][task]:
+            # The models without an execution mode use the default of their wrapper
+            default_mode = inspect.signature(TASKS.get_model_class(task)).parameters['execution_mode'].default
+            execution_mode = config['EXECUTION_MODES'].get(model_name, default_mode)
+            reports.append(benchmark_model(task, model_name, execution_mode, store))
+
+    return reports
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the loads of the models from their checkpoints and a store.')
+    parser.add_argument('--config', default='config.yaml', help='Interface configuration listing the models.')
+    parser.add_argument('--store-dir', help='Directory of the store, defaults to a temporary directory deleted afterwards.')
+    parser.add_argument('--tasks', nargs='+', help='Tasks whose models are benchmarked, defaults to the enabled tasks.')
+    parser.add_argument('--output', help='Optional path of a JSON file to write the reports to.')
+    args = parser.parse_args()
+
+    config = UIConfig.get_config(args.config)
+    store_config = config['MODEL_STORE']
+    store_dir = args.store_dir or tempfile.mkdtemp(prefix='model_store-')
+    store = ModelStore(
+        store_dir,
+        load_threads=store_config['LOAD_THREADS'],
+        max_shard_size=store_config['MAX_SHARD_SIZE'],
+        verify_checksums=store_config['VERIFY_CHECKSUMS'],
+    )
+    try:
+        reports = benchmark_models(config, store, args.tasks)
+    finally:
+        if not args.store_dir:
+            shutil.rmtree(store_dir, ignore_errors=True)
+
+    print(f"{'model':<40} {'mode':<5} {'load':<11} {'load (s)':>9} {'warmup (s)':>11} {'peak RSS (MB)':>14}")
+    for report in reports:
+        for load in LOADS:
+            print(f"{os.path.basename(report['model_name'].rstrip('/'))[:40]:<40} {report['execution_mode']:<5} {load:<11} "
+                  f"{report[load]['load_seconds']:>9.2f} {report[load]['warmup_seconds']:>11.2f} "
+                  f"{report[load]['peak_rss_bytes'] / 1e6:>14.1f}")
+        print(f"{'':<40} {'':<5} warm speedup {report['warm_speedup']:.1f}x")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(reports, file, indent=4)
@@ -0,0 +1,116 @@
+"""
+Compare the greedy generations of the chat models with and without their draft model (speculative decoding).
+
+For each chat model with a draft model in the interface configuration (or the model and draft model given on the
+command line), the benchmark loads the model without and with its draft model, then answers the same prompts with
+both, each prompt in a new conversation. It reports the tokens per second of each run, and for the runs with the
+draft model the share of the proposed tokens accepted and the tokens generated per forward pass of the model.
+The responses of both runs are compared, since the draft model must not change them.
+
+The draft model is only used by greedy generations, so the model must not sample by default (like the dolly
+pipeline does) for its generations in the interface to benefit from it.
+
+Example usage:
+```
+python -m benchmarks.speculative_decoding --model databricks/dolly-v2-7b --draft databricks/dolly-v2-3b --max-tokens 64
+python -m benchmarks.speculative_decoding --config my_config.yaml
+```
+"""
+import argparse
+import json
+import os
+import time
+
+from multihugginggradio.models.chat_llm import ChatLLM
+from multihugginggradio.utils.config.config import UIConfig
+
+# Prompts answered by each model, each one in a new conversation
+PROMPTS = [
+    'Explain what a hash table is.',
+    'Write a short poem about the sea.',
+    'What are the benefits of regular exercise?',
+    'Describe the water cycle.',
+]
+
+
+def run_generations(model: ChatLLM, prompts: list, max_tokens: int) -> dict:
+    """
+    Answer each prompt in a new conversation.
+
+    Returns:
+        dict: The responses, the number of generated tokens and the tokens per second over all the prompts.
+    """
+    responses, num_tokens, total_time = [], 0, 0.0
+    for index, prompt in enumerate(prompts):
+        stats = {}
+        start_time = time.perf_counter()
+        *_, response = model.infer_stream(prompt, max_tokens=max_tokens, stats=stats, session_id=str(index))
+        total_time += time.perf_counter() - start_time
+        responses.append(response)
+        num_tokens += stats['num_tokens']
+
+    return {'responses': responses, 'num_tokens': num_tokens, 'tokens_per_second': num_tokens / total_time}
+
+
+def benchmark_model(model_name: str, draft_model_name: str, execution_mode: str, prompts: list, max_tokens: int) -> dict:
+    """
+    Answer the prompts with a chat model without and with its draft model.
+
+    Returns:
+        dict: The tokens per second of both runs, the speedup of the draft model, the statistics of its
+              proposed tokens and whether the responses are the same.
+    """
+    model = ChatLLM(model_name, execution_mode=execution_mode)
+    model.warmup()
+    baseline = run_generations(model, prompts, max_tokens)
+    model.release()
+
+    model = ChatLLM(model_name, execution_mode=execution_mode, draft_model_name=draft_model_name)
+    model.warmup()
+    speculative = run_generations(model, prompts, max_tokens)
+    speculation_stats = model.speculation_stats()
+    model.release()
+
+    return {
+        'model_name': model_name,
+        'draft_model_name': draft_model_name,
+        'execution_mode': execution_mode,
+        'baseline_tokens_per_second': baseline['tokens_per_second'],
+        'speculative_tokens_per_second': speculative['tokens_per_second'],
+        'speedup': speculative['tokens_per_second'] / baseline['tokens_per_second'],
+        'acceptance_rate': speculation_stats['acceptance_rate'],
+        'tokens_per_pass': speculation_stats['tokens_per_pass'],
+        'same_responses': baseline['responses'] == speculative['responses'],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the chat models with and without their draft model.')
+    parser.add_argument('--config', default='config.yaml', help='Interface configuration listing the draft models.')
+    parser.add_argument('--model', help='Chat model benchmarked instead of the models of the configuration.')
+    parser.add_argument('--draft', help='Draft model of --model.')
+    parser.add_argument('--execution-mode', help='Execution mode of the models, defaults to the one of the configuration.')
+    parser.add_argument('--max-tokens', type=int, default=100, help='Maximum number of tokens of each response.')
+    parser.add_argument('--output', help='Optional path of a JSON file to write the reports to.')
+    args = parser.parse_args()
+
+    config = UIConfig.get_config(args.config)
+    draft_models = {args.model: args.draft} if args.model else config['CHAT']['DRAFT_MODELS'] or {}
+
+    reports = []
+    for model_name, draft_model_name in draft_models.items():
+        execution_mode = args.execution_mode or config['EXECUTION_MODES'].get(model_name, 'bf16')
+        reports.append(benchmark_model(model_name, draft_model_name, execution_mode, PROMPTS, args.max_tokens))
+
+    print(f"{'model':<30} {'draft':<30} {'baseline (tok/s)':>17} {'draft (tok/s)':>14} {'speedup':>8} "
+          f"{'accepted':>9} {'tok/pass':>9} {'same':>5}")
+    for report in reports:
+        print(f"{os.path.basename(report['model_name'].rstrip('/'))[:30]:<30} "
+              f"{os.path.basename(report['draft_model_name'].rstrip('/'))[:30]:<30} "
+              f"{report['baseline_tokens_per_second']:>17.1f} {report['speculative_tokens_per_second']:>14.1f} "
+              f"{report['speedup']:>7.2f}x {report['acceptance_rate']:>9.0%} {report['tokens_per_pass']:>9.2f} "
+              f"{str(report['same_responses']):>5}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(reports, file, indent=4)
@@ -0,0 +1,329 @@
+"""
+Tiny randomly initialized models saved to disk, used by the tests and the benchmarks to run the model
+wrappers without downloading checkpoints.
+"""
+import os
+import json
+import torch
+from diffusers import (
+    AutoencoderKL,
+    PNDMScheduler,
+    PriorTransformer,
+    StableDiffusionPipeline,
+    UNet2DConditionModel,
+    UNet2DModel,
+    UnCLIPPipeline,
+    UnCLIPScheduler,
+)
+from diffusers.pipelines.unclip.text_proj import UnCLIPTextProjModel
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+from transformers import (
+    CLIPTextConfig,
+    CLIPTextModel,
+    CLIPTextModelWithProjection,
+    CLIPTokenizer,
+    GenerationConfig,
+    GPTNeoXConfig,
+    GPTNeoXForCausalLM,
+    PreTrainedTokenizerFast,
+    ViTConfig,
+    ViTForImageClassification,
+    ViTImageProcessor,
+)
+from transformers.models.clip.tokenization_clip import bytes_to_unicode
+
+
+def build_tiny_tokenizer() -> PreTrainedTokenizerFast:
+    """
+    Train a tiny byte-level BPE tokenizer, so chat tests do not need to download a checkpoint.
+    """
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+
+    trainer = trainers.BpeTrainer(
+        vocab_size=300,
+        special_tokens=['<|endoftext|>'],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+    )
+    tokenizer.train_from_iterator(['Hello! The quick brown fox jumps over the lazy dog.'] * 10, trainer)
+
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        bos_token='<|endoftext|>',
+        eos_token='<|endoftext|>',
+        pad_token='<|endoftext|>',
+    )
+
+
+def build_tiny_chat_model(path: str, num_layers: int = 2, hidden_size: int = 32, do_sample: bool = False):
+    """
+    Save a tiny randomly initialized GPT-NeoX causal language model and its tokenizer to `path`.
+
+    With `do_sample`, the saved generation config samples the generated tokens instead of decoding greedily.
+    """
+    torch.manual_seed(0)
+
+    tokenizer = build_tiny_tokenizer()
+    config = GPTNeoXConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        num_hidden_layers=num_layers,
+        num_attention_heads=4,
+        intermediate_size=hidden_size * 2,
+        max_position_embeddings=512,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+    )
+
+    model = GPTNeoXForCausalLM(config)
+    if do_sample:
+        # Not derived from the model config, which `generate` would replace with a greedy config
+        model.generation_config = GenerationConfig(
+            bos_token_id=config.bos_token_id,
+            eos_token_id=config.eos_token_id,
+            do_sample=True,
+            top_k=50,
+            top_p=0.95,
+        )
+
+    model.save_pretrained(path)
+    tokenizer.save_pretrained(path)
+
+    return path
+
+
+# Code of the custom pipeline of the tiny instruction model, which reads its instructions from other keys than the
+# stock text generation pipeline, like the instruction pipelines defined by chat models on the Hub
+INSTRUCTION_PIPELINE_CODE = '''from transformers import Pipeline
+
+INSTRUCTION_TEMPLATE = "### Instruction:\\n{instruction}\\n\\n### Response:\\n"
+
+
+class InstructionTextGenerationPipeline(Pipeline):
+    def __init__(self, *args, do_sample=True, max_new_tokens=16, top_p=0.92, top_k=0, **kwargs):
+        super().__init__(*args, do_sample=do_sample, max_new_tokens=max_new_tokens, top_p=top_p, top_k=top_k, **kwargs)
+
+    def _sanitize_parameters(self, return_full_text=None, **generate_kwargs):
+        postprocess_params = {} if return_full_text is None else {"return_full_text": return_full_text}
+        return {}, generate_kwargs, postprocess_params
+
+    def preprocess(self, instruction_text, **kwargs):
+        inputs = self.tokenizer(INSTRUCTION_TEMPLATE.format(instruction=instruction_text), return_tensors="pt")
+        inputs["instruction_text"] = instruction_text
+        return inputs
+
+    def _forward(self, model_inputs, **generate_kwargs):
+        input_ids = model_inputs["input_ids"]
+        generated_sequence = self.model.generate(
+            input_ids=input_ids.to(self.model.device),
+            attention_mask=model_inputs["attention_mask"].to(self.model.device),
+            pad_token_id=self.tokenizer.pad_token_id,
+            **generate_kwargs,
+        )
+        return {"generated_sequence": generated_sequence[None], "input_ids": input_ids,
+                "instruction_text": model_inputs["instruction_text"]}
+
+    def postprocess(self, model_outputs, return_full_text=False):
+        input_length = model_outputs["input_ids"].shape[1]
+        text = self.tokenizer.decode(model_outputs["generated_sequence"][0][0][input_length:], skip_special_tokens=True)
+        if return_full_text:
+            text = model_outputs["instruction_text"] + "\\n" + text
+        return [{"generated_text": text}]
+'''
+
+
+def build_tiny_instruction_chat_model(path: str):
+    """
+    Save a tiny chat model with a custom text generation pipeline to `path`.
+
+    The pipeline, defined by the code saved with the model, wraps the prompts in an instruction template, samples
+    its responses by default and passes the instructions between its steps under the 'instruction_text' key.
+    """
+    build_tiny_chat_model(path)
+
+    with open(os.path.join(path, 'instruct_pipeline.py'), 'w') as file:
+        file.write(INSTRUCTION_PIPELINE_CODE)
+
+    # The pipeline of the task is declared in the config, like on the Hub
+    with open(os.path.join(path, 'config.json')) as file:
+        config = json.load(file)
+    config['custom_pipelines'] = {
+        'text-generation': {'impl': 'instruct_pipeline.InstructionTextGenerationPipeline', 'pt': 'AutoModelForCausalLM'},
+    }
+    with open(os.path.join(path, 'config.json'), 'w') as file:
+        json.dump(config, file, indent=2)
+
+    return path
+
+
+def build_tiny_image_class_model(path: str, num_labels: int = 5, num_layers: int = 2, hidden_size: int = 32):
+    """
+    Save a tiny randomly initialized ViT image classification model and its image processor to `path`.
+    """
+    torch.manual_seed(0)
+
+    config = ViTConfig(
+        image_size=224,
+        patch_size=32,
+        hidden_size=hidden_size,
+        num_hidden_layers=num_layers,
+        num_attention_heads=4,
+        intermediate_size=hidden_size * 2,
+        id2label={index: f'label_{index}' for index in range(num_labels)},
+        label2id={f'label_{index}': index for index in range(num_labels)},
+    )
+
+    ViTForImageClassification(config).save_pretrained(path)
+    ViTImageProcessor(size={'height': 224, 'width': 224}).save_pretrained(path)
+
+    return path
+
+
+def build_tiny_clip_tokenizer(path: str) -> CLIPTokenizer:
+    """
+    Build a character level CLIP tokenizer, without any merges, whose files are written in `path`.
+    """
+    characters = list(bytes_to_unicode().values())
+    vocab = {character: index for index, character in enumerate(characters)}
+    vocab.update({f'{character}</w>': len(characters) + index for index, character in enumerate(characters)})
+    vocab['<|startoftext|>'] = len(vocab)
+    vocab['<|endoftext|>'] = len(vocab)
+
+    tokenizer_path = os.path.join(path, 'tokenizer_files')
+    os.makedirs(tokenizer_path, exist_ok=True)
+    with open(os.path.join(tokenizer_path, 'vocab.json'), 'w') as file:
+        json.dump(vocab, file)
+    with open(os.path.join(tokenizer_path, 'merges.txt'), 'w') as file:
+        file.write('#version: 0.2\n')
+
+    return CLIPTokenizer(
+        os.path.join(tokenizer_path, 'vocab.json'),
+        os.path.join(tokenizer_path, 'merges.txt'),
+        model_max_length=32,
+    )
+
+
+def build_tiny_image_gen_model(path: str, sample_size: int = 16):
+    """
+    Save a tiny randomly initialized Stable Diffusion pipeline (CLIP text encoder, UNet and VAE) to `path`.
+
+    The tokenizer only knows single characters, and the generated images are `sample_size * 2` pixels wide.
+    """
+    torch.manual_seed(0)
+
+    tokenizer = build_tiny_clip_tokenizer(path)
+    vocab = tokenizer.get_vocab()
+
+    text_encoder = CLIPTextModel(CLIPTextConfig(
+        vocab_size=len(vocab),
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        max_position_embeddings=32,
+        bos_token_id=vocab['<|startoftext|>'],
+        eos_token_id=vocab['<|endoftext|>'],
+    ))
+    unet = UNet2DConditionModel(
+        sample_size=sample_size,
+        block_out_channels=(32, 64),
+        layers_per_block=1,
+        down_block_types=('DownBlock2D', 'CrossAttnDownBlock2D'),
+        up_block_types=('CrossAttnUpBlock2D', 'UpBlock2D'),
+        cross_attention_dim=32,
+        attention_head_dim=8,
+    )
+    vae = AutoencoderKL(
+        block_out_channels=(32, 64),
+        down_block_types=('DownEncoderBlock2D', 'DownEncoderBlock2D'),
+        up_block_types=('UpDecoderBlock2D', 'UpDecoderBlock2D'),
+        latent_channels=4,
+        sample_size=sample_size * 2,
+    )
+
+    StableDiffusionPipeline(
+        unet=unet,
+        vae=vae,
+        text_encoder=text_encoder,
+        tokenizer=tokenizer,
+        scheduler=PNDMScheduler(skip_prk_steps=True),
+        safety_checker=None,
+        feature_extractor=None,
+        requires_safety_checker=False,
+    ).save_pretrained(path)
+
+    return path
+
+
+def build_tiny_unclip_model(path: str):
+    """
+    Save a tiny randomly initialized unCLIP pipeline (prior, decoder and super resolution models) to `path`.
+
+    Unlike Stable Diffusion, the pipeline has no `scheduler` component, each of its models runs with its own
+    scheduler and number of steps. The generated images are 64 pixels wide.
+    """
+    torch.manual_seed(0)
+
+    tokenizer = build_tiny_clip_tokenizer(path)
+    vocab = tokenizer.get_vocab()
+    text_encoder = CLIPTextModelWithProjection(CLIPTextConfig(
+        vocab_size=len(vocab),
+        hidden_size=32,
+        projection_dim=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        max_position_embeddings=32,
+        bos_token_id=vocab['<|startoftext|>'],
+        eos_token_id=vocab['<|endoftext|>'],
+    ))
+    prior = PriorTransformer(
+        num_attention_heads=2, attention_head_dim=12, embedding_dim=32, num_layers=1, num_embeddings=32,
+    )
+    text_proj = UnCLIPTextProjModel(
+        clip_embeddings_dim=32,
+        time_embed_dim=128,
+        cross_attention_dim=64,
+        clip_extra_context_tokens=4,
+    )
+    decoder = UNet2DConditionModel(
+        sample_size=32,
+        in_channels=3,
+        out_channels=6,
+        down_block_types=('ResnetDownsampleBlock2D', 'SimpleCrossAttnDownBlock2D'),
+        up_block_types=('SimpleCrossAttnUpBlock2D', 'ResnetUpsampleBlock2D'),
+        mid_block_type='UNetMidBlock2DSimpleCrossAttn',
+        block_out_channels=(32, 64),
+        layers_per_block=1,
+        cross_attention_dim=64,
+        attention_head_dim=4,
+        resnet_time_scale_shift='scale_shift',
+        class_embed_type='identity',
+    )
+    super_res_first, super_res_last = [UNet2DModel(
+        sample_size=64,
+        layers_per_block=1,
+        down_block_types=('ResnetDownsampleBlock2D', 'ResnetDownsampleBlock2D'),
+        up_block_types=('ResnetUpsampleBlock2D', 'ResnetUpsampleBlock2D'),
+        block_out_channels=(32, 64),
+        in_channels=6,
+        out_channels=3,
+    ) for _ in range(2)]
+
+    UnCLIPPipeline(
+        prior=prior,
+        decoder=decoder,
+        text_encoder=text_encoder,
+        tokenizer=tokenizer,
+        text_proj=text_proj,
+        super_res_first=super_res_first,
+        super_res_last=super_res_last,
+        prior_scheduler=UnCLIPScheduler(
+            variance_type='fixed_small_log', prediction_type='sample', clip_sample_range=5.0,
+        ),
+        decoder_scheduler=UnCLIPScheduler(variance_type='learned_range', prediction_type='epsilon'),
+        super_res_scheduler=UnCLIPScheduler(variance_type='fixed_small_log', prediction_type='epsilon'),
+    ).save_pretrained(path)
+
+    return path
@@ -1,15 +1,29 @@
+import sys
 import time
-import torch
+import uuid
+import threading
 import gc
 import gradio as gr
+from fastapi.responses import PlainTextResponse
 
 from multihugginggradio.utils.config.config import UIConfig
-from multihugginggradio.models.chat_llm import ChatLLM
-from multihugginggradio.models.image_class_model import ImageClassModel
-from multihugginggradio.models.image_gen_model import ImageGenModel
+from multihugginggradio.interface.http_api import HttpAPI
+from multihugginggradio.models.model_registry import ModelRegistry
+from multihugginggradio.models.model_store import ModelStore
+from multihugginggradio.models.task_registry import TASKS
+from multihugginggradio.models.worker_pool import ModelWorkerPool
+from multihugginggradio.utils.cache.result_cache import ResultCache
+from multihugginggradio.utils.metrics.request_metrics import RequestMetrics, payload_size
+from multihugginggradio.utils.scheduling.request_scheduler import RequestScheduler
 
 
 class GradioApp(object):
+    # Seconds between the updates of the queue position shown to a waiting request
+    QUEUE_UPDATE_INTERVAL = 1.0
+
+    # Path of the endpoint serving the request metrics in the Prometheus text format
+    METRICS_PATH = '/metrics'
+
     def __init__(
         self,
         model_config: str = 'config.yaml',
@@ -23,124 +37,279 @@ class GradioApp(object):
 
         This class sets up a graphical interface using the Gradio library to interact with models
         for various tasks. It loads configuration settings from the specified
-        `model_config` file, including available models and reproducibility settings.
+        `model_config` file, including available models, reproducibility settings, the memory
+        budget of the model registry that keeps the loaded models, the models to preload and the
+        execution mode (precision) of each model. With a `MODEL_STORE` directory, each model is converted
+        once into the store and its converted weights are mapped on the next loads.
+
+        Only the tasks listed in `ENABLED_TASKS` are served. The model wrapper of each task, with its torch,
+        transformers or diffusers imports, is only imported when the first model of the task is loaded.
         """
         self.config = UIConfig.get_config(model_config)
+        self.tasks = TASKS.enabled(self.config['ENABLED_TASKS'])
         self.available_models = self.config['AVAILABLE_MODELS']
         self.seed = self.config['REPRODUCIBILITY']['SEED']
         self.verbose = self.config['VERBOSE']
+        self.preload = self.config['PRELOAD']
+
+        # Cache of the results of the deterministic tasks, shared by their models
+        cache_config = self.config['RESULT_CACHE']
+        self.result_cache = ResultCache(
+            max_items=cache_config['MAX_ITEMS'],
+            disk_dir=cache_config['DISK_DIR'],
+            max_disk_bytes=cache_config['MAX_DISK_BYTES'],
+        )
+
+        # Store of the converted models, shared by the models of every task
+        store_config = self.config['MODEL_STORE']
+        self.model_store = ModelStore(
+            store_config['DIR'],
+            load_threads=store_config['LOAD_THREADS'],
+            max_shard_size=store_config['MAX_SHARD_SIZE'],
+            verify_checksums=store_config['VERIFY_CHECKSUMS'],
+            verbose=self.verbose,
+        ) if store_config['DIR'] else None
+
+        # Keyword arguments used to load the models of each task
+        self.model_kwargs = {
+            'Chat': {
+                'store': self.model_store,
+                'kv_cache_max_bytes': self.config['CHAT']['KV_CACHE_MAX_BYTES'],
+                'kv_cache_total_bytes': self.config['CHAT']['KV_CACHE_TOTAL_BYTES'],
+                'session_ttl': self.config['CHAT']['SESSION_TTL'],
+                'max_sessions': self.config['CHAT']['MAX_SESSIONS'],
+                'context_max_tokens': self.config['CHAT']['CONTEXT_MAX_TOKENS'],
+                'max_batch_size': self.config['CHAT']['MAX_BATCH_SIZE'],
+            },
+            'Image Classification': {
+                'max_batch_size': self.config['IMAGE_CLASSIFICATION']['MAX_BATCH_SIZE'],
+                'max_wait_ms': self.config['IMAGE_CLASSIFICATION']['MAX_WAIT_MS'],
+                'cache': self.result_cache,
+                'store': self.model_store,
+            },
+            'Image Generation': {
+                'cache': self.result_cache,
+                'store': self.model_store,
+                'presets': {
+                    name: {'num_inference_steps': preset['NUM_INFERENCE_STEPS'], 'scheduler': preset['SCHEDULER']}
+                    for name, preset in self.config['IMAGE_GENERATION']['PRESETS'].items()
+                },
+                'default_preset': self.config['IMAGE_GENERATION']['DEFAULT_PRESET'],
+                'max_batch_size': self.config['IMAGE_GENERATION']['MAX_BATCH_SIZE'],
+                'max_wait_ms': self.config['IMAGE_GENERATION']['MAX_WAIT_MS'],
+            },
+        }
+
+        # Execution mode (fp32, bf16 or int8) of each model, the models not listed use the default of their task
+        self.execution_modes = self.config['EXECUTION_MODES']
+
+        # Draft model of each chat model using speculative decoding, the models not listed decode without one
+        self.draft_models = self.config['CHAT']['DRAFT_MODELS'] or {}
+
+        registry_config = self.config['MODEL_REGISTRY']
+        self.models = ModelRegistry(
+            memory_budget=registry_config['MEMORY_BUDGET'],
+            eviction_policy=registry_config['EVICTION_POLICY'],
+            pinned=registry_config['PINNED'],
+            verbose=self.verbose,
+            host_memory_budget=registry_config['HOST_MEMORY_BUDGET'],
+            idle_seconds=registry_config['IDLE_SECONDS'],
+            on_transition=self._record_transition,
+        )
 
-        self.models = {}
-        self.timers = []
+        # Worker processes running the models instead of the interface process, if enabled
+        self.workers = self.config['WORKERS']
+
+        # Latency and payload histograms of the requests, per task and model
+        self.metrics = RequestMetrics()
+
+        # Number of runs of each newly loaded model recorded with the torch profiler, and the directory of the traces
+        self.trace_requests = self.config['PROFILING']['TRACE_REQUESTS']
+        self.trace_dir = self.config['PROFILING']['TRACE_DIR']
+
+        # Scheduler of the requests of the interface, limiting how many run at once per task and model
+        scheduler_config = self.config['SCHEDULER']
+        self.scheduler = RequestScheduler(
+            max_running=scheduler_config['MAX_RUNNING'],
+            task_limits=scheduler_config['TASK_CONCURRENCY'],
+            model_limits=scheduler_config['MODEL_CONCURRENCY'],
+            priorities=scheduler_config['PRIORITIES'],
+        )
+
+        # JSON HTTP API served next to the interface, sharing its models, scheduler and metrics
+        api_config = self.config['HTTP_API']
+        self.api = HttpAPI(
+            self,
+            host=api_config['HOST'],
+            port=api_config['PORT'],
+            keep_alive=api_config['KEEP_ALIVE'],
+            max_batch_items=api_config['MAX_BATCH_ITEMS'],
+        ) if api_config['ENABLED'] else None
 
     def run(self):
         """
         Launch the Gradio interface.
 
-        This method creates a Gradio interface allowing users to select a task (Chat or Image Classification),
+        This method creates a Gradio interface allowing users to select one of the enabled tasks,
         choose a model for the task, and provide input (text prompt or image). It then generates responses
         and displays the answers along with the time taken for generation.
 
         The interface includes the following components:
-        - Radio buttons to select the task (Chat or Image Classification).
+        - Radio buttons to select the task, among the tasks listed in `ENABLED_TASKS`.
         - Textbox for entering a question (for Chat task).
         - Image upload component (for Image Classification task).
-        - Dropdown menus to select a model for each task.
+        - Dropdown menus to select a model for each task, and the preset of the image generation.
         - Textbox to display the generated answer.
         - Textbox to display the elapsed time for response generation.
         - Submit buttons to trigger model inference.
+        - Textbox and refresh button to display the readiness of the loaded models.
+        - Textbox and refresh button to display the latency percentiles of the requests.
+        - Number and button to record the next runs of the loaded models with the torch profiler.
+
+        The request metrics are also served in the Prometheus text format at `METRICS_PATH`, and the JSON HTTP
+        API (see `HttpAPI`) is served on its own port while the interface runs, if `HTTP_API` enables it.
 
+        The models listed in the `PRELOAD` configuration start loading in background threads before the
+        interface is launched. The components of the tasks that are not enabled are not created.
         """
+        # Load and warm up the configured models in the background
+        self.preload_models()
+
+        # Serve the JSON HTTP API for the programmatic clients
+        if self.api is not None:
+            self.api.start()
+
         # Create a Gradio interface using the Blocks context
         with gr.Blocks(title="MultiHuggingGradio") as self.demo:
 
-            # Radio buttons for selecting the task (Chat or Image Classification)
+            # Radio buttons for selecting one of the enabled tasks
             task = gr.Radio(
-                list(self.available_models.keys()),
+                list(self.tasks),
                 label="Select Task",
                 elem_id="select_task",
             )
 
-            # Create interface components for Chat task
+            # Textbox and button to display the readiness of the models
             with gr.Row():
-                with gr.Column():
-                    # Textbox for user input question (Chat task)
-                    self.question = gr.Textbox(label="Question", elem_id="chat_question", visible=False)
-                    # Textbox for user input prompt (Image Generation task)
-                    self.prompt = gr.Textbox(label="Prompt", elem_id="image_gen_prompt", visible=False)
-                    # Image upload component (Image Classification task)
-                    self.upload_image = gr.Image(visible=False, type="pil")
-
-                    # Dropdown menu for selecting a chat model
-                    self.select_chat_model = gr.Dropdown(
-                        self.available_models['Chat'],
-                        label="Models",
-                        value=self.available_models['Chat'][0],
-                        visible=False,
-                    )
+                self.model_status = gr.Textbox(label="Model Status", value=self.get_model_status)
+                self.refresh_status = gr.Button("Refresh Model Status", elem_id='refresh_status')
+            self.refresh_status.click(fn=self.get_model_status, outputs=self.model_status)
 
-                    # Dropdown menu for selecting an image classification model
-                    self.select_image_class_model = gr.Dropdown(
-                        self.available_models['Image Classification'],
-                        label="Models",
-                        value=self.available_models['Image Classification'][0],
-                        visible=False,
-                    )
+            # Textbox and button to display the latency percentiles of the requests
+            with gr.Row():
+                self.request_stats = gr.Textbox(label="Request Statistics", value=self.get_request_stats)
+                self.refresh_stats = gr.Button("Refresh Request Statistics", elem_id='refresh_stats')
+            self.refresh_stats.click(fn=self.get_request_stats, outputs=self.request_stats)
 
-                    # Dropdown menu for selecting an image generation model
-                    self.select_image_gen_model = gr.Dropdown(
-                        self.available_models['Image Generation'],
-                        label="Models",
-                        value=self.available_models['Image Generation'][0],
-                        visible=False,
-                    )
+            # Number and button to record the next runs of the loaded models with the torch profiler
+            with gr.Row():
+                self.trace_count = gr.Number(label="Traced Runs per Model", value=1, precision=0)
+                self.capture_trace = gr.Button("Capture Profiler Traces", elem_id='capture_trace')
+            self.capture_trace.click(fn=self.capture_traces_text, inputs=self.trace_count, outputs=self.request_stats)
 
-                with gr.Column():
-                    # Textbox to display the generated answer
-                    self.answer = gr.Textbox(label="Answer", visible=False)
+            # Identifier of each browser session, used for its chat conversation and the fair scheduling of its requests
+            self.session = gr.State(value=None)
 
-                    # Textbox to display the image classification
-                    self.classification = gr.Textbox(label="Classification", visible=False)
+            # Interface objects of each enabled task, the components of the other tasks are not created
+            self.interface_objects = {}
 
-                    # Image to display the generated image
-                    self.output_image = gr.Image(label="Output Image", visible=False)
+            # Create interface components for the enabled tasks
+            with gr.Row():
+                with gr.Column():
+                    if 'Chat' in self.tasks:
+                        # Textbox for user input question (Chat task)
+                        self.question = gr.Textbox(label="Question", elem_id="chat_question", visible=False)
+
+                        # Dropdown menu for selecting a chat model
+                        self.select_chat_model = gr.Dropdown(
+                            self.available_models['Chat'],
+                            label="Models",
+                            value=self.available_models['Chat'][0],
+                            visible=False,
+                        )
+
+                    if 'Image Classification' in self.tasks:
+                        # Image upload component (Image Classification task)
+                        self.upload_image = gr.Image(visible=False, type="pil")
+
+                        # Dropdown menu for selecting an image classification model
+                        self.select_image_class_model = gr.Dropdown(
+                            self.available_models['Image Classification'],
+                            label="Models",
+                            value=self.available_models['Image Classification'][0],
+                            visible=False,
+                        )
+
+                    if 'Image Generation' in self.tasks:
+                        # Textbox for user input prompt (Image Generation task)
+                        self.prompt = gr.Textbox(label="Prompt", elem_id="image_gen_prompt", visible=False)
+
+                        # Dropdown menu for selecting an image generation model
+                        self.select_image_gen_model = gr.Dropdown(
+                            self.available_models['Image Generation'],
+                            label="Models",
+                            value=self.available_models['Image Generation'][0],
+                            visible=False,
+                        )
+
+                        # Dropdown menu for selecting the speed/quality preset of the image generation
+                        self.select_image_gen_preset = gr.Dropdown(
+                            list(self.config['IMAGE_GENERATION']['PRESETS']),
+                            label="Preset",
+                            value=self.config['IMAGE_GENERATION']['DEFAULT_PRESET'],
+                            visible=False,
+                        )
 
-                    # Textbox to display the elapsed time for response generation
-                    self.elapsed_time = gr.Textbox(label="Elapsed Time", visible=True)
+                with gr.Column():
+                    if 'Chat' in self.tasks:
+                        # Textbox to display the generated answer
+                        self.answer = gr.Textbox(label="Answer", visible=False)
 
-            # Submit button and function for the Chat task
-            self.submit_question = gr.Button("Submit Question", elem_id='submit_question', visible=False)
-            self.submit_question.click(
-                fn=self.ask_chat_model,
-                inputs=[self.question, self.select_chat_model],
-                outputs=[self.answer, self.elapsed_time],
-            )
+                    if 'Image Classification' in self.tasks:
+                        # Textbox to display the image classification
+                        self.classification = gr.Textbox(label="Classification", visible=False)
 
-            # Submit button and function for the Image Classification task
-            self.submit_image = gr.Button("Classify Image", elem_id='classify_image', visible=False)
-            self.submit_image.click(
-                fn=self.classify_image_model,
-                inputs=[self.upload_image, self.select_image_class_model],
-                outputs=[self.classification, self.elapsed_time]
-            )
+                    if 'Image Generation' in self.tasks:
+                        # Image to display the generated image
+                        self.output_image = gr.Image(label="Output Image", visible=False)
 
-            # Submit button and function for the Image Generation task
-            self.submit_prompt = gr.Button("Generate Image", elem_id='generate_image', visible=False)
-            self.submit_prompt.click(
-                fn=self.gen_image_model,
-                inputs=[self.prompt, self.select_image_gen_model],
-                outputs=[self.output_image, self.elapsed_time]
-            )
+                    # Textbox to display the elapsed time for response generation
+                    self.elapsed_time = gr.Textbox(label="Elapsed Time", visible=True)
 
-            # Define the interface objects for each task
-            self.interface_objects = {
-                'Chat':
-                    [self.question, self.select_chat_model, self.submit_question, self.answer],
-                'Image Classification':
-                    [self.upload_image, self.select_image_class_model, self.submit_image, self.classification],
-                'Image Generation':
-                    [self.prompt, self.select_image_gen_model, self.submit_prompt, self.output_image],
-            }
+            if 'Chat' in self.tasks:
+                # Submit button and function for the Chat task
+                self.submit_question = gr.Button("Submit Question", elem_id='submit_question', visible=False)
+                self.submit_question.click(
+                    fn=self.ask_chat_model_queued,
+                    inputs=[self.question, self.select_chat_model, self.session],
+                    outputs=[self.answer, self.elapsed_time, self.session],
+                )
+                self.interface_objects['Chat'] = [self.question, self.select_chat_model, self.submit_question, self.answer]
+
+            if 'Image Classification' in self.tasks:
+                # Submit button and function for the Image Classification task
+                self.submit_image = gr.Button("Classify Image", elem_id='classify_image', visible=False)
+                self.submit_image.click(
+                    fn=self.classify_image_model_queued,
+                    inputs=[self.upload_image, self.select_image_class_model, self.session],
+                    outputs=[self.classification, self.elapsed_time, self.session],
+                )
+                self.interface_objects['Image Classification'] = [
+                    self.upload_image, self.select_image_class_model, self.submit_image, self.classification,
+                ]
+
+            if 'Image Generation' in self.tasks:
+                # Submit button and function for the Image Generation task
+                self.submit_prompt = gr.Button("Generate Image", elem_id='generate_image', visible=False)
+                self.submit_prompt.click(
+                    fn=self.gen_image_model_queued,
+                    inputs=[self.prompt, self.select_image_gen_model, self.select_image_gen_preset, self.session],
+                    outputs=[self.output_image, self.elapsed_time, self.session],
+                )
+                self.interface_objects['Image Generation'] = [
+                    self.prompt, self.select_image_gen_model, self.select_image_gen_preset, self.submit_prompt,
+                    self.output_image,
+                ]
 
             # Update interface components based on the selected task
             task.change(
@@ -149,8 +318,24 @@ class GradioApp(object):
                 outputs=[value for values in self.interface_objects.values() for value in values],
             )
 
-        # Launch the Gradio interface with the defined components
-        self.demo.launch(share=False, server_port=7860)
+        # Enable the queue, required by generator handlers such as the streamed chat. Its workers stay blocked while
+        # their requests wait for the scheduler, so it has more workers than the scheduler runs requests at once
+        self.demo.queue(concurrency_count=self.config['QUEUE_CONCURRENCY'])
+
+        # Launch the Gradio interface with the defined components, without blocking the thread yet
+        self.demo.launch(share=False, server_port=7860, prevent_thread_lock=True)
+
+        # Serve the request metrics in the Prometheus text format next to the interface
+        self.demo.server_app.add_api_route(
+            self.METRICS_PATH, self.export_metrics, methods=['GET'], response_class=PlainTextResponse,
+        )
+
+        # Block until the server is interrupted
+        try:
+            self.demo.block_thread()
+        finally:
+            if self.api is not None:
+                self.api.stop()
 
     def change_interface(self, task: str):
         """
@@ -199,40 +384,39 @@ class GradioApp(object):
 
         Note:
             This method loads and initializes the specified image classification model if it
-            doesn't exist in the `self.models` dictionary. It records the elapsed time for
-            classification and appends it to `self.timers`.
+            doesn't exist in the `self.models` registry. It records the inference time and the
+            size of the image in `self.metrics`.
 
         """
         # Record the starting time for performance measurement
         start_time = time.time()
 
         # Load the model if it doesn't exist yet
-        if model_name not in self.models.keys():
-            if self.verbose:
-                print(f'Loading Model ({model_name}) for task Image Classification...')
-
-            self.models[model_name] = ImageClassModel(model_name, self.verbose)
+        model = self.get_model('Image Classification', model_name)
 
         # Perform inference with the specified model
-        result = self.models[model_name].infer(
-            image,
-            seed=self.seed,
-        )
+        self.metrics.observe('payload_bytes', 'Image Classification', model_name, payload_size(image))
+        with self.metrics.timer('inference_seconds', 'Image Classification', model_name):
+            result = model.infer(
+                image,
+                seed=self.seed,
+            )
 
-        # Calculate elapsed time and append it to timers
+        # Calculate elapsed time
         elapsed_time = time.time() - start_time
-        self.timers.append(elapsed_time)
         elapsed_time_text = f"The query took {elapsed_time} seconds"
 
         return result, elapsed_time_text
 
-    def ask_chat_model(self, prompt: str, model_name: str, max_tokens: int = 100):
+    def ask_chat_model(self, prompt: str, model_name: str, session_id: str = None, max_tokens: int = 100):
         """
         Generate a response given a text prompt using a pre-trained language model.
 
         Parameters:
             prompt (str): The text prompt provided by the user.
             model_name (str): The name of the pre-trained language model to be used.
+            session_id (str, optional): The identifier of the conversation. Defaults to None, which uses
+                                        the default conversation of the model.
             max_tokens (int, optional): The maximum number of tokens in the generated response.
                                        Defaults to 100.
 
@@ -248,34 +432,87 @@ class GradioApp(object):
         start_time = time.time()
 
         # Load the model if doesn't exist yet
-        if model_name not in self.models.keys():
-            if self.verbose:
-                print(f'Loading Model ({model_name}) for task Chat...')
-
-            self.models = {model_name: ChatLLM(model_name, self.verbose)}
+        model = self.get_model('Chat', model_name)
 
         # Generate text based on the provided prompt
-        result = self.models[model_name].infer(
-            prompt,
-            max_tokens=max_tokens,  # Limit the length of the generated text
-            seed=self.seed,
-        )
+        self.metrics.observe('payload_bytes', 'Chat', model_name, payload_size(prompt))
+        with self.metrics.timer('inference_seconds', 'Chat', model_name):
+            result = model.infer(
+                prompt,
+                max_tokens=max_tokens,  # Limit the length of the generated text
+                seed=self.seed,
+                session_id=session_id,
+            )
 
         # Calculate the time taken for text generation
         elapsed_time = time.time() - start_time
-        self.timers.append(elapsed_time)
         elapsed_time = f"The query took {elapsed_time} seconds"
 
         # Return the generated text and the time taken
         return result, elapsed_time
 
-    def gen_image_model(self, prompt: str, model_name: str):
+    def ask_chat_model_stream(self, prompt: str, model_name: str, session_id: str = None, max_tokens: int = 100):
+        """
+        Generate a response given a text prompt, yielding the response while its tokens are generated.
+
+        Parameters:
+            prompt (str): The text prompt provided by the user.
+            model_name (str): The name of the pre-trained language model to be used.
+            session_id (str, optional): The identifier of the conversation of the browser session. Defaults to
+                                        None, which starts a new conversation with a new identifier.
+            max_tokens (int, optional): The maximum number of tokens in the generated response.
+                                       Defaults to 100.
+
+        Yields:
+            tuple: A tuple containing the response generated so far, a description of the timings and the
+                   identifier of the conversation.
+
+        This generator is used as the Chat handler of the interface, so the Answer textbox fills in
+        as tokens arrive. Once the generation finishes, the time to first token and the tokens per
+        second are reported separately from the total time taken by the query, with the share of the
+        tokens proposed by the draft model that were accepted for the models with one. Each browser session
+        keeps its own conversation, identified by the session state of the interface.
+        """
+        # Start a new conversation for sessions without one
+        session_id = session_id or self._new_session_id()
+
+        # Record the starting time for performance measurement
+        start_time = time.time()
+
+        # Load the model if doesn't exist yet
+        model = self.get_model('Chat', model_name)
+
+        # Stream the text generated from the provided prompt
+        self.metrics.observe('payload_bytes', 'Chat', model_name, payload_size(prompt))
+        inference_start_time = time.time()
+        stats = {}
+        result = ''
+        stream = model.infer_stream(prompt, max_tokens=max_tokens, seed=self.seed, stats=stats, session_id=session_id)
+        for result in stream:
+            elapsed_time = f"Generating... (time to first token: {stats['time_to_first_token']} seconds)"
+            yield result, elapsed_time, session_id
+
+        # Calculate the time taken for text generation
+        self.metrics.observe('inference_seconds', 'Chat', model_name, time.time() - inference_start_time)
+        elapsed_time = time.time() - start_time
+        elapsed_time = f"The query took {elapsed_time} seconds " \
+            f"(time to first token: {stats['time_to_first_token']} seconds, " \
+            f"{stats['tokens_per_second']} tokens/second, {stats['prompt_tokens']} prompt tokens"
+        if 'acceptance_rate' in stats:
+            elapsed_time += f", {stats['acceptance_rate']:.0%} of the {stats['draft_tokens']} draft tokens accepted"
+        elapsed_time += ')'
+
+        yield result, elapsed_time, session_id
+
+    def gen_image_model(self, prompt: str, model_name: str, preset: str = None):
         """
         Generate a image given a text prompt using a pre-trained model.
 
         Parameters:
             prompt (str): The text prompt provided by the user.
             model_name (str): The name of the pre-trained model to be used.
+            preset (str, optional): The name of the preset with the number of denoising steps and the scheduler.
+                                    Defaults to None, which uses the default preset of the configuration.
 
         Returns:
             tuple: A tuple containing the generated image and the time taken for generation.
@@ -288,43 +525,392 @@ class GradioApp(object):
         start_time = time.time()
 
         # Load the model if it doesn't exist yet
-        if model_name not in self.models.keys():
-            if self.verbose:
-                print(f'Loading Model ({model_name}) for task Image Generation...')
-
-            self.models[model_name] = ImageGenModel(model_name, self.verbose)
+        model = self.get_model('Image Generation', model_name)
 
         # Perform inference with the specified model
-        result = self.models[model_name].infer(
-            prompt,
-            seed=self.seed,
-        )
+        self.metrics.observe('payload_bytes', 'Image Generation', model_name, payload_size(prompt))
+        with self.metrics.timer('inference_seconds', 'Image Generation', model_name):
+            result = model.infer(
+                prompt,
+                seed=self.seed,
+                preset=preset,
+            )
 
-        # Calculate elapsed time and append it to timers
+        # Calculate elapsed time
         elapsed_time = time.time() - start_time
-        self.timers.append(elapsed_time)
         elapsed_time = f"The query took {elapsed_time} seconds"
 
         return result, elapsed_time
 
-    def release_models(self):
+    def ask_chat_model_queued(self, prompt: str, model_name: str, session_id: str = None):
+        """
+        Stream a chat response once the scheduler gives the request its turn.
+
+        Parameters:
+            prompt (str): The text prompt provided by the user.
+            model_name (str): The name of the pre-trained language model to be used.
+            session_id (str, optional): The identifier of the browser session. Defaults to None, which starts
+                                        a new session with a new identifier.
+
+        Yields:
+            tuple: The outputs of `ask_chat_model_stream`. While the request waits, the answer is left unchanged
+                   and the elapsed time textbox shows its queue position and estimated wait.
+        """
+        session_id = session_id or self._new_session_id()
+
+        yield from self._run_scheduled(
+            'Chat', model_name, session_id,
+            handler=lambda: self.ask_chat_model_stream(prompt, model_name, session_id),
+        )
+
+    def classify_image_model_queued(self, image, model_name: str, session_id: str = None):
         """
-        Releases all models, clears the models dictionary, and performs memory cleanup.
+        Classify an image once the scheduler gives the request its turn.
 
-        This method iterates through the dictionary of models, releasing each model using its 'release' method.
-        After releasing all models, it clears the models dictionary and performs memory cleanup to free GPU memory.
+        Args:
+            image: The image to be classified as a NumPy array.
+            model_name (str): The name of the image classification model to use.
+            session_id (str, optional): The identifier of the browser session. Defaults to None, which starts
+                                        a new session with a new identifier.
 
-        Note: Make sure that the models in the dictionary have a 'release' method implemented for proper resource cleanup.
+        Yields:
+            tuple: The outputs of `classify_image_model` and the session identifier. While the request waits,
+                   the classification is left unchanged and the elapsed time textbox shows its queue position.
         """
-        # Iterate through the models in the dictionary
-        for model in self.models.values():
-            model.release()  # Release the model
+        session_id = session_id or self._new_session_id()
 
-        # Clear the models dictionary
-        self.models = {}
+        yield from self._run_scheduled(
+            'Image Classification', model_name, session_id,
+            handler=lambda: (*self.classify_image_model(image, model_name), session_id),
+        )
+
+    def gen_image_model_queued(self, prompt: str, model_name: str, preset: str = None, session_id: str = None):
+        """
+        Generate an image once the scheduler gives the request its turn.
+
+        Parameters:
+            prompt (str): The text prompt provided by the user.
+            model_name (str): The name of the pre-trained model to be used.
+            preset (str, optional): The name of the preset with the number of denoising steps and the scheduler.
+                                    Defaults to None, which uses the default preset of the configuration.
+            session_id (str, optional): The identifier of the browser session. Defaults to None, which starts
+                                        a new session with a new identifier.
+
+        Yields:
+            tuple: The outputs of `gen_image_model` and the session identifier. While the request waits, the
+                   image is left unchanged and the elapsed time textbox shows its queue position.
+        """
+        session_id = session_id or self._new_session_id()
+
+        yield from self._run_scheduled(
+            'Image Generation', model_name, session_id,
+            handler=lambda: (*self.gen_image_model(prompt, model_name, preset), session_id),
+        )
+
+    @staticmethod
+    def _new_session_id() -> str:
+        """
+        Create the identifier of a new browser session, used for its conversation and its scheduling.
+        """
+        return str(uuid.uuid4())
+
+    def _run_scheduled(self, task: str, model_name: str, session_id: str, handler):
+        """
+        Run a request handler once the scheduler gives the request a slot.
+
+        Args:
+            task (str): The task of the request.
+            model_name (str): The model used by the request.
+            session_id (str): The identifier of the browser session.
+            handler (callable): Function without arguments returning the output tuple of the request, or a
+                                generator of output tuples. The second output is the elapsed time text and
+                                the last one the session identifier.
+
+        Yields:
+            tuple: While the request waits, its queue position and estimated wait in place of the elapsed time,
+                   with the other outputs unchanged. Then the outputs of the handler.
+        """
+        submit_time = self.scheduler.clock()
+        ticket = self.scheduler.submit(task, model_name, session_id)
+
+        # The slot is freed when the request finishes, fails or is cancelled while waiting
+        try:
+            while not ticket.wait(timeout=self.QUEUE_UPDATE_INTERVAL):
+                position, estimated_wait = self.scheduler.position(ticket)
+                if estimated_wait is None:
+                    queue_text = f'Queued in position {position}'
+                else:
+                    queue_text = f'Queued in position {position}, estimated wait {estimated_wait:.0f} seconds'
+
+                yield gr.update(), queue_text, session_id
+
+            self.metrics.observe('queue_wait_seconds', task, model_name, ticket.start_time - submit_time)
+
+            # The model is not evicted or demoted while the request uses it
+            with self.models.lease(model_name):
+                outputs = handler()
+                if isinstance(outputs, tuple):
+                    yield outputs
+                else:
+                    yield from outputs
+        finally:
+            self.scheduler.release(ticket)
+
+    def preload_models(self):
+        """
+        Load and warm up the models of the enabled tasks listed in the `PRELOAD` configuration in background threads.
+
+        Each model is loaded in its own daemon thread and runs a synthetic warm-up inference before it
+        is marked as ready. Requests for a model that is still loading wait for the background load
+        instead of starting a second one.
+
+        Returns:
+            list: The started threads.
+        """
+        threads = []
+
+        for task, model_names in self.preload.items():
+            if task not in self.tasks:
+                continue
+
+            for model_name in model_names:
+                thread = threading.Thread(target=self._preload_model, args=(task, model_name), daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        return threads
+
+    def get_model_status(self) -> str:
+        """
+        Describe the readiness of the models known to the registry.
+
+        Returns:
+            str: One line per model with its state (loading, warming, ready or failed), its tier if it was
+                 moved to host memory, the number of active conversations for chat models and the workers
+                 of the models run in worker processes, followed by the number of requests running and
+                 waiting per task and the hit rate of the result cache.
+        """
+        status = self.models.status()
+
+        if not status:
+            return 'No models loaded'
+
+        residency = self.models.residency()
+        lines = []
+        for model_name, state in status.items():
+            line = f'{model_name}: {state}'
+
+            # Models moved to host memory, or released and loaded again on their next request
+            if residency.get(model_name, ModelRegistry.HOT) != ModelRegistry.HOT:
+                line += f' ({residency[model_name]})'
+
+            # Chat models keep the conversations of the sessions
+            sessions = getattr(self.models.get(model_name), 'sessions', None)
+            if sessions is not None:
+                line += f' ({sessions.stats()["active"]} active sessions)'
+
+            # Chat models with a draft model proposing their tokens
+            speculation_stats = getattr(self.models.get(model_name), 'speculation_stats', lambda: None)()
+            if speculation_stats is not None:
+                line += f' ({speculation_stats["acceptance_rate"]:.0%} draft tokens accepted, ' \
+                    f'{speculation_stats["tokens_per_pass"]:.2f} tokens per forward pass)'
+
+            # Models served by worker processes
+            worker_stats = getattr(self.models.get(model_name), 'worker_stats', None)
+            if worker_stats is not None:
+                workers = worker_stats()
+                line += f' ({workers["ready"]}/{workers["replicas"]} workers ready, {workers["restarts"]} restarts)'
+
+            lines.append(line)
+
+        for task, task_stats in self.scheduler.stats().items():
+            lines.append(f'{task} requests: {task_stats["running"]} running, {task_stats["waiting"]} waiting')
+
+        cache_stats = self.result_cache.stats()
+        lines.append(f'Result cache: {cache_stats["hit_rate"]:.0%} hit rate ({cache_stats["memory_items"]} results in memory, '
+                     f'{cache_stats["disk_files"]} on disk)')
+
+        return '\n'.join(lines)
+
+    def get_request_stats(self) -> str:
+        """
+        Describe the latency percentiles of the requests.
+
+        Returns:
+            str: One line per task, model and metric with observations, with the number of observations and
+                 their p50, p95 and p99. Durations are reported in seconds and payloads in bytes. Then one
+                 line per loaded model with the median seconds of each stage of its runs.
+        """
+        summary = self.metrics.summary()
+
+        if not summary:
+            return 'No requests yet'
+
+        lines = []
+        for (task, model_name), metrics in summary.items():
+            for metric, stats in metrics.items():
+                lines.append(f'{task} / {model_name} {metric}: p50 {stats["p50"]:.3g}, p95 {stats["p95"]:.3g}, '
+                             f'p99 {stats["p99"]:.3g} ({stats["count"]} requests)')
+
+        # Stages of the model runs, such as preprocessing, forward pass, denoising loop or decoding
+        for model_name in list(self.models):
+            profiler = getattr(self.models.get(model_name), 'profiler', None)
+            stage_stats = profiler.stats() if profiler is not None else {}
+            if stage_stats:
+                stages = ', '.join(f'{stage} {stats["p50"]:.3g}' for stage, stats in stage_stats.items())
+                lines.append(f'{model_name} stages p50: {stages}')
+
+        return '\n'.join(lines)
+
+    def capture_traces(self, num_requests: int) -> list:
+        """
+        Record the next runs of every loaded model with the torch profiler.
+
+        Parameters:
+            num_requests (int): Number of runs recorded per model, 0 cancels the recordings not done yet.
+
+        Returns:
+            list: The names of the models whose runs will be recorded. Their traces are written to the
+                  `TRACE_DIR` directory of the configuration.
+        """
+        model_names = []
+        for model_name in list(self.models):
+            profiler = getattr(self.models.get(model_name), 'profiler', None)
+            if profiler is not None:
+                profiler.capture_trace(num_requests, self.trace_dir)
+                model_names.append(model_name)
+
+        return model_names
+
+    def capture_traces_text(self, num_requests: int) -> str:
+        """
+        Record the next runs of every loaded model with the torch profiler, and describe the recording.
+
+        Parameters:
+            num_requests (int): Number of runs recorded per model.
+
+        Returns:
+            str: The models recorded and the directory of their traces.
+        """
+        model_names = self.capture_traces(int(num_requests))
+
+        if not model_names:
+            return 'No models loaded'
+
+        return f'Recording the next {int(num_requests)} runs of {", ".join(model_names)} to {self.trace_dir}'
+
+    def export_metrics(self) -> str:
+        """
+        Export the request metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The load time, queue wait, inference time and payload size histograms of each task and model.
+        """
+        return self.metrics.export_text()
+
+    def get_model(self, task: str, model_name: str, warmup: bool = False):
+        """
+        Get a model from the registry, loading it if it is not loaded yet.
+
+        Callers running the model outside of the scheduled handlers of the application lease it with
+        `models.lease(model_name)`, so it is not evicted while it runs.
+
+        Args:
+            task (str): The task the model is used for.
+            model_name (str): The name of the pre-trained model.
+            warmup (bool): Whether to run a warm-up inference after loading the model. Defaults to False.
+
+        Returns:
+            The loaded model. Loading it may evict other models to stay within the memory budget. The first
+            model of a task imports the model wrapper of the task. If `WORKERS` is enabled, the model is a
+            ModelWorkerPool with the replicas of the model in their own processes, which import the wrapper.
+        """
+        if task not in self.tasks:
+            raise ValueError(f'Task {task} is not enabled, expected one of {list(self.tasks)}')
+
+        def load():
+            if self.verbose:
+                print(f'Loading Model ({model_name}) for task {task}...')
+
+            model_kwargs = dict(self.model_kwargs.get(task, {}))
+            if model_name in self.execution_modes:
+                model_kwargs['execution_mode'] = self.execution_modes[model_name]
+            if task == 'Chat' and model_name in self.draft_models:
+                model_kwargs['draft_model_name'] = self.draft_models[model_name]
+
+            with self.metrics.timer('load_seconds', task, model_name):
+                if self.workers['ENABLED']:
+                    # The result cache of the interface process is not shared with the worker processes
+                    model_kwargs.pop('cache', None)
+                    plugin = self.tasks[task]
+                    model = ModelWorkerPool(
+                        plugin.module_name, plugin.class_name, model_name, self.verbose, model_kwargs,
+                        replicas=self.workers['REPLICAS'].get(model_name, 1),
+                        threads_per_worker=self.workers['THREADS_PER_WORKER'],
+                        start_method=self.workers['START_METHOD'],
+                        shared_memory_images=self.workers['SHARED_MEMORY_IMAGES'],
+                    )
+                else:
+                    model = self.tasks.get_model_class(task)(model_name, self.verbose, **model_kwargs)
+
+            # The runs of the worker processes are not profiled
+            if self.trace_requests and hasattr(model, 'profiler'):
+                model.profiler.capture_trace(self.trace_requests, self.trace_dir)
+
+            return model
+
+        return self.models.get_or_load(model_name, load, warmup=(lambda model: model.warmup()) if warmup else None)
+
+    def _preload_model(self, task: str, model_name: str):
+        """
+        Load and warm up a model, reporting failures instead of raising them.
+
+        Args:
+            task (str): The task the model is used for.
+            model_name (str): The name of the pre-trained model.
+        """
+        try:
+            self.get_model(task, model_name, warmup=True)
+        except Exception as error:
+            if self.verbose:
+                print(f'Failed to preload Model ({model_name}) for task {task}: {error}')
+
+    def _record_transition(self, model_name: str, source: str, target: str, seconds: float):
+        """
+        Record the seconds spent moving a model between the device it runs on and host memory.
+
+        Args:
+            model_name (str): The name of the model.
+            source (str): The previous tier of the model ('hot', 'warm' or 'cold').
+            target (str): The new tier of the model.
+            seconds (float): The duration of the transition.
+        """
+        metric = {
+            (ModelRegistry.HOT, ModelRegistry.WARM): 'demote_seconds',
+            (ModelRegistry.WARM, ModelRegistry.HOT): 'promote_seconds',
+        }.get((source, target))
+        if metric is None:
+            # Releases are immediate and loads from the cold tier are recorded as loads
+            return
+
+        task = next((task for task, model_names in self.available_models.items() if model_name in model_names), None)
+        self.metrics.observe(metric, task, model_name, seconds)
+
+    def release_models(self):
+        """
+        Releases all models, clears the models registry, and performs memory cleanup.
+
+        This method releases every model in the registry (including pinned ones) using its 'release' method,
+        once the requests using it finish. After releasing all models, it performs memory cleanup to free GPU memory.
+
+        Note: Make sure that the models in the registry have a 'release' method implemented for proper resource cleanup.
+        """
+        # Release every model and clear the models registry
+        self.models.release_all()
 
-        # Clear GPU memory
-        torch.cuda.empty_cache()
+        # Clear GPU memory, torch is only imported once a model was loaded
+        if 'torch' in sys.modules:
+            sys.modules['torch'].cuda.empty_cache()
 
         # Perform garbage collection to free up system memory
         gc.collect()
@@ -0,0 +1,351 @@
+import io
+import time
+import uuid
+import base64
+import binascii
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
+from PIL import Image, UnidentifiedImageError
+from pydantic import BaseModel
+
+from multihugginggradio.utils.metrics.request_metrics import payload_size
+
+
+class ChatRequest(BaseModel):
+    """
+    Body of a chat request: a prompt or a batch of prompts.
+    """
+    model: Optional[str] = None
+    prompt: Optional[str] = None
+    prompts: Optional[List[str]] = None
+    session_id: Optional[str] = None
+    max_tokens: int = 100
+
+
+class ClassifyRequest(BaseModel):
+    """
+    Body of a classification request: a base64 encoded image or a batch of them.
+    """
+    model: Optional[str] = None
+    image: Optional[str] = None
+    images: Optional[List[str]] = None
+
+
+class GenerateRequest(BaseModel):
+    """
+    Body of a generation request: a prompt or a batch of prompts, with the seed of each image.
+    """
+    model: Optional[str] = None
+    prompt: Optional[str] = None
+    prompts: Optional[List[str]] = None
+    seed: Optional[int] = None
+    seeds: Optional[List[int]] = None
+    preset: Optional[str] = None
+
+
+class _Server(uvicorn.Server):
+    """
+    Uvicorn server run in a background thread, leaving the signals to the main thread.
+    """
+    def install_signal_handlers(self):
+        pass
+
+
+class HttpAPI(object):
+    # Header identifying the client, used for the fair scheduling of its requests
+    CLIENT_HEADER = 'X-Client-Id'
+
+    def __init__(
+        self,
+        app,
+        host: str = '127.0.0.1',
+        port: int = 7861,
+        keep_alive: int = 30,
+        max_batch_items: int = 32,
+    ):
+        """
+        Initialize a JSON HTTP API serving the models of a GradioApp without the interface.
+
+        Parameters:
+            app (GradioApp): The application whose models, scheduler and metrics are shared with the interface.
+            host (str): The address the server listens on. Defaults to '127.0.0.1'.
+            port (int): The port the server listens on. Defaults to 7861.
+            keep_alive (int): Seconds an idle connection is kept open for the next request. Defaults to 30.
+            max_batch_items (int): Maximum number of prompts or images in one request. Defaults to 32.
+
+        The API has one POST endpoint per enabled task:
+        - `/v1/chat`: answers a `prompt`, or each prompt of `prompts`, and returns the responses as JSON. With a
+          `session_id`, the prompts are asked in order in that conversation. Otherwise each prompt is answered
+          in a new conversation that is not kept, and the prompts are answered concurrently, so a chat model
+          with continuous batching decodes them together.
+        - `/v1/classify`: classifies a base64 encoded `image`, or each of the `images`, and returns the labels
+          as JSON.
+        - `/v1/generate`: generates an image per prompt and seed. A single image is returned as an `image/png`
+          body, a batch as a `multipart/mixed` body with a PNG part per image.
+
+        The images and the generations of a batch are requested concurrently like the requests of the interface,
+        so they are taken from the result cache when they were computed before, and the micro-batcher of the
+        model runs the other ones in batched forward or denoising passes.
+
+        `GET /v1/models` lists the models of each enabled task. Each request waits for a slot of the scheduler
+        of the application like a request of the interface, so a batch counts as one request, and its latency
+        and payload are recorded in the metrics of the application. The connections are kept alive between
+        requests, so a client sending many requests does not open a connection per request.
+
+        Example usage:
+        ```
+        api = HttpAPI(app, port=7861)
+        api.start()
+        # curl -X POST localhost:7861/v1/chat -H 'Content-Type: application/json' -d '{"prompts": ["Hi!", "Hello!"]}'
+        api.stop()
+        ```
+        """
+        self.app = app
+        self.host = host
+        self.port = port
+        self.keep_alive = keep_alive
+        self.max_batch_items = max_batch_items
+        self.server = None
+        self.thread = None
+
+        self.fastapi = FastAPI(title='MultiHuggingGradio API')
+        self.fastapi.add_api_route('/v1/models', self.list_models, methods=['GET'])
+        self.fastapi.add_api_route('/v1/chat', self.chat, methods=['POST'])
+        self.fastapi.add_api_route('/v1/classify', self.classify, methods=['POST'])
+        self.fastapi.add_api_route('/v1/generate', self.generate, methods=['POST'])
+
+    def start(self, timeout: float = 5.0):
+        """
+        Start serving the API in a background thread.
+
+        Parameters:
+            timeout (float): Seconds to wait for the server to start. Defaults to 5.
+
+        Raises:
+            RuntimeError: If the server does not start in time, for instance because the port is taken.
+        """
+        config = uvicorn.Config(
+            self.fastapi, host=self.host, port=self.port, timeout_keep_alive=self.keep_alive, log_level='warning',
+        )
+        self.server = _Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.thread.start()
+
+        start_time = time.time()
+        while not self.server.started:
+            if not self.thread.is_alive() or time.time() - start_time > timeout:
+                raise RuntimeError(f'The API server failed to start on {self.host}:{self.port}')
+            time.sleep(0.01)
+
+    def stop(self):
+        """
+        Stop the server started with `start`, after the running requests finish.
+        """
+        if self.server is not None:
+            self.server.should_exit = True
+            self.thread.join()
+            self.server = None
+            self.thread = None
+
+    def list_models(self) -> dict:
+        """
+        List the models of the enabled tasks, the first one of each task is used by default.
+        """
+        return {task: self.app.available_models[task] for task in self.app.tasks}
+
+    def chat(self, body: ChatRequest, request: Request) -> dict:
+        """
+        Answer one or several prompts with a chat model.
+
+        Returns:
+            dict: The model, the response and the conversation identifier of each prompt (None for the prompts
+                  answered without a conversation), and the seconds taken.
+        """
+        model_name = self._model_name('Chat', body.model)
+        prompts = self._items(body.prompt, body.prompts, 'prompt')
+
+        with self._scheduled('Chat', model_name, request) as model:
+            for prompt in prompts:
+                self.app.metrics.observe('payload_bytes', 'Chat', model_name, payload_size(prompt))
+
+            start_time = time.time()
+            if body.session_id:
+                # The prompts of a conversation follow each other
+                responses = [
+                    model.infer(prompt, max_tokens=body.max_tokens, seed=self.app.seed, session_id=body.session_id)
+                    for prompt in prompts
+                ]
+            else:
+                # The prompts without a conversation are answered together and their conversations dropped
+                responses = self._concurrently(
+                    lambda prompt: model.infer(prompt, max_tokens=body.max_tokens, seed=self.app.seed, stateless=True),
+                    prompts,
+                )
+            elapsed_time = time.time() - start_time
+
+        self.app.metrics.observe('inference_seconds', 'Chat', model_name, elapsed_time)
+
+        return {
+            'model': model_name,
+            'responses': responses,
+            'session_ids': [body.session_id] * len(prompts),
+            'seconds': elapsed_time,
+        }
+
+    def classify(self, body: ClassifyRequest, request: Request) -> dict:
+        """
+        Classify one or several base64 encoded images.
+
+        Returns:
+            dict: The model, the predicted label of each image, and the seconds taken.
+        """
+        model_name = self._model_name('Image Classification', body.model)
+        images = [self._decode_image(image) for image in self._items(body.image, body.images, 'image')]
+
+        with self._scheduled('Image Classification', model_name, request) as model:
+            for image in images:
+                self.app.metrics.observe('payload_bytes', 'Image Classification', model_name, payload_size(image))
+
+            start_time = time.time()
+            labels = self._concurrently(lambda image: model.infer(image, seed=self.app.seed), images)
+            elapsed_time = time.time() - start_time
+
+        self.app.metrics.observe('inference_seconds', 'Image Classification', model_name, elapsed_time)
+
+        return {'model': model_name, 'labels': labels, 'seconds': elapsed_time}
+
+    def generate(self, body: GenerateRequest, request: Request) -> Response:
+        """
+        Generate an image per prompt and seed.
+
+        Returns:
+            Response: A PNG body for a single image, or a multipart/mixed body with a PNG part per image. The
+                      `X-Seconds` header has the seconds taken.
+        """
+        model_name = self._model_name('Image Generation', body.model)
+        prompts = self._items(body.prompt, body.prompts, 'prompt')
+        seeds = self._items(body.seed, body.seeds, 'seed') if body.seed is not None or body.seeds else None
+        if seeds is not None and len(seeds) != len(prompts):
+            raise HTTPException(422, f'Expected one seed per prompt, got {len(seeds)} seeds for {len(prompts)} prompts')
+        seeds = seeds or [self.app.seed] * len(prompts)
+
+        if body.preset is not None and body.preset not in self.app.model_kwargs['Image Generation']['presets']:
+            raise HTTPException(422, f'Unknown preset {body.preset}')
+
+        with self._scheduled('Image Generation', model_name, request) as model:
+            for prompt in prompts:
+                self.app.metrics.observe('payload_bytes', 'Image Generation', model_name, payload_size(prompt))
+
+            start_time = time.time()
+            images = self._concurrently(
+                lambda request: model.infer(request[0], seed=request[1], preset=body.preset), list(zip(prompts, seeds)),
+            )
+            elapsed_time = time.time() - start_time
+
+        self.app.metrics.observe('inference_seconds', 'Image Generation', model_name, elapsed_time)
+
+        headers = {'X-Seconds': str(elapsed_time)}
+        if len(images) == 1:
+            return Response(_encode_png(images[0]), media_type='image/png', headers=headers)
+
+        boundary = uuid.uuid4().hex
+        return Response(
+            _multipart(images, seeds, boundary), media_type=f'multipart/mixed; boundary={boundary}', headers=headers,
+        )
+
+    def _model_name(self, task: str, model_name: str) -> str:
+        """
+        Check that a task is enabled and that a model is available for it.
+
+        Returns:
+            str: The model name, or the default model of the task if no model is given.
+        """
+        if task not in self.app.tasks:
+            raise HTTPException(404, f'Task {task} is not enabled')
+
+        available_models = self.app.available_models[task]
+        if model_name is None:
+            return available_models[0]
+        if model_name not in available_models:
+            raise HTTPException(404, f'Model {model_name} is not available for task {task}')
+
+        return model_name
+
+    def _items(self, item, items: list, name: str) -> list:
+        """
+        Get the items of a request, given either as a single item or as a batch.
+        """
+        if (item is None) == (items is None):
+            raise HTTPException(422, f'Expected either {name} or {name}s')
+
+        items = [item] if item is not None else items
+        if not items:
+            raise HTTPException(422, f'Expected at least one {name}')
+        if len(items) > self.max_batch_items:
+            raise HTTPException(413, f'Expected at most {self.max_batch_items} {name}s, got {len(items)}')
+
+        return items
+
+    @staticmethod
+    def _concurrently(function, items: list) -> list:
+        """
+        Call a function on each item of a request in its own thread, so the model batches the calls together.
+        """
+        if len(items) == 1:
+            return [function(items[0])]
+
+        with ThreadPoolExecutor(max_workers=len(items)) as executor:
+            return list(executor.map(function, items))
+
+    @contextmanager
+    def _scheduled(self, task: str, model_name: str, request: Request):
+        """
+        Context manager waiting for a scheduler slot, then giving the loaded model, leased until the context exits.
+        """
+        session_id = request.headers.get(self.CLIENT_HEADER) or (request.client.host if request.client else None)
+
+        submit_time = self.app.scheduler.clock()
+        with self.app.scheduler.slot(task, model_name, session_id) as ticket:
+            self.app.metrics.observe('queue_wait_seconds', task, model_name, ticket.start_time - submit_time)
+            with self.app.models.lease(model_name):
+                yield self.app.get_model(task, model_name)
+
+    @staticmethod
+    def _decode_image(image: str) -> np.ndarray:
+        """
+        Decode a base64 encoded image file to an RGB array.
+        """
+        try:
+            return np.array(Image.open(io.BytesIO(base64.b64decode(image, validate=True))).convert('RGB'))
+        except (binascii.Error, UnidentifiedImageError, OSError):
+            raise HTTPException(400, 'Expected base64 encoded image files')
+
+
+def _encode_png(image: Image.Image) -> bytes:
+    """
+    Encode an image as a PNG file.
+    """
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _multipart(images: list, seeds: list, boundary: str) -> bytes:
+    """
+    Encode images as the PNG parts of a multipart/mixed body, each with the seed of the image in a header.
+    """
+    parts = []
+    for image, seed in zip(images, seeds):
+        parts.append(
+            f'--{boundary}\r\nContent-Type: image/png\r\nX-Seed: {seed}\r\n\r\n'.encode() + _encode_png(image) + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+
+    return b''.join(parts)
@@ -1,5 +1,13 @@
+import os
+import shutil
+import inspect
 import torch
-from transformers import pipeline
+import transformers
+from transformers import AutoConfig, AutoTokenizer, pipeline
+from transformers.dynamic_module_utils import get_class_from_dynamic_module, get_relative_import_files
+from multihugginggradio.models.model_registry import get_module_size
+from multihugginggradio.models.model_store import ModelStore
+from multihugginggradio.models.execution_mode import apply_execution_mode, get_device, get_torch_dtype, move_modules
 
 
 class BasePipeline():
@@ -7,6 +15,9 @@ class BasePipeline():
         self,
         model_name: str,
         verbose: bool = False,
+        task: str = None,
+        execution_mode: str = 'bf16',
+        store: ModelStore = None,
     ):
         """
         Initialize a BasePipeline class using the Hugging Face Transformers library.
@@ -14,6 +25,11 @@ class BasePipeline():
         Parameters:
             model_name (str): The name or path of the pre-trained language model to be used.
             verbose (bool): Flag to display debug prints. Defaults to False.
+            task (str): The pipeline task. Defaults to None, which infers it from the model on the Hub.
+            execution_mode (str): Precision the model runs with: 'fp32', 'bf16' or 'int8' (dynamically quantized
+                                  Linear layers, CPU only). Defaults to 'bf16'.
+            store (ModelStore): Optional store the model is converted into on its first load, and mapped from on
+                                the next loads. Defaults to None, which loads the model from its checkpoint.
 
         This class wraps the Hugging Face `pipeline` function to create an instance of the BasePipeline.
         The pipeline allows for easy text generation, completion, summarization, and other NLP tasks
@@ -26,17 +42,122 @@ class BasePipeline():
         print(output)
         ```
         """
-        self.model = pipeline(
+        if store is None:
+            self.model = self._load_pipeline(model_name, task, execution_mode)
+        else:
+            # Convert the model once, then map its converted weights
+            store.convert(model_name, execution_mode, lambda path, scratch_dir: self._convert_pipeline(
+                model_name, task, execution_mode, path, store.max_shard_size,
+            ))
+            self.model = self._load_stored_pipeline(model_name, execution_mode, store)
+        self.execution_mode = execution_mode
+        self.verbose = verbose
+
+        # Put the model in its inference configuration
+        apply_execution_mode(self.model.model, execution_mode)
+
+    @staticmethod
+    def _load_pipeline(model_name: str, task: str, execution_mode: str):
+        """
+        Load the pipeline of a model from its checkpoint.
+        """
+        return pipeline(
+            task=task,                   # Task of the pipeline (required for local models)
             model=model_name,            # Model to be used
-            torch_dtype=torch.bfloat16,  # Specify the data type for PyTorch tensors
+            torch_dtype=get_torch_dtype(execution_mode),  # Specify the data type for PyTorch tensors
             trust_remote_code=True,      # Allow running remote code (if applicable)
-            device_map="auto",           # Automatically select the device for computation
+            device_map="auto" if execution_mode != 'int8' else None,  # Select the device (quantized models run on CPU)
         )
-        self.verbose = verbose
+
+    @classmethod
+    def _convert_pipeline(cls, model_name: str, task: str, execution_mode: str, path: str, max_shard_size: str) -> dict:
+        """
+        Save the model and tokenizer of a pipeline cast to its execution mode as safetensors shards.
+        """
+        model = cls._load_pipeline(model_name, task, execution_mode)
+        model.model.save_pretrained(path, safe_serialization=True, max_shard_size=max_shard_size)
+        model.tokenizer.save_pretrained(path)
+
+        # The task inferred from the Hub is kept, the task of a local model cannot be inferred
+        metadata = {'task': model.task}
+
+        # A pipeline defined by the code of the model (such as an instruction template) is kept with its code
+        pipeline_class = type(model)
+        if not pipeline_class.__module__.startswith('transformers.'):
+            source_file = inspect.getsourcefile(pipeline_class)
+            for file in [source_file] + get_relative_import_files(source_file):
+                shutil.copy(file, path)
+            module_name = os.path.splitext(os.path.basename(source_file))[0]
+            metadata['pipeline_class'] = f'{module_name}.{pipeline_class.__name__}'
+
+        return metadata
+
+    @staticmethod
+    def _load_stored_pipeline(model_name: str, execution_mode: str, store: ModelStore):
+        """
+        Create a pipeline from the weights of a model converted into the store.
+        """
+        directory = store.path(model_name, execution_mode)
+        metadata = store.manifest(model_name, execution_mode)['metadata']
+        task = metadata['task']
+        config = AutoConfig.from_pretrained(directory, trust_remote_code=True)
+        model_class = getattr(transformers, (config.architectures or [''])[0], None)
+        if model_class is None:
+            # Models with remote code are loaded by the pipeline, from the converted weights
+            return BasePipeline._load_pipeline(directory, task, execution_mode)
+
+        device = get_device(execution_mode)
+        model = store.load_modules(directory, {'': model_class}, get_torch_dtype(execution_mode), device)['']
+
+        # The pipeline defined by the model is created from the code copied into the store
+        pipeline_class = metadata.get('pipeline_class')
+        if pipeline_class is not None:
+            pipeline_class = get_class_from_dynamic_module(pipeline_class, directory)
+
+        return pipeline(
+            task=task,
+            model=model,
+            tokenizer=AutoTokenizer.from_pretrained(directory),
+            device=device,
+            pipeline_class=pipeline_class,
+        )
+
+    def demote(self) -> bool:
+        """
+        Move the weights of the model to host memory, freeing the memory of its device.
+
+        Returns:
+            bool: Whether the weights were moved. False if the model already runs in host memory, or is
+                  dispatched over several devices.
+        """
+        return self._move('cpu')
+
+    def promote(self):
+        """
+        Move the weights of a demoted model back to the device of its execution mode.
+        """
+        self._move(get_device(self.execution_mode))
+
+    def _move(self, device: str) -> bool:
+        """
+        Move the model of the pipeline to a device, along with the device the pipeline puts its inputs on.
+        """
+        if not move_modules([self.model.model], device):
+            return False
+
+        self.model.device = torch.device(device)
+        return True
+
+    def memory_footprint(self) -> int:
+        """
+        Return the number of bytes used by the model weights.
+        """
+        return get_module_size(self.model.model)
 
     def release(self):
         """
         Release resources associated with the model.
         """
         del self.model
+        del self.execution_mode
         del self.verbose
@@ -0,0 +1,105 @@
+class ChatContext(object):
+    def __init__(
+        self,
+        count_tokens,
+        max_tokens: int = None,
+        separator: str = '\n',
+        low_water_ratio: float = 0.75,
+    ):
+        """
+        Initialize the context window of a chat conversation.
+
+        Parameters:
+            count_tokens (callable): Function returning the number of tokens of a text.
+            max_tokens (int): Token budget of the conversation text sent to the model, including the tokens
+                              reserved for the response. None disables the budget. Defaults to None.
+            separator (str): Text placed between the turns of the conversation. Defaults to '\\n'.
+            low_water_ratio (float): Fraction of the budget the conversation is compacted to when it overflows.
+                                     Dropping more than strictly needed keeps the start of the prompt stable for
+                                     several turns, so the cached keys and values stay reusable. Defaults to 0.75.
+
+        The context stores each turn (user prompts and model completions) with its token count, which is
+        computed once when the turn is added. Building a prompt drops the oldest turns until the
+        conversation fits in the budget, so the prompt size stays bounded however long the chat gets.
+
+        Example usage:
+        ```
+        context = ChatContext(count_tokens=lambda text: len(tokenizer(text)['input_ids']), max_tokens=1024)
+        context.append("Hello!")
+        prompt = context.build_prompt(reserved_tokens=100)
+        ```
+        """
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.separator = separator
+        self.low_water_ratio = low_water_ratio
+
+        # Turns of the conversation with their token counts, and the sum of those counts
+        self.turns = []
+        self._turn_tokens = 0
+        self._separator_tokens = count_tokens(separator)
+
+        # Number of tokens sent to the model in the last turn
+        self.last_prompt_tokens = 0
+
+    @property
+    def history(self) -> list:
+        """
+        list: The text of the turns kept in the context.
+        """
+        return [text for text, _ in self.turns]
+
+    @property
+    def num_tokens(self) -> int:
+        """
+        int: The number of tokens of the conversation, including the separators between turns.
+        """
+        if not self.turns:
+            return 0
+
+        return self._turn_tokens + self._separator_tokens * (len(self.turns) - 1)
+
+    def append(self, text: str):
+        """
+        Add a turn to the conversation, counting its tokens.
+
+        Parameters:
+            text (str): The text of the turn.
+        """
+        num_tokens = self.count_tokens(text)
+        self.turns.append((text, num_tokens))
+        self._turn_tokens += num_tokens
+
+    def reset(self, history: list = None):
+        """
+        Replace the conversation.
+
+        Parameters:
+            history (list): The text of the new turns. Defaults to None, which empties the conversation.
+        """
+        self.turns = []
+        self._turn_tokens = 0
+        for text in history or []:
+            self.append(text)
+
+    def build_prompt(self, reserved_tokens: int = 0) -> str:
+        """
+        Combine the conversation into a prompt that fits in the token budget.
+
+        Parameters:
+            reserved_tokens (int): Number of tokens of the budget reserved for the response. Defaults to 0.
+
+        Returns:
+            str: The turns kept in the context, joined by the separator. The latest turn is always kept.
+        """
+        if self.max_tokens is not None:
+            budget = self.max_tokens - reserved_tokens
+
+            if self.num_tokens > budget:
+                # Drop the oldest turns until the conversation is back under the low water mark
+                target = int(budget * self.low_water_ratio)
+                while len(self.turns) > 1 and self.num_tokens > target:
+                    _, num_tokens = self.turns.pop(0)
+                    self._turn_tokens -= num_tokens
+
+        return self.separator.join(self.history)
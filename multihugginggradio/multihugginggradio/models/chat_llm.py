@@ -1,12 +1,142 @@
+import copy
+import time
+import threading
 import torch
+from transformers import LogitsProcessor, LogitsProcessorList, TextIteratorStreamer
 from multihugginggradio.models.base_model import BasePipeline
+from multihugginggradio.models.chat_context import ChatContext
+from multihugginggradio.models.kv_cache import ConversationCache
+from multihugginggradio.models.model_store import ModelStore
+from multihugginggradio.utils.batching.continuous_batcher import ContinuousBatcher
+from multihugginggradio.utils.profiling.stage_profiler import StageProfiler
+from multihugginggradio.utils.session.session_store import SessionStore
+
+
+class TokenCountingStreamer(TextIteratorStreamer):
+    """
+    TextIteratorStreamer that also counts the number of generated tokens.
+    """
+    def __init__(self, tokenizer, **kwargs):
+        super().__init__(tokenizer, **kwargs)
+        self.num_tokens = 0
+
+    def put(self, value):
+        """
+        Receive new token ids from the model and count the ones that do not belong to the prompt.
+        """
+        if not (self.skip_prompt and self.next_tokens_are_prompt):
+            self.num_tokens += value.numel()
+
+        super().put(value)
+
+
+class SeededSamplingProcessor(LogitsProcessor):
+    """
+    Logits processor that samples the next token with its own random generator.
+
+    The sampled token is the only one left with a finite score, so greedy decoding selects it. Sampling
+    this way does not use the process-global random state, which concurrent requests would share.
+    """
+    def __init__(self, generator: torch.Generator, logits_warper: LogitsProcessorList):
+        self.generator = generator
+        self.logits_warper = logits_warper
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        # Apply the sampling settings (temperature, top-k, top-p, ...) and sample like `generate` would
+        probabilities = torch.softmax(self.logits_warper(input_ids, scores), dim=-1)
+        next_tokens = torch.multinomial(probabilities, num_samples=1, generator=self.generator)
+
+        return torch.full_like(scores, -float('inf')).scatter_(1, next_tokens, 0.0)
+
+
+class ForwardCounter(object):
+    """
+    Counter of the forward passes a model runs, counted apart for each thread.
+
+    The forward passes are only counted between `start` and `stop`, so the concurrent generations sharing a
+    model each count their own passes.
+    """
+    def __init__(self, module: torch.nn.Module):
+        self._local = threading.local()
+        self._handle = module.register_forward_hook(self._count)
+
+    def _count(self, module, inputs, outputs):
+        if getattr(self._local, 'count', None) is not None:
+            self._local.count += 1
+
+    def start(self):
+        """
+        Start counting the forward passes of the current thread.
+        """
+        self._local.count = 0
+
+    def stop(self) -> int:
+        """
+        Stop counting the forward passes of the current thread.
+
+        Returns:
+            int: The number of forward passes run by the current thread since `start`.
+        """
+        count, self._local.count = self._local.count, None
+        return count
+
+    def remove(self):
+        """
+        Remove the hook counting the forward passes from the model.
+        """
+        self._handle.remove()
+
+
+class ChatSession(object):
+    def __init__(self, count_tokens, context_max_tokens: int = None, kv_cache_max_bytes: int = None):
+        """
+        Initialize the conversation state of one chat session.
+
+        Parameters:
+            count_tokens (callable): Function returning the number of tokens of a text.
+            context_max_tokens (int): Token budget of the conversation sent to the model, including the
+                                      response. None disables the budget. Defaults to None.
+            kv_cache_max_bytes (int): Maximum number of bytes of past key/value tensors kept for the conversation.
+                                      None disables the limit. Defaults to None.
+
+        The lock serializes the requests of the session, so its history and cache are updated in order.
+        """
+        self.context = ChatContext(count_tokens, max_tokens=context_max_tokens)
+        self.kv_cache = ConversationCache(max_bytes=kv_cache_max_bytes)
+        self.lock = threading.Lock()
+
+    @property
+    def conversation_history(self) -> list:
+        """
+        list: The turns of the conversation kept in the context window.
+        """
+        return self.context.history
+
+    @conversation_history.setter
+    def conversation_history(self, conversation_history: list):
+        self.context.reset(conversation_history)
 
 
 class ChatLLM(BasePipeline):
+    # Session used when no session identifier is given
+    DEFAULT_SESSION = 'default'
+
+    # Generation arguments that configure the sampling of the next token
+    SAMPLING_PARAMETERS = ('temperature', 'top_k', 'top_p', 'typical_p', 'epsilon_cutoff', 'eta_cutoff')
+
     def __init__(
         self,
         model_name: str = 'databricks/dolly-v2-3b',
         verbose: bool = False,
+        kv_cache_max_bytes: int = None,
+        session_ttl: float = 3600,
+        max_sessions: int = 100,
+        context_max_tokens: int = None,
+        execution_mode: str = 'bf16',
+        store: ModelStore = None,
+        draft_model_name: str = None,
+        max_batch_size: int = 1,
+        kv_cache_total_bytes: int = None,
     ):
         """
         Initialize a Chat_LLM class based on a pre-existing BaseModel class.
@@ -15,10 +145,53 @@ class ChatLLM(BasePipeline):
             model_name (str): The name or path of the pre-trained language model to be used.
                               Defaults to 'databricks/dolly-v2-3b'.
             verbose (bool): Flag to display debug prints. Defaults to False.
+            kv_cache_max_bytes (int): Maximum number of bytes of past key/value tensors kept per conversation.
+                                      None disables the limit. Defaults to None.
+            session_ttl (float): Number of seconds a conversation may stay idle before it is dropped.
+                                 Defaults to 3600.
+            max_sessions (int): Maximum number of conversations kept at once. Defaults to 100.
+            context_max_tokens (int): Token budget of each conversation sent to the model, including the
+                                      response. The oldest turns are dropped to fit in it. None disables
+                                      the budget. Defaults to None.
+            execution_mode (str): Precision the model runs with: 'fp32', 'bf16' or 'int8' (dynamically quantized
+                                  Linear layers, CPU only). Defaults to 'bf16'.
+            store (ModelStore): Optional store the model is converted into on its first load, and mapped from on
+                                the next loads. Defaults to None, which loads the model from its checkpoint.
+            draft_model_name (str): Optional name or path of a smaller language model with the same tokenizer,
+                                    loaded with the same execution mode and store, that proposes the next tokens
+                                    of the greedy generations. Defaults to None, which disables the draft model.
+            max_batch_size (int): Maximum number of concurrent generations decoded together by a continuous
+                                  batcher. Defaults to 1, which runs a separate `generate` call per generation.
+            kv_cache_total_bytes (int): Maximum number of bytes of past key/value tensors kept over all the
+                                        conversations, which is counted in the memory footprint of the model.
+                                        None disables the limit. Defaults to None.
 
         This class is derived from the base LLM class and is specifically tailored for chat-like
         interactions using a pre-trained language model. It inherits the capabilities of the LLM class
-        and extends it with a custom `infer` method for generating responses to given prompts.
+        and extends it with a custom `infer` method for generating responses to given prompts, and an
+        `infer_stream` generator that yields the response while its tokens are generated. The past
+        key/value tensors of the previous turn are kept, so each turn only runs the prefill pass on the
+        tokens appended to the conversation.
+
+        Conversations are kept per session in a bounded store, so several users can share one loaded
+        model without their contexts mixing. Requests without a session identifier use a default session.
+        Only the new completion of each turn is stored, and the prompt is fitted into a token budget.
+        When the caches of all the conversations exceed `kv_cache_total_bytes`, the caches of the least
+        recently used conversations are dropped first.
+
+        Each generation is timed by stage ('tokenize', 'prefill', 'generate' and 'decode') with the
+        `profiler`, which can also record the next generations with the torch profiler.
+
+        With a draft model, the greedy generations use speculative decoding: the draft model proposes a few
+        tokens, then a single forward pass of the model verifies them all, keeping the proposed tokens up to
+        the first one the model would not have chosen, followed by the token the model chose instead. The
+        responses are the same as without the draft model, with fewer forward passes of the model when the
+        proposed tokens are accepted. The generations that sample their tokens do not use the draft model.
+
+        With a `max_batch_size` above 1, the concurrent generations of all the sessions are decoded together
+        by a ContinuousBatcher: each request prefills its own prompt, then joins the running batch at its next
+        step and leaves it as soon as its response is complete. The responses are the same as when decoded
+        alone. The greedy generations of a model with a draft model are not batched, they decode speculatively.
 
         Example usage:
         ```
@@ -27,11 +200,60 @@ class ChatLLM(BasePipeline):
         print(response)
         ```
         """
-        super().__init__(model_name=model_name, verbose=verbose)
+        super().__init__(
+            model_name=model_name, verbose=verbose, task='text-generation', execution_mode=execution_mode, store=store,
+        )
+
+        self.profiler = StageProfiler(model_name)
+
+        self.draft = None
+        if draft_model_name is not None:
+            self.draft = BasePipeline(draft_model_name, verbose, 'text-generation', execution_mode, store)
+            if self.draft.model.tokenizer.get_vocab() != self.model.tokenizer.get_vocab():
+                raise ValueError(f'Draft model {draft_model_name} does not have the tokenizer of {model_name}')
+
+            # The forward passes tell how many tokens the draft model proposed and how many passes verified them
+            self._draft_passes = ForwardCounter(self.draft.model.model)
+            self._target_passes = ForwardCounter(self.model.model)
+
+        # Totals of the speculative generations, reported by `speculation_stats`
+        self._speculation_totals = {'generations': 0, 'generated_tokens': 0, 'draft_tokens': 0, 'accepted_tokens': 0,
+                                    'target_passes': 0}
+        self._speculation_lock = threading.Lock()
+
+        self.batcher = ContinuousBatcher(self.model.model, max_batch_size) if max_batch_size > 1 else None
+
+        self.kv_cache_total_bytes = kv_cache_total_bytes
 
-        self.conversation_history = []
+        self.sessions = SessionStore(
+            factory=lambda: ChatSession(self._count_tokens, context_max_tokens, kv_cache_max_bytes),
+            ttl=session_ttl,
+            max_sessions=max_sessions,
+        )
 
-    def infer(self, prompt: str, max_tokens: int = 100, seed: int = 33):
+    @property
+    def conversation_history(self) -> list:
+        """
+        list: The conversation history of the default session.
+        """
+        return self.sessions.get(self.DEFAULT_SESSION).conversation_history
+
+    @conversation_history.setter
+    def conversation_history(self, conversation_history: list):
+        self.sessions.get(self.DEFAULT_SESSION).conversation_history = conversation_history
+
+    @property
+    def kv_cache(self) -> ConversationCache:
+        """
+        ConversationCache: The past key/value cache of the default session.
+        """
+        return self.sessions.get(self.DEFAULT_SESSION).kv_cache
+
+    @kv_cache.setter
+    def kv_cache(self, kv_cache: ConversationCache):
+        self.sessions.get(self.DEFAULT_SESSION).kv_cache = kv_cache
+
+    def infer(self, prompt: str, max_tokens: int = 100, seed: int = 33, session_id: str = None, stateless: bool = False):
         """
         Generate a response given a text prompt using the pre-trained language model.
 
@@ -39,6 +261,10 @@ class ChatLLM(BasePipeline):
             prompt (str): The text prompt provided by the user.
             max_tokens (int): The maximum number of tokens in the generated response. Defaults to 100.
             seed (int): The seed to be used in the inference. Defaults to 33.
+            session_id (str): The identifier of the conversation. Defaults to None, which uses the default session.
+            stateless (bool): Whether to answer the prompt in a new conversation that is dropped once answered,
+                              instead of the conversation of `session_id`, so it does not take the place of
+                              another conversation in the sessions. Defaults to False.
         Returns:
             str: The generated output.
 
@@ -46,30 +272,496 @@ class ChatLLM(BasePipeline):
         response based on the provided prompt. The `max_new_tokens` parameter is set to control the
         length of the response. The generated response is returned as a string.
         """
-        # Set the random seed for reproducibility
-        torch.manual_seed(seed)
+        if stateless:
+            session = self.sessions.factory()
+        else:
+            session = self.sessions.get(session_id or self.DEFAULT_SESSION)
+
+        with session.lock:
+            # Add the current user prompt to the conversation history
+            conversation_prompt = self._add_to_history(session, prompt, max_tokens)
+
+            # Generate a response using the language model
+            generated_text = self._generate(session, conversation_prompt, max_tokens, seed)
+
+            # Add the generated response to the conversation history
+            session.context.append(generated_text)
+
+        return generated_text
+
+    def infer_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 100,
+        seed: int = 33,
+        stats: dict = None,
+        session_id: str = None,
+    ):
+        """
+        Generate a response given a text prompt, yielding the response while its tokens are generated.
+
+        Parameters:
+            prompt (str): The text prompt provided by the user.
+            max_tokens (int): The maximum number of tokens in the generated response. Defaults to 100.
+            seed (int): The seed to be used in the inference. Defaults to 33.
+            stats (dict): Optional dictionary filled with the generation statistics: 'time_to_first_token',
+                          'num_tokens', 'tokens_per_second', 'total_time' (in seconds) and 'prompt_tokens'.
+                          The generations using the draft model also report the 'draft_tokens' proposed,
+                          the 'accepted_tokens', the 'acceptance_rate' and the 'target_passes' of the model.
+                          Defaults to None.
+            session_id (str): The identifier of the conversation. Defaults to None, which uses the default session.
+        Yields:
+            str: The response generated so far. The last value is the same output `infer` would return.
+
+        The generation runs in a background thread that feeds a transformers streamer, so the first
+        tokens can be shown before the whole response is generated. The conversation history is
+        updated once the generation finishes, by the background thread, which also holds the lock of
+        the session: a consumer that stops iterating, such as a disconnected client, does not keep
+        the session locked, and the response is still added to the history.
+        """
+        stats = stats if stats is not None else {}
+        session = self.sessions.get(session_id or self.DEFAULT_SESSION)
+
+        streamer = TokenCountingStreamer(self.model.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        result = {}
+
+        def generate():
+            try:
+                # The generation thread holds the lock of the session instead of this generator, so the session is
+                # unlocked once the response is generated even if the consumer stops iterating without closing it
+                with session.lock:
+                    # Add the current user prompt to the conversation history
+                    conversation_prompt = self._add_to_history(session, prompt, max_tokens)
+
+                    result['generated_text'] = self._generate(session, conversation_prompt, max_tokens, seed, streamer, stats)
+                    result['prompt_tokens'] = session.context.last_prompt_tokens
+
+                    # Add the generated response to the conversation history
+                    session.context.append(result['generated_text'])
+            except Exception as error:
+                result['error'] = error
+                streamer.end()  # Unblock the consumer of the streamer
+
+        start_time = time.time()
+        thread = threading.Thread(target=generate)
+        thread.start()
+
+        # Yield the response as new text arrives from the streamer
+        streamed_text = ''
+        for new_text in streamer:
+            # The streamer sends empty text while a character spans several tokens
+            if not new_text:
+                continue
+
+            if 'time_to_first_token' not in stats:
+                stats['time_to_first_token'] = time.time() - start_time
+
+            streamed_text += new_text
+            yield streamed_text
+
+        thread.join()
+
+        if 'error' in result:
+            raise result['error']
+
+        # Record the generation statistics
+        total_time = time.time() - start_time
+        stats.setdefault('time_to_first_token', total_time)
+        stats['num_tokens'] = streamer.num_tokens
+        stats['total_time'] = total_time
+        stats['tokens_per_second'] = streamer.num_tokens / total_time if total_time > 0 else 0.0
+        stats['prompt_tokens'] = result['prompt_tokens']
+
+        # The pipeline post-processing may differ from the raw streamed text
+        yield result['generated_text']
+
+    def _add_to_history(self, session: ChatSession, prompt: str, max_tokens: int) -> str:
+        """
+        Add a user prompt to the conversation history of a session.
+
+        Parameters:
+            session (ChatSession): The conversation state of the session.
+            prompt (str): The text prompt provided by the user.
+            max_tokens (int): The maximum number of tokens in the generated response, reserved in the budget.
 
+        Returns:
+            str: The conversation that fits in the token budget combined into a single prompt.
+        """
         # Add the current user prompt to the conversation history
-        self.conversation_history.append(prompt)
+        session.context.append(prompt)
 
-        # Combine all conversation history into a single prompt
-        conversation_prompt = "\n".join(self.conversation_history)
+        # Combine the conversation history that fits in the token budget into a single prompt
+        conversation_prompt = session.context.build_prompt(reserved_tokens=max_tokens)
 
         # Print conversation input if verbose mode is enabled
         if self.verbose:
             print(f'Conversation input:\n"""\n{conversation_prompt}\n"""')
 
-        # Generate a response using the language model
-        result = self.model(conversation_prompt, max_new_tokens=max_tokens)
+        return conversation_prompt
+
+    def _generate(
+        self,
+        session: ChatSession,
+        conversation_prompt: str,
+        max_tokens: int,
+        seed: int = 33,
+        streamer=None,
+        stats: dict = None,
+    ) -> str:
+        """
+        Generate the response to a conversation prompt.
+
+        Parameters:
+            session (ChatSession): The conversation state of the session.
+            conversation_prompt (str): The whole conversation combined into a single prompt.
+            max_tokens (int): The maximum number of tokens in the generated response.
+            seed (int): The seed of the random generator used to sample the response. Defaults to 33.
+            streamer (TextStreamer): Optional streamer receiving the tokens as they are generated. Defaults to None.
+            stats (dict): Optional dictionary filled with the statistics of the draft model, when it is used.
+                          Defaults to None.
+
+        Returns:
+            str: The generated output.
+        """
+        pipe = self.model
+        generate_kwargs = {'streamer': streamer} if streamer is not None else {}
+
+        # Run the pipeline steps one by one, so the cached keys and values can be passed to `generate`.
+        # Only the new completion is returned, the prompt is already in the conversation history.
+        with self.profiler.run():
+            preprocess_params, forward_params, postprocess_params = pipe._sanitize_parameters(
+                return_full_text=False,
+                max_new_tokens=max_tokens,
+                **generate_kwargs,
+            )
+            with self.profiler.stage('tokenize'):
+                model_inputs = pipe.preprocess(conversation_prompt, **{**pipe._preprocess_params, **preprocess_params})
+            session.context.last_prompt_tokens = model_inputs['input_ids'].shape[1]
+
+            if self.verbose:
+                print(f'Sending {session.context.last_prompt_tokens} prompt tokens to the model')
+
+            with torch.inference_mode():
+                with self.profiler.stage('prefill'):
+                    past_key_values = self._prefill(session, model_inputs['input_ids'])
+                if past_key_values is not None:
+                    forward_params['past_key_values'] = past_key_values
+
+                forward_params = self._seed_sampling({**pipe._forward_params, **forward_params}, seed)
 
-        # Add the generated response to the conversation history
-        self.conversation_history.append(result[0]["generated_text"])
+                # The draft model only proposes the tokens of greedy generations, the sampled tokens would differ
+                speculative = self.draft is not None and not any(
+                    isinstance(processor, SeededSamplingProcessor) for processor in forward_params.get('logits_processor', [])
+                )
+                if speculative:
+                    forward_params['assistant_model'] = self.draft.model.model
+                    self._draft_passes.start()
+                    self._target_passes.start()
+
+                with self.profiler.stage('generate'):
+                    if self.batcher is not None and not speculative:
+                        model_outputs = self._generate_batched(model_inputs, forward_params)
+                    else:
+                        try:
+                            model_outputs = pipe.forward(model_inputs, **forward_params)
+                        finally:
+                            if speculative:
+                                draft_tokens = self._draft_passes.stop()
+                                target_passes = self._target_passes.stop()
+
+            if speculative:
+                num_tokens = model_outputs['generated_sequence'].shape[-1] - model_inputs['input_ids'].shape[1]
+                self._record_speculation(num_tokens, draft_tokens, target_passes, stats if stats is not None else {})
+
+            with self.profiler.stage('decode'):
+                result = pipe.postprocess(model_outputs, **{**pipe._postprocess_params, **postprocess_params})
 
         return result[0]["generated_text"]
 
+    def _generate_batched(self, model_inputs: dict, generate_kwargs: dict) -> dict:
+        """
+        Generate the response to a prompt with the continuous batcher, like the pipeline forward step.
+
+        Parameters:
+            model_inputs (dict): The inputs of the pipeline forward step, with the 'input_ids' of the prompt.
+            generate_kwargs (dict): The arguments `generate` would be called with, including the 'past_key_values'
+                                    of the prompt and the 'max_new_tokens'.
+
+        Returns:
+            dict: The outputs of the pipeline forward step, the inputs with the 'generated_sequence' of the prompt and
+                  response.
+        """
+        model = self.model.model
+        input_ids = model_inputs['input_ids']
+
+        # Process the scores of the next tokens like `generate`, with the settings of the generation
+        generation_config = copy.deepcopy(model.generation_config)
+        generation_config.update(**generate_kwargs)
+        logits_processor = model._get_logits_processor(
+            generation_config=generation_config,
+            input_ids_seq_length=input_ids.shape[1],
+            encoder_input_ids=input_ids,
+            prefix_allowed_tokens_fn=None,
+            logits_processor=LogitsProcessorList(generate_kwargs.get('logits_processor', [])),
+        )
+        eos_token_ids = generation_config.eos_token_id
+        eos_token_ids = [eos_token_ids] if isinstance(eos_token_ids, int) else eos_token_ids or []
+
+        future = self.batcher.submit(
+            input_ids[0],
+            generate_kwargs.get('past_key_values'),
+            max_new_tokens=generation_config.max_new_tokens,
+            logits_processor=logits_processor,
+            eos_token_ids=eos_token_ids,
+            streamer=generate_kwargs.get('streamer'),
+        )
+
+        # The other inputs are passed on as they are, the postprocess step of each pipeline reads its own keys
+        return {**model_inputs, 'generated_sequence': future.result()[None]}
+
+    def _seed_sampling(self, generate_kwargs: dict, seed: int) -> dict:
+        """
+        Make the sampling of a generation use its own random generator.
+
+        Parameters:
+            generate_kwargs (dict): The arguments passed to `generate`.
+            seed (int): The seed of the random generator.
+
+        Returns:
+            dict: The arguments of `generate`. When the generation samples, the sampling settings are replaced
+                  by a SeededSamplingProcessor and greedy decoding, so concurrent generations with the same seed
+                  give the same responses as serial ones. Greedy generations are returned unchanged.
+        """
+        generation_config = copy.deepcopy(self.model.model.generation_config)
+        sampling_kwargs = {
+            name: generate_kwargs.pop(name) for name in ('do_sample',) + self.SAMPLING_PARAMETERS if name in generate_kwargs
+        }
+        generation_config.update(**sampling_kwargs)
+
+        if not generation_config.do_sample:
+            return {**generate_kwargs, **sampling_kwargs}
+
+        generator = torch.Generator(device=self.model.model.device).manual_seed(seed)
+        logits_warper = self.model.model._get_logits_warper(generation_config)
+        logits_processor = LogitsProcessorList(generate_kwargs.pop('logits_processor', []))
+        logits_processor.append(SeededSamplingProcessor(generator, logits_warper))
+
+        return {**generate_kwargs, 'do_sample': False, 'logits_processor': logits_processor}
+
+    def _record_speculation(self, num_tokens: int, draft_tokens: int, target_passes: int, stats: dict):
+        """
+        Record the statistics of a generation using the draft model.
+
+        Parameters:
+            num_tokens (int): The number of generated tokens.
+            draft_tokens (int): The number of tokens proposed by the draft model, one per forward pass.
+            target_passes (int): The number of forward passes of the model verifying the proposed tokens.
+            stats (dict): The dictionary filled with the statistics of the generation.
+
+        Each verification pass adds the accepted tokens and one token chosen by the model.
+        """
+        accepted_tokens = num_tokens - target_passes
+        stats['draft_tokens'] = draft_tokens
+        stats['accepted_tokens'] = accepted_tokens
+        stats['acceptance_rate'] = accepted_tokens / draft_tokens if draft_tokens > 0 else 0.0
+        stats['target_passes'] = target_passes
+
+        with self._speculation_lock:
+            self._speculation_totals['generations'] += 1
+            self._speculation_totals['generated_tokens'] += num_tokens
+            self._speculation_totals['draft_tokens'] += draft_tokens
+            self._speculation_totals['accepted_tokens'] += accepted_tokens
+            self._speculation_totals['target_passes'] += target_passes
+
+        if self.verbose:
+            print(f'Draft model proposed {draft_tokens} tokens, accepted {accepted_tokens}, '
+                  f'{num_tokens} tokens generated in {target_passes} forward passes')
+
+    def speculation_stats(self) -> dict:
+        """
+        Get the statistics of the generations using the draft model.
+
+        Returns:
+            dict: The number of 'generations', and the 'generated_tokens', 'draft_tokens', 'accepted_tokens' and
+                  'target_passes' over them, with the 'acceptance_rate' of the proposed tokens and the
+                  'tokens_per_pass' of the model. None without a draft model.
+        """
+        if self.draft is None:
+            return None
+
+        with self._speculation_lock:
+            stats = dict(self._speculation_totals)
+
+        stats['acceptance_rate'] = stats['accepted_tokens'] / stats['draft_tokens'] if stats['draft_tokens'] else 0.0
+        stats['tokens_per_pass'] = stats['generated_tokens'] / stats['target_passes'] if stats['target_passes'] else 0.0
+
+        return stats
+
+    def stats(self) -> dict:
+        """
+        Report the batch size and queue delay histograms of the continuous batching.
+
+        Returns:
+            dict: The histogram snapshots, or an empty dictionary if batching is disabled.
+        """
+        return self.batcher.stats() if self.batcher is not None else {}
+
+    def _prefill(self, session: ChatSession, input_ids: torch.Tensor):
+        """
+        Compute the past key/value tensors of a prompt, reusing the ones cached from the previous turn.
+
+        Parameters:
+            session (ChatSession): The conversation state of the session.
+            input_ids (torch.Tensor): The token ids of the prompt, with shape (1, sequence length).
+
+        Returns:
+            The past key/value tensors of all the prompt tokens except the last one, which `generate` feeds
+            to the model, or None if the prompt has a single token.
+        """
+        start_time = time.time()
+        kv_cache = session.kv_cache
+        input_ids = input_ids.to(self.model.model.device)
+
+        # The cache stays on its previous device when the model moved during a request of the session
+        kv_cache.to(self.model.model.device)
+
+        # Reuse the keys and values of the prefix shared with the previous turn
+        past_key_values, num_cached = kv_cache.reuse(input_ids[0])
+
+        # Run the prefill pass only on the tokens that are not cached yet
+        num_prefill = input_ids.shape[1] - 1 - num_cached
+        if num_prefill > 0:
+            with torch.inference_mode():
+                outputs = self.model.model(
+                    input_ids[:, num_cached:-1],
+                    past_key_values=past_key_values,
+                    use_cache=True,
+                )
+            past_key_values = outputs.past_key_values
+
+        kv_cache.store(input_ids[0, :-1], past_key_values)
+        self._trim_kv_caches(session)
+        kv_cache.prefilled_tokens = max(num_prefill, 0)
+        kv_cache.prefill_time = time.time() - start_time
+
+        if self.verbose:
+            print(f'Reused {num_cached} cached tokens, prefilled {kv_cache.prefilled_tokens} tokens '
+                  f'in {kv_cache.prefill_time} seconds')
+
+        return past_key_values
+
+    def _trim_kv_caches(self, session: ChatSession):
+        """
+        Drop the caches of the least recently used conversations until all the caches fit in `kv_cache_total_bytes`.
+
+        The conversations with a running request are skipped instead of waited for. The cache of `session` is
+        only cropped when the caches of the other conversations do not leave it enough room.
+        """
+        if self.kv_cache_total_bytes is None:
+            return
+
+        # The sessions are listed from the least to the most recently used
+        others = [other for other in self.sessions.values() if other is not session]
+        total_bytes = session.kv_cache.nbytes + sum(other.kv_cache.nbytes for other in others)
+        for other in others:
+            if total_bytes <= self.kv_cache_total_bytes:
+                return
+            if not other.kv_cache.nbytes or not other.lock.acquire(blocking=False):
+                continue
+            try:
+                total_bytes -= other.kv_cache.nbytes
+                other.kv_cache.clear()
+            finally:
+                other.lock.release()
+
+        if total_bytes > self.kv_cache_total_bytes:
+            session.kv_cache.fit(max(self.kv_cache_total_bytes - (total_bytes - session.kv_cache.nbytes), 0))
+
+    def _count_tokens(self, text: str) -> int:
+        """
+        Count the tokens of a text with the tokenizer of the model.
+        """
+        return len(self.model.tokenizer(text, add_special_tokens=False)['input_ids'])
+
+    def warmup(self):
+        """
+        Run a short synthetic generation to trigger lazy allocations before serving requests.
+
+        The warm-up prompt is sent directly to the pipeline, so the conversation history is not modified.
+        """
+        with torch.inference_mode():
+            self.model('Hello!', max_new_tokens=1)
+            if self.draft is not None:
+                self.draft.model('Hello!', max_new_tokens=1)
+
+    def memory_footprint(self) -> int:
+        """
+        Return the number of bytes used by the model weights, including the weights of the draft model, and the
+        bytes the cached keys and values of the conversations may use.
+        """
+        return (
+            super().memory_footprint()
+            + (self.draft.memory_footprint() if self.draft is not None else 0)
+            + (self.kv_cache_total_bytes or 0)
+        )
+
+    def demote(self) -> bool:
+        """
+        Move the weights of the model and its draft model and the cached keys and values of the conversations
+        to host memory. The model must not be running, the model registry only demotes the models without
+        requests in use.
+
+        Returns:
+            bool: Whether the weights were moved. False if the model already runs in host memory, or is
+                  dispatched over several devices.
+        """
+        if not super().demote():
+            return False
+
+        if self.draft is not None:
+            self.draft.demote()
+        self._move_kv_caches('cpu')
+        return True
+
+    def promote(self):
+        """
+        Move the weights of a demoted model and its draft model and the cached keys and values of the
+        conversations back to the device of its execution mode. The model must not be running.
+        """
+        super().promote()
+        if self.draft is not None:
+            self.draft.promote()
+        self._move_kv_caches(self.model.model.device)
+
+    def _move_kv_caches(self, device):
+        """
+        Move the cached keys and values of the conversations to a device.
+
+        The conversations with a running request are skipped instead of waited for, since the model registry
+        moves the models while it holds its lock. Their caches are moved by `_prefill` on their next turn.
+        """
+        for session in self.sessions.values():
+            if not session.lock.acquire(blocking=False):
+                continue
+            try:
+                session.kv_cache.to(device)
+            finally:
+                session.lock.release()
+
     def release(self):
         """
         Release resources associated with the model.
         """
+        if self.batcher is not None:
+            self.batcher.close()
+        del self.batcher
+
+        if self.draft is not None:
+            self._draft_passes.remove()
+            self._target_passes.remove()
+            self.draft.release()
+        del self.draft
+
         super().release()
-        del self.conversation_history
+        del self.sessions
+        del self.profiler
@@ -0,0 +1,94 @@
+import itertools
+import torch
+
+# Execution modes a model can be loaded with
+EXECUTION_MODES = ('fp32', 'bf16', 'int8')
+
+# Data type of the weights loaded for each execution mode. The int8 mode loads fp32 weights and then
+# quantizes the Linear layers.
+TORCH_DTYPES = {
+    'fp32': torch.float32,
+    'bf16': torch.bfloat16,
+    'int8': torch.float32,
+}
+
+
+def get_torch_dtype(execution_mode: str) -> torch.dtype:
+    """
+    Get the data type of the weights loaded for an execution mode.
+
+    Args:
+        execution_mode (str): The execution mode, one of 'fp32', 'bf16' or 'int8'.
+
+    Returns:
+        torch.dtype: The data type passed to `from_pretrained`.
+    """
+    if execution_mode not in EXECUTION_MODES:
+        raise ValueError(f'Unknown execution mode {execution_mode}, expected one of {EXECUTION_MODES}')
+
+    return TORCH_DTYPES[execution_mode]
+
+
+def apply_execution_mode(module: torch.nn.Module, execution_mode: str) -> torch.nn.Module:
+    """
+    Put a loaded model in its inference configuration.
+
+    Args:
+        module (torch.nn.Module): The loaded model.
+        execution_mode (str): The execution mode, one of 'fp32', 'bf16' or 'int8'.
+
+    Returns:
+        torch.nn.Module: The model in evaluation mode. With the 'int8' mode, its Linear layers are replaced
+                         in place by dynamically quantized int8 layers, which only run on CPU.
+    """
+    get_torch_dtype(execution_mode)  # Validate the execution mode
+
+    module.eval()
+    if execution_mode == 'int8':
+        module = torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+    return module
+
+
+def get_device(execution_mode: str) -> str:
+    """
+    Get the device a model is loaded on for an execution mode.
+
+    Args:
+        execution_mode (str): The execution mode, one of 'fp32', 'bf16' or 'int8'.
+
+    Returns:
+        str: 'cuda' if a GPU is available, except for the 'int8' mode whose quantized layers only run on CPU,
+             otherwise 'cpu'.
+    """
+    get_torch_dtype(execution_mode)  # Validate the execution mode
+
+    return 'cuda' if torch.cuda.is_available() and execution_mode != 'int8' else 'cpu'
+
+
+def move_modules(modules: list, device: str) -> bool:
+    """
+    Move loaded models to a device, such as the host memory ('cpu') to free the memory of a GPU.
+
+    Args:
+        modules (list): The torch modules of a model.
+        device (str): The device to move them to.
+
+    Returns:
+        bool: Whether the modules were moved. They are not moved if they are already all on the device, or if
+              one of them is dispatched over several devices by accelerate (`device_map="auto"`).
+    """
+    device_types = set()
+    for module in modules:
+        device_map = getattr(module, 'hf_device_map', None)
+        if device_map and len(set(device_map.values())) > 1:
+            return False
+        device_types.update(tensor.device.type for tensor in itertools.chain(module.parameters(), module.buffers()))
+
+    if device_types <= {torch.device(device).type}:
+        return False
+
+    for module in modules:
+        module.to(device)
+
+    return True
@@ -1,13 +1,33 @@
+import os
+import pathlib
+import itertools
 import torch
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
 from transformers import ViTImageProcessor, ViTForImageClassification
+from multihugginggradio.models.model_registry import get_module_size
+from multihugginggradio.models.model_store import ModelStore
+from multihugginggradio.models.execution_mode import apply_execution_mode, get_torch_dtype
+from multihugginggradio.utils.batching.micro_batcher import MicroBatcher
+from multihugginggradio.utils.cache.result_cache import ResultCache, make_key
+from multihugginggradio.utils.profiling.stage_profiler import StageProfiler
 
 
 class ImageClassModel:
+    # File extensions of the images found by classify_directory
+    IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+
     def __init__(
         self,
         model_name: str = 'google/vit-base-patch16-224',
         verbose: bool = False,
+        max_batch_size: int = 1,
+        max_wait_ms: float = 0,
+        execution_mode: str = 'fp32',
+        cache: ResultCache = None,
+        store: ModelStore = None,
     ):
         """
         Initialize an image classification model.
@@ -15,11 +35,50 @@ class ImageClassModel:
         Args:
             model_name (str): The name or path of the pre-trained model to load.
             verbose (bool): Whether to enable verbose mode for debugging (default is False).
+            max_batch_size (int): Maximum number of concurrent requests classified in one batch. Batching is
+                                  disabled when it is 1 (default is 1).
+            max_wait_ms (float): Maximum number of milliseconds a request waits for other requests to fill
+                                 its batch (default is 0).
+            execution_mode (str): Precision the model runs with: 'fp32', 'bf16' or 'int8' (dynamically quantized
+                                  Linear layers, CPU only) (default is 'fp32').
+            cache (ResultCache): Optional cache of the predicted labels, keyed by the model and the image
+                                 content (default is None).
+            store (ModelStore): Optional store the model is converted into on its first load, and mapped from on
+                                the next loads (default is None, which loads the model from its checkpoint).
+
+        Each forward pass is timed by stage ('preprocess', 'forward' and 'postprocess') with the `profiler`,
+        which can also record the next forward passes with the torch profiler.
         """
-        # Initialize the ViT image processor and model
-        self.processor = ViTImageProcessor.from_pretrained(model_name)
-        self.model = ViTForImageClassification.from_pretrained(model_name)
+        # Initialize the ViT image processor and model in its inference configuration
+        torch_dtype = get_torch_dtype(execution_mode)
+        if store is None:
+            self.processor = ViTImageProcessor.from_pretrained(model_name)
+            self.model = ViTForImageClassification.from_pretrained(model_name, torch_dtype=torch_dtype)
+        else:
+            # Convert the model once, then map its converted weights
+            directory = store.convert(model_name, execution_mode, lambda path, scratch_dir: self._convert(
+                model_name, torch_dtype, path, store.max_shard_size,
+            ))
+            self.processor = ViTImageProcessor.from_pretrained(directory)
+            self.model = store.load_modules(directory, {'': ViTForImageClassification}, torch_dtype)['']
+        apply_execution_mode(self.model, execution_mode)
+        self.model_name = model_name
+        self.execution_mode = execution_mode
+        self.cache = cache
         self.verbose = verbose
+        self.profiler = StageProfiler(model_name)
+
+        # Group concurrent requests into batches processed by a background worker
+        self.batcher = MicroBatcher(self.infer_many, max_batch_size, max_wait_ms) if max_batch_size > 1 else None
+
+    @staticmethod
+    def _convert(model_name: str, torch_dtype, path: str, max_shard_size: str):
+        """
+        Save the image processor and the model cast to a data type as safetensors shards.
+        """
+        ViTImageProcessor.from_pretrained(model_name).save_pretrained(path)
+        model = ViTForImageClassification.from_pretrained(model_name, torch_dtype=torch_dtype)
+        model.save_pretrained(path, safe_serialization=True, max_shard_size=max_shard_size)
 
     def infer(self, image, seed: int = 33, return_logits: bool = False):
         """
@@ -27,31 +86,203 @@ class ImageClassModel:
 
         Args:
             image (np.array): The input image(s) to classify.
-            seed (int): Random seed for reproducibility (default is 33).
+            seed (int): Unused, the classification does not depend on random numbers. Kept for compatibility
+                        with the other models (default is 33).
             return_logits (bool): Whether to return an array with the scores per class.
 
         Returns:
             str: The predicted class label for the input image.
             np.array: If return_logits is True returns an array with the scores per class.
         """
-        # Set the random seed for reproducibility
-        torch.manual_seed(seed)
-
-        # Preprocess the input image and obtain model predictions
-        inputs = self.processor(images=image, return_tensors="pt")
-        outputs = self.model(**inputs)
-        logits = outputs.logits
-        predicted_class_idx = logits.argmax(-1).item()
+        # Reuse the label of an identical image classified before
+        if self.cache is not None and not return_logits:
+            key = make_key('Image Classification', self.model_name, self.execution_mode, image)
+            return self.cache.get_or_compute(key, lambda: self._classify(image)[0])
 
-        # Map the class index to the corresponding label and return it
-        predicted_class = self.model.config.id2label[predicted_class_idx]
+        predicted_class, logits = self._classify(image)
 
         return predicted_class if not return_logits else (predicted_class, logits)
 
+    def _classify(self, image) -> tuple:
+        """
+        Classify an image in a batch with the concurrent requests, if batching is enabled.
+        """
+        if self.batcher is not None:
+            return self.batcher.submit(image).result()
+
+        return self.infer_many([image])[0]
+
+    def infer_many(self, images: list) -> list:
+        """
+        Classify several images with a single forward pass of the model.
+
+        Args:
+            images (list): The input images to classify.
+
+        Returns:
+            list: A tuple per image with the predicted class label and the scores per class, with shape
+                  (1, number of classes).
+        """
+        with self.profiler.run():
+            # Preprocess the input images and obtain model predictions
+            with self.profiler.stage('preprocess'):
+                pixel_values = self._preprocess(images)
+            with self.profiler.stage('forward'), torch.inference_mode():
+                logits = self.model(pixel_values=pixel_values).logits
+
+            # Map the class indices to the corresponding labels
+            with self.profiler.stage('postprocess'):
+                predicted_class_indices = logits.argmax(-1).tolist()
+                predictions = [
+                    (self.model.config.id2label[predicted_class_idx], logits[index:index + 1])
+                    for index, predicted_class_idx in enumerate(predicted_class_indices)
+                ]
+
+        return predictions
+
+    def infer_batch(
+        self,
+        images,
+        batch_size: int = 8,
+        top_k: int = 5,
+        num_workers: int = 2,
+        prefetch: int = 2,
+    ):
+        """
+        Classify a stream of images in fixed-size batches.
+
+        Images are decoded and preprocessed by a thread pool while the model runs the previous batch. At
+        most `prefetch` batches are read ahead, so memory stays flat however many images the stream has.
+        The preprocessing overlaps with the model, so only the 'forward' and 'postprocess' stages of the
+        batches are timed.
+
+        Args:
+            images (iterable): The input images, as file paths, PIL images or np.arrays.
+            batch_size (int): Number of images classified in one forward pass (default is 8).
+            top_k (int): Number of most likely labels returned per image (default is 5).
+            num_workers (int): Number of threads decoding and preprocessing images (default is 2).
+            prefetch (int): Number of batches preprocessed ahead of the model (default is 2).
+
+        Yields:
+            list: The top-k (label, probability) pairs of each image, in the order of the input images.
+        """
+        images = iter(images)
+        top_k = min(top_k, self.model.config.num_labels)
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            pending = deque()
+
+            def read_ahead():
+                # Start preprocessing the next batches until `prefetch` batches are in flight
+                while len(pending) < prefetch:
+                    batch = list(itertools.islice(images, batch_size))
+                    if not batch:
+                        return
+                    pending.append(executor.submit(self._preprocess, batch))
+
+            read_ahead()
+            while pending:
+                pixel_values = pending.popleft().result()
+                read_ahead()
+
+                # Classify the batch and keep the most likely labels of each image
+                with self.profiler.run():
+                    with self.profiler.stage('forward'), torch.inference_mode():
+                        logits = self.model(pixel_values=pixel_values).logits
+                    with self.profiler.stage('postprocess'):
+                        probabilities, indices = logits.softmax(-1).topk(top_k, dim=-1)
+
+                for image_probabilities, image_indices in zip(probabilities.tolist(), indices.tolist()):
+                    yield [
+                        (self.model.config.id2label[index], probability)
+                        for index, probability in zip(image_indices, image_probabilities)
+                    ]
+
+    def classify_directory(self, directory: str, recursive: bool = False, **kwargs):
+        """
+        Classify the images of a directory in batches.
+
+        Args:
+            directory (str): Path of the directory with the images.
+            recursive (bool): Whether to also classify the images of the subdirectories (default is False).
+            **kwargs: Additional arguments passed to infer_batch (batch_size, top_k, num_workers, prefetch).
+
+        Yields:
+            tuple: The path of each image, sorted by name, and its top-k (label, probability) pairs.
+
+        Example usage:
+        ```
+        model = ImageClassModel()
+        for path, predictions in model.classify_directory('photos', top_k=3):
+            print(path, predictions)
+        ```
+        """
+        pattern = '**/*' if recursive else '*'
+        paths = sorted(
+            str(path) for path in pathlib.Path(directory).glob(pattern)
+            if path.is_file() and path.suffix.lower() in self.IMAGE_EXTENSIONS
+        )
+
+        yield from zip(paths, self.infer_batch(paths, **kwargs))
+
+    def _preprocess(self, images: list) -> torch.Tensor:
+        """
+        Decode a batch of images and convert them to the pixel values expected by the model, in its data type.
+        """
+        images = [
+            Image.open(image).convert('RGB') if isinstance(image, (str, os.PathLike)) else image
+            for image in images
+        ]
+
+        return self.processor(images=images, return_tensors="pt")['pixel_values'].to(self.model.dtype)
+
+    def stats(self) -> dict:
+        """
+        Report the batch size and queue delay histograms of the request batching.
+
+        Returns:
+            dict: The histogram snapshots, or an empty dictionary if batching is disabled.
+        """
+        return self.batcher.stats() if self.batcher is not None else {}
+
+    def warmup(self):
+        """
+        Classify a blank 224x224 image to trigger lazy allocations before serving requests.
+        """
+        self.infer_many([Image.new('RGB', (224, 224))])
+
+    def demote(self) -> bool:
+        """
+        Keep the model loaded in host memory, where it already runs.
+
+        Returns:
+            bool: False, the model always runs on CPU so there is no device memory to free.
+        """
+        return False
+
+    def promote(self):
+        """
+        Nothing to do, the model is never demoted.
+        """
+
+    def memory_footprint(self) -> int:
+        """
+        Return the number of bytes used by the model weights.
+        """
+        return get_module_size(self.model)
+
     def release(self):
         """
         Release resources associated with the model.
         """
+        if self.batcher is not None:
+            self.batcher.close()
+
+        del self.batcher
         del self.processor
         del self.model
+        del self.model_name
+        del self.execution_mode
+        del self.cache
         del self.verbose
+        del self.profiler
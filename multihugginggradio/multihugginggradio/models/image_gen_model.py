@@ -1,12 +1,50 @@
+import os
+import json
+import inspect
 import torch
-from diffusers import DiffusionPipeline
+import diffusers
+import transformers
+from diffusers import (
+    DDIMScheduler,
+    DiffusionPipeline,
+    DPMSolverMultistepScheduler,
+    EulerAncestralDiscreteScheduler,
+    EulerDiscreteScheduler,
+    UniPCMultistepScheduler,
+)
+from multihugginggradio.models.model_registry import get_module_size
+from multihugginggradio.models.model_store import ModelStore
+from multihugginggradio.models.execution_mode import apply_execution_mode, get_device, get_torch_dtype, move_modules
+from multihugginggradio.utils.batching.micro_batcher import MicroBatcher
+from multihugginggradio.utils.cache.result_cache import ResultCache, make_key
+from multihugginggradio.utils.profiling.stage_profiler import StageProfiler
 
 
 class ImageGenModel:
+    # Schedulers that can replace the default scheduler of the pipeline, multistep solvers need fewer steps
+    SCHEDULERS = {
+        'default': None,
+        'dpm-solver': DPMSolverMultistepScheduler,
+        'unipc': UniPCMultistepScheduler,
+        'euler': EulerDiscreteScheduler,
+        'euler-ancestral': EulerAncestralDiscreteScheduler,
+        'ddim': DDIMScheduler,
+    }
+
+    # Names of the autoencoder components of the pipelines, whose decoder is timed
+    AUTOENCODERS = ('vae', 'vqvae', 'movq')
+
     def __init__(
         self,
         model_name: str,
         verbose: bool = False,
+        execution_mode: str = 'bf16',
+        cache: ResultCache = None,
+        presets: dict = None,
+        default_preset: str = None,
+        max_batch_size: int = 1,
+        max_wait_ms: float = 0,
+        store: ModelStore = None,
     ):
         """
         Initialize an ImageGenModel class using the Diffusers library.
@@ -14,11 +52,32 @@ class ImageGenModel:
         Parameters:
             model_name (str): The name or path of the pre-trained image generation model to be used.
             verbose (bool): Flag to display debug prints. Defaults to False.
+            execution_mode (str): Precision the model runs with: 'fp32', 'bf16' or 'int8' (dynamically quantized
+                                  Linear layers, CPU only). Defaults to 'bf16'.
+            cache (ResultCache): Optional cache of the generated images, keyed by the model and the generation
+                                 parameters. Defaults to None.
+            presets (dict): Named generation settings, each a dictionary with the 'num_inference_steps' and the
+                            'scheduler' (one of `SCHEDULERS`) to use. Pipelines without a `scheduler` component,
+                            such as unCLIP, ignore them. Defaults to None.
+            default_preset (str): Preset used when no preset is requested. Defaults to None, which uses the
+                                  default steps and scheduler of the pipeline.
+            max_batch_size (int): Maximum number of concurrent requests generated in one batched denoising pass.
+                                  Only requests with the same guidance scale, steps and scheduler are batched
+                                  together. Batching is disabled when it is 1. Defaults to 1.
+            max_wait_ms (float): Maximum number of milliseconds a request waits for other requests to fill its
+                                 batch. Defaults to 0.
+            store (ModelStore): Optional store the pipeline is converted into on its first load, and mapped from on
+                                the next loads. Defaults to None, which loads the pipeline from its checkpoint.
 
         This class wraps the Diffusers `DiffusionPipeline.from_pretrained` function to create an instance of the
         ImageGenModel. The pipeline allows for easy image generation using pre-trained models from Diffusers. The
         `ImageGenModel` class provides a convenient interface for using the image generation pipeline.
 
+        Each generation is timed with the `profiler`: the whole 'pipeline' call, and inside it the forward
+        passes of each model of the pipeline, summed over the denoising steps ('unet', 'text_encoder',
+        'vae_decode', ...). The rest of the pipeline call is spent in the scheduler and the conversion of
+        the images. The profiler can also record the next generations with the torch profiler.
+
         Example usage:
         ```
         model = ImageGenModel(model_name="CompVis/stable-diffusion-v1-4")
@@ -26,15 +85,90 @@ class ImageGenModel:
         print(output)
         ```
         """
-        self.model = DiffusionPipeline.from_pretrained(
+        if store is None:
+            self.model = self._load_pipeline(model_name, execution_mode, offload_folder='offload')
+        else:
+            # Convert the pipeline once, offloading to a scratch directory of the store, then map its converted weights
+            directory = store.convert(model_name, execution_mode, lambda path, scratch_dir: self._load_pipeline(
+                model_name, execution_mode, offload_folder=scratch_dir,
+            ).save_pretrained(path, safe_serialization=True))
+            self.model = self._load_stored_pipeline(directory, execution_mode, store)
+        self.model_name = model_name
+        self.execution_mode = execution_mode
+        self.cache = cache
+        self.presets = presets or {}
+        self.default_preset = default_preset
+        self.verbose = verbose
+
+        # Put every model of the pipeline in its inference configuration
+        for module in self._modules():
+            apply_execution_mode(module, execution_mode)
+
+        # Time the forward passes of each model of the pipeline
+        self.profiler = StageProfiler(model_name)
+        for name, component in self.model.components.items():
+            if not isinstance(component, torch.nn.Module):
+                continue
+
+            # Pipelines only call the decoder of their autoencoder, through its `decode` method
+            if name in self.AUTOENCODERS and hasattr(component, 'decoder'):
+                self.profiler.time_module(component.decoder, f'{name}_decode')
+            else:
+                self.profiler.time_module(component, name)
+
+        # Merge concurrent requests with the same generation settings into batched denoising passes
+        self.batcher = MicroBatcher(
+            self._generate_requests,
+            max_batch_size,
+            max_wait_ms,
+            batch_key=lambda request: request[2:],
+        ) if max_batch_size > 1 else None
+
+    @staticmethod
+    def _load_pipeline(model_name: str, execution_mode: str, offload_folder: str) -> DiffusionPipeline:
+        """
+        Load a pipeline from its checkpoint.
+        """
+        return DiffusionPipeline.from_pretrained(
             model_name,                  # Model to be used from Diffusers
-            torch_dtype=torch.bfloat16,  # Specify the data type for PyTorch tensors
-            device_map="auto",           # Automatically select the device for computation
-            offload_folder="offload",    # Folder to offload the model if needed
+            torch_dtype=get_torch_dtype(execution_mode),  # Specify the data type for PyTorch tensors
+            device_map="auto" if execution_mode != 'int8' else None,  # Select the device (quantized models run on CPU)
+            offload_folder=offload_folder,  # Folder to offload the model if needed
         )
-        self.verbose = verbose
 
-    def infer(self, prompt: str, guidance_scale: float = 8.5, seed: int = 33):
+    @staticmethod
+    def _load_stored_pipeline(directory: str, execution_mode: str, store: ModelStore) -> DiffusionPipeline:
+        """
+        Create a pipeline from the components of a pipeline converted into the store.
+
+        The torch models of the pipeline are loaded together by the store, so the shards of all of them are read
+        in parallel. The other components, and the models of other libraries, are loaded by the pipeline.
+        """
+        with open(os.path.join(directory, 'model_index.json')) as file:
+            model_index = json.load(file)
+
+        module_classes = {}
+        for name, value in model_index.items():
+            if not isinstance(value, list) or value[0] not in ('diffusers', 'transformers'):
+                continue
+            module_class = getattr(diffusers if value[0] == 'diffusers' else transformers, value[1], None)
+            if isinstance(module_class, type) and issubclass(module_class, torch.nn.Module):
+                module_classes[name] = module_class
+
+        torch_dtype = get_torch_dtype(execution_mode)
+        modules = store.load_modules(directory, module_classes, torch_dtype, get_device(execution_mode))
+
+        return DiffusionPipeline.from_pretrained(directory, torch_dtype=torch_dtype, **modules)
+
+    def infer(
+        self,
+        prompt: str,
+        guidance_scale: float = 8.5,
+        seed: int = 33,
+        num_inference_steps: int = None,
+        scheduler: str = None,
+        preset: str = None,
+    ):
         """
         Generate an image based on a text prompt using the pre-trained image generation model.
 
@@ -42,30 +176,251 @@ class ImageGenModel:
             prompt (str): The text prompt provided by the user.
             guidance_scale (float): The scale factor for guidance in image generation. Defaults to 8.5.
             seed (int): The seed to be used in the inference. Defaults to 33.
+            num_inference_steps (int): The number of denoising steps. Defaults to None, which uses the preset.
+            scheduler (str): The scheduler running the denoising steps, one of `SCHEDULERS`. Defaults to None,
+                             which uses the preset.
+            preset (str): The name of the preset with the default steps and scheduler. Defaults to None,
+                          which uses the default preset.
 
         Returns:
             PIL.Image.Image: The generated image.
 
         The `guidance_scale` parameter controls the level of
-        guidance in image generation. The `seed` parameter sets the random seed for reproducibility.
+        guidance in image generation. The `seed` parameter seeds the generator of the request, so the image
+        does not depend on the other requests generated in the same batch. Fewer denoising steps with a
+        multistep scheduler such as 'dpm-solver' trade some quality for speed. Since the generation is
+        deterministic for given parameters, the image is taken from the cache when the same parameters
+        were used before.
+
+        Example usage:
+        ```
+        model = ImageGenModel(model_name="CompVis/stable-diffusion-v1-4")
+        image = model.infer(prompt="A description of the desired image.", num_inference_steps=20, scheduler='dpm-solver')
+        ```
+        """
+        num_inference_steps, scheduler = self._resolve_settings(preset, num_inference_steps, scheduler)
+        request = (prompt, seed, guidance_scale, num_inference_steps, scheduler)
+
+        def generate():
+            # Generate the image in a batch with the compatible concurrent requests, if batching is enabled
+            if self.batcher is not None:
+                return self.batcher.submit(request).result()
+
+            return self._generate_requests([request])[0]
+
+        if self.cache is None:
+            return generate()
+
+        key = make_key(
+            'Image Generation', self.model_name, self.execution_mode, prompt, guidance_scale, seed,
+            num_inference_steps, scheduler,
+        )
+
+        return self.cache.get_or_compute(key, generate)
+
+    def infer_batch(
+        self,
+        prompts,
+        seeds: list = None,
+        guidance_scale: float = 8.5,
+        num_inference_steps: int = None,
+        scheduler: str = None,
+        preset: str = None,
+    ) -> list:
+        """
+        Generate several images in one batched denoising pass.
+
+        Parameters:
+            prompts (str or list): A prompt generated once per seed, or a list of prompts.
+            seeds (list): The seed of each image. Defaults to None, which uses the seed 33 for every prompt.
+            guidance_scale (float): The scale factor for guidance in image generation. Defaults to 8.5.
+            num_inference_steps (int): The number of denoising steps. Defaults to None, which uses the preset.
+            scheduler (str): The scheduler running the denoising steps, one of `SCHEDULERS`. Defaults to None,
+                             which uses the preset.
+            preset (str): The name of the preset with the default steps and scheduler. Defaults to None,
+                          which uses the default preset.
+
+        Returns:
+            list: The generated images (PIL.Image.Image), one per prompt and seed pair. Each image is the one
+                  `infer` returns for its prompt and seed. The images are not cached.
 
         Example usage:
         ```
         model = ImageGenModel(model_name="CompVis/stable-diffusion-v1-4")
-        image = model.infer(prompt="A description of the desired image.")
+        variations = model.infer_batch("A description of the desired image.", seeds=[1, 2, 3, 4])
         ```
         """
-        # Set the random seed for reproducibility
-        torch.manual_seed(seed)
+        if isinstance(prompts, str):
+            seeds = seeds if seeds is not None else [33]
+            prompts = [prompts] * len(seeds)
+        else:
+            seeds = seeds if seeds is not None else [33] * len(prompts)
+
+        if len(seeds) != len(prompts):
+            raise ValueError(f'Expected one seed per prompt, got {len(seeds)} seeds for {len(prompts)} prompts')
+
+        num_inference_steps, scheduler = self._resolve_settings(preset, num_inference_steps, scheduler)
+
+        return self._generate_requests([
+            (prompt, seed, guidance_scale, num_inference_steps, scheduler) for prompt, seed in zip(prompts, seeds)
+        ])
+
+    def stats(self) -> dict:
+        """
+        Report the batch size and queue delay histograms of the request batching.
+
+        Returns:
+            dict: The histogram snapshots, or an empty dictionary if batching is disabled.
+        """
+        return self.batcher.stats() if self.batcher is not None else {}
+
+    def warmup(self):
+        """
+        Run a single denoising step on a dummy prompt to trigger lazy allocations before serving requests.
+        """
+        # The schedulers of the pipelines with several ones, such as unCLIP, space their timesteps over two steps
+        num_inference_steps = 1 if 'scheduler' in self.model.components else 2
+
+        with torch.inference_mode():
+            self.model('warm-up', **self._call_kwargs(self.model, num_inference_steps=num_inference_steps))
+
+    def demote(self) -> bool:
+        """
+        Move the models of the pipeline to host memory, freeing the memory of their device.
+
+        Returns:
+            bool: Whether the models were moved. False if the pipeline already runs in host memory, or one of its
+                  models is dispatched over several devices.
+        """
+        return move_modules(self._modules(), 'cpu')
+
+    def promote(self):
+        """
+        Move the models of a demoted pipeline back to the device of its execution mode.
+        """
+        move_modules(self._modules(), get_device(self.execution_mode))
+
+    def memory_footprint(self) -> int:
+        """
+        Return the number of bytes used by the weights of all the pipeline components.
+        """
+        return get_module_size(*self._modules())
+
+    def _generate_requests(self, requests: list) -> list:
+        """
+        Generate the images of requests sharing the same guidance scale, steps and scheduler in one pass.
+
+        Parameters:
+            requests (list): Tuples with the prompt, seed, guidance scale, number of steps and scheduler name.
+
+        Returns:
+            list: The generated image of each request.
+        """
+        _, _, guidance_scale, num_inference_steps, scheduler = requests[0]
+        pipeline = self._get_pipeline(scheduler)
+
+        generate_kwargs = self._call_kwargs(
+            pipeline, guidance_scale=guidance_scale, num_inference_steps=num_inference_steps,
+        )
+
+        # One generator per image, so each image only depends on its own seed
+        generators = [
+            torch.Generator(device=pipeline._execution_device).manual_seed(seed) for _, seed, _, _, _ in requests
+        ]
+
+        # Generate the images using the image generation model
+        with self.profiler.run(), self.profiler.stage('pipeline'), torch.inference_mode():
+            result = pipeline([prompt for prompt, _, _, _, _ in requests], generator=generators, **generate_kwargs)
+
+        return result["images"]
+
+    def _resolve_settings(self, preset: str, num_inference_steps: int, scheduler: str) -> tuple:
+        """
+        Combine the explicit settings of a request with the ones of its preset, which they take precedence over.
+
+        Returns:
+            tuple: The number of denoising steps (None for the pipeline default) and the scheduler name.
+        """
+        preset = preset or self.default_preset
+        if preset is not None and preset not in self.presets:
+            raise ValueError(f'Unknown preset "{preset}", expected one of {list(self.presets)}')
+
+        settings = self.presets[preset] if preset is not None else {}
 
-        # Generate an image using the image generation model
-        result = self.model(prompt, guidance_scale=guidance_scale)
+        # The presets are tuned for pipelines with a single scheduler, pipelines with several ones, such as unCLIP,
+        # keep their own schedulers and numbers of steps
+        if 'scheduler' not in self.model.components:
+            settings = {}
 
-        return result["images"][0]
+        num_inference_steps = num_inference_steps or settings.get('num_inference_steps')
+        scheduler = scheduler or settings.get('scheduler') or 'default'
+
+        if scheduler not in self.SCHEDULERS:
+            raise ValueError(f'Unknown scheduler "{scheduler}", expected one of {list(self.SCHEDULERS)}')
+
+        return num_inference_steps, scheduler
+
+    @staticmethod
+    def _call_kwargs(pipeline: DiffusionPipeline, **settings) -> dict:
+        """
+        Map generation settings to the arguments of the pipeline call whose names end with the setting names.
+
+        Pipelines with several denoising models, such as unCLIP, take one number of steps and one guidance scale
+        per model (`prior_num_inference_steps`, `decoder_guidance_scale`, ...), which all get the setting.
+        Settings that are None are left to the defaults of the pipeline.
+        """
+        parameters = inspect.signature(pipeline.__call__).parameters
+
+        return {
+            parameter: value for name, value in settings.items() if value is not None
+            for parameter in parameters if parameter.endswith(name)
+        }
+
+    def _get_pipeline(self, scheduler: str) -> DiffusionPipeline:
+        """
+        Return a pipeline running with a scheduler.
+
+        A pipeline with a new scheduler is created for every request from the loaded components, so the
+        weights are shared while the state of the scheduler (timesteps, previous model outputs of multistep
+        solvers) is not shared by concurrent requests.
+        """
+        components = self.model.components
+        if 'scheduler' not in components:
+            # Pipelines with several schedulers, such as unCLIP, only run with their own schedulers
+            if self.SCHEDULERS[scheduler] is None:
+                return self.model
+
+            raise ValueError(f'The pipeline of {self.model_name} does not support changing its scheduler')
+
+        # Pipeline options that are not components, such as `requires_safety_checker`
+        options = {
+            name: value for name, value in self.model.config.items()
+            if not name.startswith('_') and name not in components
+        }
+        scheduler_class = self.SCHEDULERS[scheduler] or type(self.model.scheduler)
+        components = {**components, 'scheduler': scheduler_class.from_config(self.model.scheduler.config)}
+
+        return type(self.model)(**components, **options)
+
+    def _modules(self) -> list:
+        """
+        Return the torch modules of the pipeline components (text encoder, UNet, VAE, ...).
+        """
+        return [component for component in self.model.components.values() if isinstance(component, torch.nn.Module)]
 
     def release(self):
         """
         Release resources associated with the model.
         """
+        if self.batcher is not None:
+            self.batcher.close()
+
+        del self.batcher
         del self.model
+        del self.model_name
+        del self.execution_mode
+        del self.cache
+        del self.presets
+        del self.default_preset
         del self.verbose
+        del self.profiler
@@ -0,0 +1,136 @@
+import torch
+
+
+class ConversationCache:
+    def __init__(self, max_bytes: int = None):
+        """
+        Initialize a cache holding the past key/value tensors of one conversation.
+
+        Parameters:
+            max_bytes (int): Maximum number of bytes the cached key/value tensors may use. Tokens at the end of
+                             the cached prefix are dropped to stay within the limit. None disables the limit.
+                             Defaults to None.
+
+        The cache remembers the token ids whose keys and values it holds. A new prompt reuses the cached
+        tensors for the longest prefix it shares with those token ids, so only the newly appended tokens
+        need a prefill pass. When the conversation is edited or truncated the shared prefix shrinks and
+        the rest of the cache is dropped.
+
+        Example usage:
+        ```
+        cache = ConversationCache(max_bytes=512 * 1024 ** 2)
+        past_key_values, num_cached = cache.reuse(input_ids[0])
+        ```
+        """
+        self.max_bytes = max_bytes
+
+        self.token_ids = None
+        self.past_key_values = None
+
+        # Statistics of the last prompt served by the cache
+        self.reused_tokens = 0
+        self.prefilled_tokens = 0
+        self.prefill_time = 0.0
+
+    @property
+    def num_tokens(self) -> int:
+        """
+        int: The number of tokens whose keys and values are cached.
+        """
+        return 0 if self.token_ids is None else len(self.token_ids)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        int: The number of bytes used by the cached key/value tensors.
+        """
+        if self.past_key_values is None:
+            return 0
+
+        return sum(tensor.numel() * tensor.element_size() for layer in self.past_key_values for tensor in layer)
+
+    def reuse(self, token_ids: torch.Tensor):
+        """
+        Get the cached keys and values for the longest prefix shared with a new prompt.
+
+        Parameters:
+            token_ids (torch.Tensor): The token ids of the new prompt (1D tensor).
+
+        Returns:
+            tuple: The past key/value tensors (None if nothing can be reused) and the number of tokens they cover.
+                   At most all the prompt tokens but the last one are reused, as generation needs one input token.
+        """
+        num_cached = 0
+        if self.token_ids is not None:
+            length = min(self.num_tokens, len(token_ids) - 1)
+            cached_ids = self.token_ids[:length].to(token_ids.device)
+            mismatches = (cached_ids != token_ids[:length]).nonzero()
+            num_cached = length if len(mismatches) == 0 else mismatches[0].item()
+
+        self._crop(num_cached)
+        self.reused_tokens = num_cached
+
+        return self.past_key_values, num_cached
+
+    def store(self, token_ids: torch.Tensor, past_key_values):
+        """
+        Store the past key/value tensors of a prompt, cropped to the memory limit.
+
+        Parameters:
+            token_ids (torch.Tensor): The token ids covered by the key/value tensors (1D tensor).
+            past_key_values: The past key/value tensors returned by the model.
+        """
+        if past_key_values is None:
+            self.clear()
+            return
+
+        # Newer transformers versions return cache objects instead of tuples
+        if hasattr(past_key_values, 'to_legacy_cache'):
+            past_key_values = past_key_values.to_legacy_cache()
+
+        self.token_ids = token_ids
+        self.past_key_values = past_key_values
+
+        if self.max_bytes is not None:
+            self.fit(self.max_bytes)
+
+    def fit(self, max_bytes: int):
+        """
+        Drop the tokens at the end of the cached prefix until the cached key/value tensors use at most `max_bytes`.
+
+        Parameters:
+            max_bytes (int): The number of bytes the cached key/value tensors may use.
+        """
+        if self.num_tokens > 0:
+            bytes_per_token = self.nbytes / self.num_tokens
+            self._crop(min(self.num_tokens, int(max_bytes // bytes_per_token)))
+
+    def to(self, device):
+        """
+        Move the cached keys and values to a device, such as the host memory when the model is demoted.
+
+        Parameters:
+            device: The device to move them to.
+        """
+        if self.past_key_values is not None:
+            self.past_key_values = tuple(tuple(tensor.to(device) for tensor in layer) for layer in self.past_key_values)
+
+    def clear(self):
+        """
+        Drop the cached keys and values.
+        """
+        self.token_ids = None
+        self.past_key_values = None
+
+    def _crop(self, num_tokens: int):
+        """
+        Keep only the keys and values of the first `num_tokens` cached tokens.
+        """
+        if num_tokens == 0:
+            self.clear()
+        elif num_tokens < self.num_tokens:
+            # Copy the kept slices so the memory of the dropped tokens is freed
+            self.token_ids = self.token_ids[:num_tokens].clone()
+            self.past_key_values = tuple(
+                tuple(tensor[:, :, :num_tokens].clone() for tensor in layer) for layer in self.past_key_values
+            )
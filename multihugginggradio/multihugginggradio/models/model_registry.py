@@ -0,0 +1,555 @@
+import time
+import itertools
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+
+def get_module_size(*modules) -> int:
+    """
+    Compute the memory held by the parameters and buffers of one or more torch modules.
+
+    Args:
+        *modules: The torch modules to measure.
+
+    Returns:
+        int: The number of bytes used by the tensors of the given modules.
+    """
+    size = 0
+    for module in modules:
+        for tensor in itertools.chain(module.parameters(), module.buffers()):
+            size += tensor.numel() * tensor.element_size()
+
+        # Dynamically quantized layers keep their packed weights outside of the parameters
+        for submodule in module.modules():
+            if hasattr(submodule, '_packed_params') and callable(getattr(submodule, 'weight', None)):
+                for tensor in (submodule.weight(), submodule.bias()):
+                    if tensor is not None:
+                        size += tensor.numel() * tensor.element_size()
+
+    return size
+
+
+class ModelRegistry(Mapping):
+    EVICTION_POLICIES = ('lru', 'lfu')
+
+    # Readiness states reported by `status`
+    LOADING = 'loading'
+    WARMING = 'warming'
+    READY = 'ready'
+    FAILED = 'failed'
+
+    # Residency tiers reported by `residency`: on the device the model runs on, demoted to host memory, or released
+    HOT = 'hot'
+    WARM = 'warm'
+    COLD = 'cold'
+
+    def __init__(
+        self,
+        memory_budget: int = None,
+        eviction_policy: str = 'lru',
+        pinned: list = None,
+        verbose: bool = False,
+        host_memory_budget: int = 0,
+        idle_seconds: float = None,
+        on_transition=None,
+        clock=time.monotonic,
+    ):
+        """
+        Initialize a ModelRegistry that keeps loaded models within a memory budget.
+
+        Parameters:
+            memory_budget (int): Maximum number of bytes that loaded models may use together.
+                                 None disables the limit. Defaults to None.
+            eviction_policy (str): Policy used to choose which model to release when the budget is exceeded,
+                                   either 'lru' (least recently used) or 'lfu' (least frequently used).
+                                   Defaults to 'lru'.
+            pinned (list): Model names that must never be evicted. Defaults to None.
+            verbose (bool): Flag to display debug prints. Defaults to False.
+            host_memory_budget (int): Maximum number of bytes of host memory that the models demoted from their
+                                      device may use together. 0 releases the evicted models instead of demoting
+                                      them, and None disables the limit. Defaults to 0.
+            idle_seconds (float): Number of seconds a model may stay unused before it is moved down one tier,
+                                  checked whenever the registry is accessed. None disables it. Defaults to None.
+            on_transition (callable): Optional function called with the model name, the previous tier, the new
+                                      tier and the seconds the transition took, after each transition between
+                                      tiers. Defaults to None.
+            clock (callable): Function returning the current time in seconds. Defaults to time.monotonic.
+
+        The registry behaves as a read-only mapping from model names to loaded models. Models are added
+        with `get_or_load`, which measures each model through its `memory_footprint` method and evicts
+        unpinned models (calling their `release` method) until the loaded models fit in the budget.
+        Models are loaded outside of the registry lock, so several models can load in parallel, while
+        concurrent requests for a model that is still loading wait for that load instead of starting
+        a second one.
+
+        The memory budget applies to the 'hot' models, loaded on the device they run on. With a host memory
+        budget, a model evicted from the device (or unused for `idle_seconds`) is first demoted to the 'warm'
+        tier with its `demote` method, which moves its weights to host memory, and the next request promotes
+        it back with its `promote` method instead of loading it again. The warm models beyond the host budget
+        (or unused for `idle_seconds` again) are released to the 'cold' tier, and loaded again by their loader
+        on the next request, from the converted weights of the model store if it is configured. Models without
+        these methods, or already running in host memory, are released directly. The duration of every
+        transition is counted in `stats` and reported to `on_transition`.
+
+        The requests hold a `lease` on their model while they use it. A model with a lease is never demoted or
+        released by the budgets or the idle timer: the evictions it would need are deferred until its last lease
+        ends, so a request never loses its model, or has its weights moved to another device, while it runs.
+        Releasing a model explicitly with `release` or `release_all` waits for its leases to end.
+
+        Example usage:
+        ```
+        registry = ModelRegistry(memory_budget=8 * 1024 ** 3)
+        with registry.lease('google/vit-base-patch16-224'):
+            model = registry.get_or_load('google/vit-base-patch16-224', lambda: ImageClassModel(...))
+            print(model.infer(image))
+        print(registry.stats())
+        ```
+        """
+        if eviction_policy not in self.EVICTION_POLICIES:
+            raise ValueError(f'Unknown eviction policy "{eviction_policy}", expected one of {self.EVICTION_POLICIES}')
+
+        self.memory_budget = memory_budget
+        self.eviction_policy = eviction_policy
+        self.pinned = set(pinned or [])
+        self.verbose = verbose
+        self.host_memory_budget = host_memory_budget
+        self.idle_seconds = idle_seconds
+        self.on_transition = on_transition
+        self.clock = clock
+
+        # Loaded models ordered from least to most recently used
+        self._models = OrderedDict()
+        # Size in bytes of every model loaded so far (kept after eviction to make room before a reload)
+        self._sizes = {}
+        # Number of requests served by each loaded model
+        self._uses = {}
+        # Readiness state of every model that is loading, loaded or failed to load
+        self._status = {}
+        # Events set when the load of a model in progress finishes
+        self._pending = {}
+        # Tier of every loaded model and the time it was last used
+        self._tiers = {}
+        self._last_used = {}
+        # Number of requests holding a lease on each model name
+        self._leases = {}
+        self._lock = threading.RLock()
+        # Notified when the last lease of a model ends
+        self._lease_ended = threading.Condition(self._lock)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Number and total seconds of the transitions between tiers, by 'source->target'
+        self.transitions = {}
+
+    def __getitem__(self, model_name: str):
+        return self._models[model_name]
+
+    def __iter__(self):
+        return iter(list(self._models))
+
+    def __len__(self):
+        return len(self._models)
+
+    @property
+    def memory_usage(self) -> int:
+        """
+        int: The number of bytes used by the hot models, on the device they run on.
+        """
+        with self._lock:
+            return sum(self._sizes[model_name] for model_name in self._models if self._tiers[model_name] == self.HOT)
+
+    @property
+    def host_memory_usage(self) -> int:
+        """
+        int: The number of bytes of host memory used by the warm models.
+        """
+        with self._lock:
+            return sum(self._sizes[model_name] for model_name in self._models if self._tiers[model_name] == self.WARM)
+
+    def get_or_load(self, model_name: str, loader, warmup=None):
+        """
+        Return a loaded model, loading it first if it is not in the registry.
+
+        Args:
+            model_name (str): The name of the model.
+            loader (callable): Function without arguments that loads and returns the model.
+            warmup (callable): Optional function called with the loaded model before it is made available,
+                               used to run a synthetic inference that triggers lazy allocations. Defaults to None.
+
+        Returns:
+            The loaded model.
+
+        Raises:
+            RuntimeError: If the model was being loaded by another caller and that load failed.
+        """
+        with self._lock:
+            self._demote_idle(exclude=model_name)
+
+            if model_name in self._models:
+                return self._hit(model_name)
+
+            pending = self._pending.get(model_name)
+            if pending is None:
+                self.misses += 1
+                self._pending[model_name] = threading.Event()
+                self._status[model_name] = self.LOADING
+
+                # Make room beforehand when the size of the model is known from a previous load
+                self._evict(self._sizes.get(model_name, 0), exclude=model_name)
+
+        # Another caller is loading the model, wait for it instead of loading it twice
+        if pending is not None:
+            pending.wait()
+
+            with self._lock:
+                if model_name not in self._models:
+                    raise RuntimeError(f'Model ({model_name}) failed to load')
+
+                return self._hit(model_name)
+
+        try:
+            start_time = time.perf_counter()
+            model = loader()
+            load_seconds = time.perf_counter() - start_time
+
+            if warmup is not None:
+                self._status[model_name] = self.WARMING
+                warmup(model)
+
+            size = self._measure(model)
+        except Exception:
+            with self._lock:
+                self._status[model_name] = self.FAILED
+                self._pending.pop(model_name).set()
+            raise
+
+        with self._lock:
+            # A model loaded again after it was released comes back from the cold tier
+            if model_name in self._sizes:
+                self._record(model_name, self.COLD, self.HOT, load_seconds)
+
+            self._models[model_name] = model
+            self._sizes[model_name] = size
+            self._uses[model_name] = 1
+            self._tiers[model_name] = self.HOT
+            self._last_used[model_name] = self.clock()
+            self._status[model_name] = self.READY
+            self._pending.pop(model_name).set()
+
+            # Enforce the budget now that the real size of the model is known
+            self._evict(0, exclude=model_name)
+
+        return model
+
+    @contextmanager
+    def lease(self, model_name: str):
+        """
+        Context manager marking a model as used by a request until the context exits.
+
+        Args:
+            model_name (str): The name of the model, which may not be loaded yet.
+
+        While the lease is held, the model is neither demoted nor released to make room for other models or
+        because it is idle. Once the last lease of the model ends, the budgets are enforced again, which may
+        move down the models that could not be evicted while they were in use.
+        """
+        with self._lock:
+            self._leases[model_name] = self._leases.get(model_name, 0) + 1
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._leases[model_name] -= 1
+                if not self._leases[model_name]:
+                    del self._leases[model_name]
+                    if model_name in self._models:
+                        self._last_used[model_name] = self.clock()
+
+                    # Apply the evictions deferred while the model was in use
+                    self._evict(0)
+                    self._release_warm(0)
+                    self._lease_ended.notify_all()
+
+    def in_use(self, model_name: str) -> bool:
+        """
+        Tell whether a request holds a lease on a model.
+
+        Args:
+            model_name (str): The name of the model.
+
+        Returns:
+            bool: Whether the model is used by at least one request.
+        """
+        with self._lock:
+            return model_name in self._leases
+
+    def status(self) -> dict:
+        """
+        Report the readiness of the models known to the registry.
+
+        Returns:
+            dict: The state ('loading', 'warming', 'ready' or 'failed') of each model by name.
+        """
+        with self._lock:
+            return dict(self._status)
+
+    def residency(self) -> dict:
+        """
+        Report the tier of the models known to the registry.
+
+        Returns:
+            dict: The tier ('hot', 'warm' or 'cold') of each model loaded so far by name. Released models are cold.
+        """
+        with self._lock:
+            return {
+                model_name: self._tiers[model_name] if model_name in self._models else self.COLD
+                for model_name in self._sizes
+            }
+
+    def pin(self, model_name: str):
+        """
+        Prevent a model from being evicted.
+
+        Args:
+            model_name (str): The name of the model to pin.
+        """
+        with self._lock:
+            self.pinned.add(model_name)
+
+    def unpin(self, model_name: str):
+        """
+        Allow a pinned model to be evicted again.
+
+        Args:
+            model_name (str): The name of the model to unpin.
+        """
+        with self._lock:
+            self.pinned.discard(model_name)
+            self._evict(0)
+
+    def release(self, model_name: str, timeout: float = None):
+        """
+        Release a loaded model and remove it from the registry, once the requests using it finish.
+
+        Args:
+            model_name (str): The name of the model to release.
+            timeout (float): Maximum number of seconds to wait for the leases of the model to end. Defaults to
+                             None, which waits until they end.
+
+        Raises:
+            TimeoutError: If the model is still in use after `timeout` seconds, in which case it is kept.
+
+        A request must not release the model it holds a lease on, since it would wait for its own lease.
+        """
+        with self._lock:
+            if not self._lease_ended.wait_for(lambda: model_name not in self._leases, timeout):
+                raise TimeoutError(f'Model ({model_name}) is still in use after {timeout} seconds')
+
+            model = self._models.pop(model_name)
+            del self._uses[model_name]
+            del self._status[model_name]
+            del self._tiers[model_name]
+            del self._last_used[model_name]
+            model.release()
+
+    def release_all(self, timeout: float = None):
+        """
+        Release every loaded model, including pinned ones, once the requests using them finish.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait for the leases of all the models to end. Defaults
+                             to None, which waits until they end.
+
+        Raises:
+            TimeoutError: If a model is still in use after `timeout` seconds, in which case it and the models
+                          after it are kept.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        with self._lock:
+            for model_name in list(self._models):
+                # A model evicted while waiting for the leases of the previous ones is already released
+                if model_name in self._models:
+                    self.release(model_name, max(deadline - time.monotonic(), 0) if deadline is not None else None)
+
+    def stats(self) -> dict:
+        """
+        Report the state of the registry.
+
+        Returns:
+            dict: The loaded models, the memory usage and budget of the hot models and the host memory usage and
+                  budget of the warm models, the hit, miss and eviction counters, and the number and total
+                  seconds of the transitions between tiers.
+        """
+        with self._lock:
+            return {
+                'models': list(self._models),
+                'memory_usage': self.memory_usage,
+                'memory_budget': self.memory_budget,
+                'host_memory_usage': self.host_memory_usage,
+                'host_memory_budget': self.host_memory_budget,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'transitions': {transition: dict(counts) for transition, counts in self.transitions.items()},
+            }
+
+    def _hit(self, model_name: str):
+        """
+        Count a hit and mark a loaded model as the most recently used one.
+        """
+        self.hits += 1
+        self._uses[model_name] += 1
+        self._last_used[model_name] = self.clock()
+        self._models.move_to_end(model_name)
+
+        # A warm model runs no request, since the models in use are never demoted
+        if self._tiers[model_name] == self.WARM:
+            self._promote(model_name)
+
+        return self._models[model_name]
+
+    def _measure(self, model) -> int:
+        """
+        Return the memory footprint of a model, or 0 if the model does not report it.
+        """
+        memory_footprint = getattr(model, 'memory_footprint', None)
+        return memory_footprint() if memory_footprint is not None else 0
+
+    def _evict(self, required: int, exclude: str = None):
+        """
+        Move unpinned hot models down a tier until `required` extra bytes fit in the memory budget.
+
+        Args:
+            required (int): Number of bytes that must fit in the budget on top of the hot models.
+            exclude (str): Name of a model that must not be evicted. Defaults to None.
+        """
+        if self.memory_budget is None:
+            return
+
+        while self.memory_usage + required > self.memory_budget:
+            candidates = [
+                name for name in self._models
+                if self._tiers[name] == self.HOT and name not in self.pinned and name != exclude
+                and name not in self._leases
+            ]
+            if not candidates:
+                if self.verbose:
+                    print(f'Memory budget of {self.memory_budget} bytes exceeded but no model can be evicted, '
+                          f'the models in use are evicted once their requests finish')
+                return
+
+            if self.eviction_policy == 'lfu':
+                # Candidates are ordered by recency, so ties are broken by the least recently used model
+                victim = min(candidates, key=lambda name: self._uses[name])
+            else:
+                victim = candidates[0]
+
+            if self.verbose:
+                print(f'Evicting Model ({victim}) to stay within the memory budget...')
+
+            self._demote(victim)
+
+    def _demote(self, model_name: str):
+        """
+        Move a hot model to host memory if the host memory budget allows it, otherwise release it.
+        The model must not be in use, its weights are moved while the registry lock is held.
+        """
+        size = self._sizes[model_name]
+        demote = getattr(self._models[model_name], 'demote', None)
+        if demote is not None and (self.host_memory_budget is None or size <= self.host_memory_budget):
+            self._release_warm(size, exclude=model_name)
+
+            start_time = time.perf_counter()
+            if demote():
+                self._tiers[model_name] = self.WARM
+                self._record(model_name, self.HOT, self.WARM, time.perf_counter() - start_time)
+                return
+
+        self._release_cold(model_name)
+
+    def _promote(self, model_name: str):
+        """
+        Move a warm model back to the device it runs on, making room for it in the memory budget first.
+        """
+        # The model leaves the host memory, so the models demoted to make room for it do not release it
+        self._tiers[model_name] = self.HOT
+        try:
+            self._evict(0, exclude=model_name)
+
+            start_time = time.perf_counter()
+            self._models[model_name].promote()
+        except Exception:
+            self._tiers[model_name] = self.WARM
+            raise
+        self._record(model_name, self.WARM, self.HOT, time.perf_counter() - start_time)
+
+    def _release_warm(self, required: int, exclude: str = None):
+        """
+        Release the least recently used warm models until `required` extra bytes fit in the host memory budget.
+        """
+        if self.host_memory_budget is None:
+            return
+
+        while self.host_memory_usage + required > self.host_memory_budget:
+            warm = [
+                name for name in self._models
+                if self._tiers[name] == self.WARM and name != exclude and name not in self._leases
+            ]
+            if not warm:
+                return
+
+            self._release_cold(warm[0])
+
+    def _release_cold(self, model_name: str):
+        """
+        Release a model, which is loaded again by its loader on its next request.
+        """
+        tier = self._tiers[model_name]
+
+        start_time = time.perf_counter()
+        self.release(model_name)
+        self.evictions += 1
+        self._record(model_name, tier, self.COLD, time.perf_counter() - start_time)
+
+    def _demote_idle(self, exclude: str = None):
+        """
+        Move the unpinned models unused for longer than `idle_seconds` down one tier, except the `exclude` model
+        and the models in use.
+        """
+        if self.idle_seconds is None:
+            return
+
+        now = self.clock()
+        for model_name in list(self._models):
+            if (model_name in self.pinned or model_name == exclude or model_name in self._leases
+                    or now - self._last_used[model_name] <= self.idle_seconds):
+                continue
+
+            if self.verbose:
+                print(f'Model ({model_name}) was unused for {now - self._last_used[model_name]:.0f} seconds')
+
+            # The idle time of the next tier starts now
+            self._last_used[model_name] = now
+            if self._tiers[model_name] == self.HOT:
+                self._demote(model_name)
+            else:
+                self._release_cold(model_name)
+
+    def _record(self, model_name: str, source: str, target: str, seconds: float):
+        """
+        Count a transition of a model between tiers and report its duration.
+        """
+        counts = self.transitions.setdefault(f'{source}->{target}', {'count': 0, 'seconds': 0.0})
+        counts['count'] += 1
+        counts['seconds'] += seconds
+
+        if self.verbose:
+            print(f'Model ({model_name}) moved from {source} to {target} in {seconds:.2f} seconds')
+
+        if self.on_transition is not None:
+            self.on_transition(model_name, source, target, seconds)
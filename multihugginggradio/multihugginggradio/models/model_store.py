@@ -0,0 +1,318 @@
+import os
+import json
+import time
+import glob
+import shutil
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ModelStore(object):
+    # Name of the file describing a converted model, written once all its files are saved
+    MANIFEST = 'manifest.json'
+
+    # Version of the layout of the converted models, the models converted with another version are converted again
+    FORMAT_VERSION = 2
+
+    # Bytes read at once when computing the checksums of the files
+    CHUNK_BYTES = 16 * 1024 * 1024
+
+    def __init__(
+        self,
+        root_dir: str,
+        load_threads: int = 8,
+        max_shard_size: str = '2GB',
+        verify_checksums: bool = False,
+        verbose: bool = False,
+    ):
+        """
+        Initialize a ModelStore that keeps local copies of the models converted for fast loading.
+
+        Parameters:
+            root_dir (str): Directory of the converted models, with a subdirectory per model and execution mode.
+            load_threads (int): Number of safetensors shards read in parallel when loading a model. Defaults to 8.
+            max_shard_size (str): Maximum size of each safetensors shard of the converted models, smaller shards
+                                  are read by more threads in parallel. Defaults to '2GB'.
+            verify_checksums (bool): Whether to check the SHA-256 checksums of the files of a converted model each
+                                     time it is loaded. The sizes of the files are always checked. Defaults to False.
+            verbose (bool): Flag to display debug prints. Defaults to False.
+
+        Each model is converted once with `convert`: the model wrapper loads it from its original checkpoint with
+        the data type of its execution mode and saves it to the store as safetensors files, then the store writes
+        a manifest with the size and checksum of every file. The later loads read the weights with `load_modules`,
+        which maps the shards of the converted model in memory and reads them in parallel, without casting them
+        again. The weights are only copied if they are moved to a GPU.
+
+        A model is converted in a temporary directory that is renamed once its manifest is written, so a
+        conversion that fails or is interrupted is never loaded, and the processes converting the same model at
+        once keep the first complete copy.
+
+        Example usage:
+        ```
+        store = ModelStore('model_store')
+        directory = store.convert(model_name, 'bf16', lambda directory, scratch_dir: model.save_pretrained(directory))
+        modules = store.load_modules(directory, {'': GPTNeoXForCausalLM}, torch.bfloat16)
+        ```
+        """
+        self.root_dir = root_dir
+        self.load_threads = load_threads
+        self.max_shard_size = max_shard_size
+        self.verify_checksums = verify_checksums
+        self.verbose = verbose
+
+    def path(self, model_name: str, execution_mode: str) -> str:
+        """
+        Get the directory of a converted model.
+
+        Args:
+            model_name (str): The name or path of the pre-trained model.
+            execution_mode (str): The execution mode the model was converted for.
+
+        Returns:
+            str: The directory of the model in the store, which exists once the model is converted.
+        """
+        # Hub names and local paths are flattened into a single directory name
+        name = model_name.strip('/\\').replace(':', '').replace('/', '--').replace('\\', '--')
+
+        return os.path.join(self.root_dir, name, execution_mode)
+
+    def manifest(self, model_name: str, execution_mode: str) -> dict:
+        """
+        Read the manifest of a converted model.
+
+        Args:
+            model_name (str): The name or path of the pre-trained model.
+            execution_mode (str): The execution mode the model was converted for.
+
+        Returns:
+            dict: The manifest, with the 'model_name', the 'execution_mode', the 'metadata' saved with the model and
+                  the 'bytes' and 'sha256' of each of its 'files'. None if the model is not converted, or its copy
+                  is incomplete or was converted with another version of the store.
+        """
+        try:
+            with open(os.path.join(self.path(model_name, execution_mode), self.MANIFEST)) as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if (manifest.get('format_version') != self.FORMAT_VERSION or manifest.get('model_name') != model_name
+                or manifest.get('execution_mode') != execution_mode):
+            return None
+
+        # Check that every file is complete, which only reads their sizes
+        directory = self.path(model_name, execution_mode)
+        for name, entry in manifest['files'].items():
+            try:
+                if os.path.getsize(os.path.join(directory, name)) != entry['bytes']:
+                    return None
+            except OSError:
+                return None
+
+        return manifest
+
+    def convert(self, model_name: str, execution_mode: str, save) -> str:
+        """
+        Convert a model into the store, unless it is already converted.
+
+        Args:
+            model_name (str): The name or path of the pre-trained model.
+            execution_mode (str): The execution mode the model is converted for.
+            save (callable): Function called with the directory the model is saved to and a scratch directory
+                             (such as the offload folder of a model too large for the memory), which is deleted
+                             once the model is saved. It saves the model cast to the data type of the execution
+                             mode, and may return a dictionary of metadata kept in the manifest.
+
+        Returns:
+            str: The directory of the converted model.
+        """
+        directory = self.path(model_name, execution_mode)
+        manifest = self.manifest(model_name, execution_mode)
+        if manifest is not None and (not self.verify_checksums or self.verify(model_name, execution_mode)):
+            return directory
+
+        if self.verbose:
+            print(f'Converting Model ({model_name}) for the {execution_mode} execution mode into {directory}...')
+
+        start_time = time.perf_counter()
+        parent_dir = os.path.dirname(directory)
+        os.makedirs(parent_dir, exist_ok=True)
+        temporary_dir = tempfile.mkdtemp(prefix=f'.{execution_mode}-', dir=parent_dir)
+        scratch_dir = tempfile.mkdtemp(prefix='.scratch-', dir=parent_dir)
+        try:
+            metadata = save(temporary_dir, scratch_dir)
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+            manifest = {
+                'format_version': self.FORMAT_VERSION,
+                'model_name': model_name,
+                'execution_mode': execution_mode,
+                'created': time.time(),
+                'metadata': metadata or {},
+                'files': self._describe_files(temporary_dir),
+            }
+            with open(os.path.join(temporary_dir, self.MANIFEST), 'w') as file:
+                json.dump(manifest, file, indent=4)
+
+            # Replace an incomplete copy, unless another process completed its conversion in the meantime
+            if os.path.isdir(directory) and self.manifest(model_name, execution_mode) is None:
+                shutil.rmtree(directory, ignore_errors=True)
+            try:
+                os.rename(temporary_dir, directory)
+            except OSError:
+                if self.manifest(model_name, execution_mode) is None:
+                    raise
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+            shutil.rmtree(temporary_dir, ignore_errors=True)
+
+        if self.verbose:
+            print(f'Converted Model ({model_name}) in {time.perf_counter() - start_time:.1f} seconds')
+
+        return directory
+
+    def verify(self, model_name: str, execution_mode: str) -> bool:
+        """
+        Check the checksums of the files of a converted model.
+
+        Args:
+            model_name (str): The name or path of the pre-trained model.
+            execution_mode (str): The execution mode the model was converted for.
+
+        Returns:
+            bool: Whether the model is converted and all its files match their checksums. The manifest of a
+                  corrupted copy is deleted, so the next call to `convert` converts the model again.
+        """
+        manifest = self.manifest(model_name, execution_mode)
+        if manifest is None:
+            return False
+
+        directory = self.path(model_name, execution_mode)
+        names = list(manifest['files'])
+        with ThreadPoolExecutor(max_workers=self.load_threads) as executor:
+            checksums = list(executor.map(lambda name: self._checksum(os.path.join(directory, name)), names))
+
+        for name, checksum in zip(names, checksums):
+            if checksum != manifest['files'][name]['sha256']:
+                if self.verbose:
+                    print(f'File {name} of the converted Model ({model_name}) does not match its checksum')
+                os.remove(os.path.join(directory, self.MANIFEST))
+                return False
+
+        return True
+
+    def load_modules(self, directory: str, module_classes: dict, torch_dtype, device: str = 'cpu') -> dict:
+        """
+        Load torch modules from the safetensors shards of a converted model.
+
+        Args:
+            directory (str): The directory of the converted model.
+            module_classes (dict): The transformers or diffusers model class of each module to load, by the
+                                   subdirectory of the model where its config and shards are saved ('' for the
+                                   model directory itself).
+            torch_dtype (torch.dtype): The data type of the floating point buffers created by the modules, their
+                                       weights keep the data type they were converted to.
+            device (str): The device the modules are loaded on. Defaults to 'cpu'.
+
+        Returns:
+            dict: The modules in evaluation mode, by subdirectory.
+
+        The modules are created without allocating their weights, then the shards of every module are mapped in
+        memory in parallel, and their tensors become the weights of the modules without being copied on the CPU.
+        """
+        import torch
+        from accelerate import init_empty_weights
+        from accelerate.utils import set_module_tensor_to_device
+        from safetensors.torch import load_file
+
+        # Create the modules without their weights, with the default data type their buffers are created with
+        default_dtype = torch.get_default_dtype()
+        modules = {}
+        try:
+            if torch_dtype.is_floating_point:
+                torch.set_default_dtype(torch_dtype)
+            for subfolder, module_class in module_classes.items():
+                with init_empty_weights(include_buffers=False):
+                    modules[subfolder] = self._create_module(module_class, os.path.join(directory, subfolder))
+        finally:
+            torch.set_default_dtype(default_dtype)
+
+        def load_shard(path):
+            # Ask the kernel to read the whole shard ahead, the tensors map its pages
+            if hasattr(os, 'posix_fadvise'):
+                with open(path, 'rb') as file:
+                    os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            return load_file(path)
+
+        shards = [
+            (subfolder, path)
+            for subfolder in modules
+            for path in sorted(glob.glob(os.path.join(directory, subfolder, '*.safetensors')))
+        ]
+        with ThreadPoolExecutor(max_workers=self.load_threads) as executor:
+            state_dicts = executor.map(load_shard, [path for _, path in shards])
+
+            for (subfolder, path), state_dict in zip(shards, state_dicts):
+                module = modules[subfolder]
+                expected = dict(module.named_parameters())
+                expected.update(module.named_buffers())
+                for name, tensor in state_dict.items():
+                    if name not in expected:
+                        raise ValueError(f'Unexpected weight {name} in {path}')
+                    set_module_tensor_to_device(module, name, device, value=tensor, dtype=tensor.dtype)
+
+        for subfolder, module in modules.items():
+            # Weights shared with another weight are only saved once
+            if hasattr(module, 'tie_weights'):
+                module.tie_weights()
+
+            missing = [name for name, parameter in module.named_parameters() if parameter.device.type == 'meta']
+            if missing:
+                raise ValueError(f'Missing weights {missing} in {os.path.join(directory, subfolder)}')
+
+            module.to(device)
+            module.eval()
+
+        return modules
+
+    def _create_module(self, module_class, directory: str):
+        """
+        Create a transformers or diffusers model from the config saved in a directory.
+        """
+        from transformers import GenerationConfig, PreTrainedModel
+
+        if issubclass(module_class, PreTrainedModel):
+            module = module_class(module_class.config_class.from_pretrained(directory))
+            if os.path.exists(os.path.join(directory, 'generation_config.json')):
+                module.generation_config = GenerationConfig.from_pretrained(directory)
+            return module
+
+        return module_class.from_config(module_class.load_config(directory))
+
+    def _describe_files(self, directory: str) -> dict:
+        """
+        Compute the size and checksum of every file of a directory, by path relative to the directory.
+        """
+        names = sorted(
+            os.path.relpath(os.path.join(root, name), directory)
+            for root, _, names in os.walk(directory)
+            for name in names
+        )
+        with ThreadPoolExecutor(max_workers=self.load_threads) as executor:
+            checksums = executor.map(lambda name: self._checksum(os.path.join(directory, name)), names)
+
+        return {
+            name: {'bytes': os.path.getsize(os.path.join(directory, name)), 'sha256': checksum}
+            for name, checksum in zip(names, checksums)
+        }
+
+    def _checksum(self, path: str) -> str:
+        """
+        Compute the SHA-256 hex digest of a file.
+        """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(self.CHUNK_BYTES), b''):
+                digest.update(chunk)
+
+        return digest.hexdigest()
@@ -0,0 +1,139 @@
+import importlib
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+
+
+class TaskPlugin(object):
+    def __init__(self, task: str, module_name: str, class_name: str):
+        """
+        Initialize a task plugin whose model wrapper is imported on first use.
+
+        Parameters:
+            task (str): The name of the task, as used in the configuration (e.g. 'Chat').
+            module_name (str): The dotted name of the module defining the model wrapper.
+            class_name (str): The name of the model wrapper class in the module.
+
+        The modules of the model wrappers import torch, transformers or diffusers, which take seconds and
+        hundreds of megabytes to import. The plugin only records where the wrapper is, so the import is
+        paid by the first request of the task instead of by the startup of the application.
+
+        Example usage:
+        ```
+        plugin = TaskPlugin('Chat', 'multihugginggradio.models.chat_llm', 'ChatLLM')
+        chat_llm = plugin.get_model_class()('databricks/dolly-v2-3b')
+        ```
+        """
+        self.task = task
+        self.module_name = module_name
+        self.class_name = class_name
+
+        self._model_class = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        """
+        bool: Whether the module of the model wrapper was imported.
+        """
+        return self._model_class is not None
+
+    def get_model_class(self):
+        """
+        Get the model wrapper class of the task, importing its module on the first call.
+
+        Returns:
+            type: The model wrapper class.
+        """
+        with self._lock:
+            if self._model_class is None:
+                module = importlib.import_module(self.module_name)
+                self._model_class = getattr(module, self.class_name)
+
+            return self._model_class
+
+
+class TaskRegistry(Mapping):
+    def __init__(self, plugins: list = None):
+        """
+        Initialize a registry of task plugins.
+
+        Parameters:
+            plugins (list): The TaskPlugin of each task, in display order. Defaults to None.
+
+        The registry behaves as a read-only mapping from task names to their plugins. New tasks are added
+        with `register`, and `enabled` selects the tasks a deployment serves.
+
+        Example usage:
+        ```
+        tasks = TASKS.enabled(['Chat'])
+        model_class = tasks.get_model_class('Chat')
+        ```
+        """
+        self._plugins = OrderedDict()
+        for plugin in plugins or []:
+            self._plugins[plugin.task] = plugin
+
+    def __getitem__(self, task: str) -> TaskPlugin:
+        return self._plugins[task]
+
+    def __iter__(self):
+        return iter(self._plugins)
+
+    def __len__(self):
+        return len(self._plugins)
+
+    def register(self, task: str, module_name: str, class_name: str) -> TaskPlugin:
+        """
+        Add a task, or replace the plugin of an existing task.
+
+        Parameters:
+            task (str): The name of the task.
+            module_name (str): The dotted name of the module defining the model wrapper.
+            class_name (str): The name of the model wrapper class in the module.
+
+        Returns:
+            TaskPlugin: The plugin of the task.
+        """
+        plugin = self._plugins[task] = TaskPlugin(task, module_name, class_name)
+        return plugin
+
+    def enabled(self, tasks: list) -> 'TaskRegistry':
+        """
+        Select the tasks served by a deployment.
+
+        Parameters:
+            tasks (list): The names of the enabled tasks.
+
+        Returns:
+            TaskRegistry: A registry with the plugins of the enabled tasks, in the given order. The plugins are
+                          shared, so a module imported through one registry is not imported again.
+        """
+        unknown = [task for task in tasks if task not in self._plugins]
+        if unknown:
+            raise ValueError(f'Unknown tasks {unknown}, expected some of {list(self._plugins)}')
+
+        return TaskRegistry([self._plugins[task] for task in tasks])
+
+    def get_model_class(self, task: str):
+        """
+        Get the model wrapper class of a task, importing its module on first use.
+
+        Parameters:
+            task (str): The name of the task.
+
+        Returns:
+            type: The model wrapper class.
+        """
+        if task not in self._plugins:
+            raise ValueError(f'Task {task} is not enabled, expected one of {list(self._plugins)}')
+
+        return self._plugins[task].get_model_class()
+
+
+# Tasks supported by the application and the model wrapper of each one
+TASKS = TaskRegistry([
+    TaskPlugin('Chat', 'multihugginggradio.models.chat_llm', 'ChatLLM'),
+    TaskPlugin('Image Classification', 'multihugginggradio.models.image_class_model', 'ImageClassModel'),
+    TaskPlugin('Image Generation', 'multihugginggradio.models.image_gen_model', 'ImageGenModel'),
+])
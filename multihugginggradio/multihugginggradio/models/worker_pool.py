@@ -0,0 +1,548 @@
+import os
+import zlib
+import queue
+import pickle
+import inspect
+import importlib
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+from multihugginggradio.utils.transport.shared_images import SharedImagePool, put_images, open_images
+
+# Method name of the messages asking a worker to release the shared memory segments of the images it sent
+RELEASE_IMAGES = '__release_images__'
+
+
+class WorkerCrashedError(RuntimeError):
+    """
+    Raised for the requests of a worker process that exited before answering them.
+    """
+
+
+def _picklable(error: Exception) -> Exception:
+    """
+    Return an exception that can be sent to the parent process, the error itself if it can be pickled.
+    """
+    try:
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return RuntimeError(f'{type(error).__name__}: {error}')
+
+
+def _worker_main(connection, module_name: str, class_name: str, model_name: str, verbose: bool, model_kwargs: dict,
+                 num_threads: int, torch_threads: int, shared_memory_images: bool):
+    """
+    Entry point of a worker process: load the model, then run the requests received on the connection.
+
+    Each request is a tuple with its identifier, the method of the model to call and its arguments. The
+    requests run in a thread pool, so concurrent requests can be batched by the model. Each reply is a
+    tuple with the request identifier, its kind ('item' for each value of a generator, then 'result' or
+    'error') and value, and the `stats` dictionary argument of the request as updated by the model.
+
+    With `shared_memory_images`, the images of the requests are read in place from the shared memory
+    segments of the parent, and the images of the replies are put in segments of the worker, which are
+    reused once the parent sends them back in a RELEASE_IMAGES message.
+    """
+    try:
+        if torch_threads is not None:
+            import torch
+            torch.set_num_threads(torch_threads)
+
+        model_class = getattr(importlib.import_module(module_name), class_name)
+        model = model_class(model_name, verbose, **model_kwargs)
+        memory_footprint = model.memory_footprint()
+    except Exception as error:
+        connection.send((None, 'error', _picklable(error), None))
+        return
+
+    connection.send((None, 'ready', memory_footprint, None))
+    send_lock = threading.Lock()
+    images = SharedImagePool() if shared_memory_images else None
+
+    def send(request_id, kind, value, stats):
+        if images is not None and kind != 'error':
+            value = put_images(value, images, [])
+
+        with send_lock:
+            connection.send((request_id, kind, value, dict(stats) if stats is not None else None))
+
+    def run(request_id, method, args, kwargs):
+        stats = None
+        try:
+            if images is not None:
+                args, kwargs = open_images(args, images), open_images(kwargs, images)
+
+            stats = kwargs.get('stats')
+            result = getattr(model, method)(*args, **kwargs)
+            if inspect.isgenerator(result):
+                for item in result:
+                    send(request_id, 'item', item, stats)
+                result = None
+
+            send(request_id, 'result', result, stats)
+        except Exception as error:
+            send(request_id, 'error', _picklable(error), stats)
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        while True:
+            try:
+                message = connection.recv()
+            except EOFError:
+                break
+
+            # None asks the worker to stop once its running requests finish
+            if message is None:
+                break
+            if message[1] == RELEASE_IMAGES:
+                for handle in message[2]:
+                    images.release(handle)
+                continue
+            executor.submit(run, *message)
+
+    model.release()
+    if images is not None:
+        images.close()
+
+
+class _Worker(object):
+    """
+    A worker process of a ModelWorkerPool, with the requests it is running.
+    """
+    STARTING = 'starting'
+    READY = 'ready'
+    FAILED = 'failed'
+
+    def __init__(self, index: int):
+        self.index = index
+        self.state = self.STARTING
+        self.process = None
+        self.connection = None
+        self.send_lock = threading.Lock()
+        self.memory_footprint = 0
+        self.restarts = 0
+        # Queue of the replies of each running request, by request identifier
+        self.pending = {}
+
+
+class ModelWorkerPool(object):
+    def __init__(
+        self,
+        module_name: str,
+        class_name: str,
+        model_name: str,
+        verbose: bool = False,
+        model_kwargs: dict = None,
+        replicas: int = 1,
+        threads_per_worker: int = 8,
+        start_method: str = 'spawn',
+        start_timeout: float = 600,
+        shared_memory_images: bool = True,
+    ):
+        """
+        Initialize a pool of worker processes, each one loading its own replica of a model.
+
+        Parameters:
+            module_name (str): The dotted name of the module defining the model wrapper.
+            class_name (str): The name of the model wrapper class in the module.
+            model_name (str): The name of the pre-trained model.
+            verbose (bool): Whether the model prints its progress. Defaults to False.
+            model_kwargs (dict): Keyword arguments of the model wrapper, they must be picklable. Defaults to None.
+            replicas (int): Number of worker processes. Defaults to 1.
+            threads_per_worker (int): Number of requests a worker runs at once. Defaults to 8.
+            start_method (str): The multiprocessing start method: 'spawn', 'forkserver' or 'fork'. Defaults
+                                to 'spawn', which is safe with CUDA.
+            start_timeout (float): Seconds a worker may take to load its model. Defaults to 600.
+            shared_memory_images (bool): Whether to pass the images of the requests and replies through shared
+                                         memory segments instead of pickling their pixels. Defaults to True.
+
+        The pool has the inference methods of the model wrappers (`infer`, `infer_stream`, `infer_many`,
+        `infer_batch`, `classify_directory`, `warmup`, `memory_footprint` and `release`), so it can be kept in
+        the ModelRegistry in place of the model. Each call is sent to a worker over a pipe and its result sent
+        back, so the models do not share the GIL of the interface process, and several replicas of a cheap
+        model use several cores. With several replicas, each process uses its share of the CPU cores for torch.
+
+        A request goes to the ready worker with the fewest running requests, except requests with a
+        `session_id` argument, which always go to the same worker so the conversation stays in one process.
+        When a worker exits, its running requests raise a WorkerCrashedError and a new worker is started in
+        the background. Exceptions raised by the model are raised by the call in the parent process.
+
+        With `shared_memory_images`, the images (PIL images and uint8 np.arrays) in the arguments are copied
+        once into shared memory segments (see SharedImagePool) that the worker reads in place, and the segments
+        are reused by the next requests once the call returns. The images returned by the model are copied
+        out of the segments of the worker as soon as they arrive.
+
+        Example usage:
+        ```
+        pool = ModelWorkerPool(
+            'multihugginggradio.models.image_class_model', 'ImageClassModel', 'google/vit-base-patch16-224',
+            replicas=2,
+        )
+        label = pool.infer(image)
+        pool.release()
+        ```
+        """
+        self.module_name = module_name
+        self.class_name = class_name
+        self.model_name = model_name
+        self.verbose = verbose
+        self.model_kwargs = model_kwargs or {}
+        self.threads_per_worker = threads_per_worker
+        self.start_timeout = start_timeout
+        self.shared_memory_images = shared_memory_images
+
+        # Shared memory segments of the images sent to the workers, and attachments of the segments they send back
+        self.images = SharedImagePool() if shared_memory_images else None
+
+        # Share the CPU cores between the replicas instead of letting each one use all of them
+        self.torch_threads = max(1, (os.cpu_count() or 1) // replicas) if replicas > 1 else None
+
+        self._context = multiprocessing.get_context(start_method)
+        self._workers = [_Worker(index) for index in range(replicas)]
+        self._condition = threading.Condition()
+        self._request_ids = itertools.count()
+        self._closed = False
+
+        # Start the processes together so the replicas load in parallel
+        for worker in self._workers:
+            self._spawn(worker)
+        try:
+            for worker in self._workers:
+                self._wait_ready(worker)
+        except BaseException:
+            self.release()
+            raise
+
+    def infer(self, *args, **kwargs):
+        """
+        Run the `infer` method of the model in a worker.
+        """
+        return self.call('infer', *args, **kwargs)
+
+    def infer_stream(self, *args, **kwargs):
+        """
+        Run the `infer_stream` method of the model in a worker, yielding its values as they arrive.
+        """
+        return self.stream('infer_stream', *args, **kwargs)
+
+    def infer_many(self, *args, **kwargs):
+        """
+        Run the `infer_many` method of the model in a worker.
+        """
+        return self.call('infer_many', *args, **kwargs)
+
+    def infer_batch(self, images, *args, **kwargs):
+        """
+        Run the `infer_batch` method of the model in a worker.
+
+        The images are sent to the worker at once, an iterator of images is read into a list first. If the
+        method of the model is a generator, like the one of the image classification models, its values are
+        yielded as the worker sends them, otherwise its result is returned.
+        """
+        if not isinstance(images, (str, list, tuple)):
+            images = list(images)
+
+        if self._is_generator('infer_batch'):
+            return self.stream('infer_batch', images, *args, **kwargs)
+        return self.call('infer_batch', images, *args, **kwargs)
+
+    def classify_directory(self, *args, **kwargs):
+        """
+        Run the `classify_directory` method of the model in a worker, yielding the path and predictions of each
+        image as they arrive. The directory is read by the worker.
+        """
+        return self.stream('classify_directory', *args, **kwargs)
+
+    def warmup(self):
+        """
+        Run the `warmup` method of the model in every worker.
+        """
+        for worker in self._workers:
+            for _ in self._replies('warmup', (), {}, worker=worker):
+                pass
+
+    def demote(self) -> bool:
+        """
+        Run the `demote` method of the model in every worker, moving their weights to host memory.
+
+        Returns:
+            bool: Whether the weights of any worker were moved.
+        """
+        results = [
+            value for worker in self._workers
+            for kind, value in self._replies('demote', (), {}, worker=worker) if kind == 'result'
+        ]
+        return any(results)
+
+    def promote(self):
+        """
+        Run the `promote` method of the model in every worker, moving their weights back to their device.
+        """
+        for worker in self._workers:
+            for _ in self._replies('promote', (), {}, worker=worker):
+                pass
+
+    def memory_footprint(self) -> int:
+        """
+        Return the number of bytes used by the weights of the models of all the workers.
+        """
+        return sum(worker.memory_footprint for worker in self._workers)
+
+    def worker_stats(self) -> dict:
+        """
+        Report the state of the workers.
+
+        Returns:
+            dict: The number of 'replicas', of 'ready' workers, of 'restarts' after crashes and of 'running'
+                  requests.
+        """
+        with self._condition:
+            return {
+                'replicas': len(self._workers),
+                'ready': sum(worker.state == _Worker.READY for worker in self._workers),
+                'restarts': sum(worker.restarts for worker in self._workers),
+                'running': sum(len(worker.pending) for worker in self._workers),
+            }
+
+    def call(self, method: str, *args, **kwargs):
+        """
+        Call a method of the model in a worker and return its result.
+
+        Parameters:
+            method (str): The name of the method.
+            *args, **kwargs: The arguments of the method, they must be picklable. A `stats` dictionary
+                             argument is updated with the values set by the model.
+
+        Raises:
+            WorkerCrashedError: If the worker exited before answering, or no worker is running.
+        """
+        for kind, value in self._replies(method, args, kwargs):
+            if kind == 'result':
+                return value
+
+    def stream(self, method: str, *args, **kwargs):
+        """
+        Call a generator method of the model in a worker, yielding its values as the worker sends them.
+
+        Parameters:
+            method (str): The name of the method.
+            *args, **kwargs: The arguments of the method, as in `call`.
+        """
+        for kind, value in self._replies(method, args, kwargs):
+            if kind == 'item':
+                yield value
+
+    def release(self):
+        """
+        Stop the workers once their running requests finish, releasing their models.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+        for worker in self._workers:
+            if worker.process is None:
+                continue
+
+            try:
+                with worker.send_lock:
+                    worker.connection.send(None)
+            except (OSError, ValueError):
+                pass
+
+            worker.process.join(timeout=30)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+            worker.connection.close()
+
+        if self.images is not None:
+            self.images.close()
+
+    def _is_generator(self, method: str) -> bool:
+        """
+        Tell whether a method of the model wrapper class is a generator, which the worker runs as a stream.
+        """
+        model_class = getattr(importlib.import_module(self.module_name), self.class_name)
+        return inspect.isgeneratorfunction(getattr(model_class, method))
+
+    def _replies(self, method: str, args: tuple, kwargs: dict, worker: _Worker = None):
+        """
+        Send a request to a worker and yield the kind and value of its replies until its result.
+        """
+        stats = kwargs.get('stats')
+
+        # Put the images of the arguments in shared memory, their segments are reused once the request finishes
+        handles = []
+        if self.images is not None:
+            args, kwargs = put_images(args, self.images, handles), put_images(kwargs, self.images, handles)
+
+        try:
+            worker, request_id, replies = self._submit(method, args, kwargs, worker)
+        except BaseException:
+            self._release_handles(handles)
+            raise
+
+        try:
+            while True:
+                kind, value, remote_stats = replies.get()
+                if stats is not None and remote_stats is not None:
+                    stats.update(remote_stats)
+
+                if kind == 'error':
+                    raise value
+
+                yield kind, value
+                if kind == 'result':
+                    return
+        finally:
+            with self._condition:
+                worker.pending.pop(request_id, None)
+            self._release_handles(handles)
+
+    def _release_handles(self, handles: list):
+        """
+        Give back the segments of the images of a finished request.
+        """
+        for handle in handles:
+            self.images.release(handle)
+
+    def _submit(self, method: str, args: tuple, kwargs: dict, worker: _Worker = None) -> tuple:
+        """
+        Choose a ready worker, unless one is given, and send it a request.
+
+        Returns:
+            tuple: The worker, the request identifier and the queue of its replies.
+        """
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError(f'The workers of Model ({self.model_name}) were released')
+
+                ready = [worker] if worker is not None else self._workers
+                ready = [candidate for candidate in ready if candidate.state == _Worker.READY]
+                if ready:
+                    break
+                if all(candidate.state == _Worker.FAILED for candidate in ([worker] if worker else self._workers)):
+                    raise WorkerCrashedError(f'No worker of Model ({self.model_name}) is running')
+
+                # Wait for a worker being restarted
+                self._condition.wait()
+
+            session_id = kwargs.get('session_id')
+            preferred = self._workers[zlib.crc32(session_id.encode()) % len(self._workers)] if session_id else None
+            worker = preferred if preferred in ready else min(ready, key=lambda candidate: len(candidate.pending))
+
+            request_id = next(self._request_ids)
+            replies = worker.pending[request_id] = queue.Queue()
+
+        try:
+            with worker.send_lock:
+                worker.connection.send((request_id, method, args, kwargs))
+        except (OSError, ValueError) as error:
+            with self._condition:
+                worker.pending.pop(request_id, None)
+            raise WorkerCrashedError(f'The worker of Model ({self.model_name}) exited') from error
+
+        return worker, request_id, replies
+
+    def _spawn(self, worker: _Worker):
+        """
+        Start the process of a worker, which loads its model.
+        """
+        connection, child_connection = self._context.Pipe()
+        worker.connection = connection
+        worker.process = self._context.Process(
+            target=_worker_main,
+            args=(child_connection, self.module_name, self.class_name, self.model_name, self.verbose,
+                  self.model_kwargs, self.threads_per_worker, self.torch_threads, self.shared_memory_images),
+            daemon=True,
+        )
+        worker.process.start()
+
+        # Only the worker keeps its end of the pipe, so the parent reads EOF when the worker exits
+        child_connection.close()
+
+    def _wait_ready(self, worker: _Worker):
+        """
+        Wait for a worker to load its model, then read its replies in a background thread.
+        """
+        try:
+            if not worker.connection.poll(self.start_timeout):
+                raise WorkerCrashedError(f'The worker of Model ({self.model_name}) did not load it in time')
+            _, kind, value, _ = worker.connection.recv()
+        except (EOFError, OSError) as error:
+            raise WorkerCrashedError(f'The worker of Model ({self.model_name}) exited while loading it') from error
+        except BaseException:
+            worker.process.kill()
+            raise
+
+        if kind == 'error':
+            worker.process.join()
+            raise value
+
+        worker.memory_footprint = value
+        with self._condition:
+            worker.state = _Worker.READY
+            self._condition.notify_all()
+
+        threading.Thread(target=self._read, args=(worker, worker.connection), daemon=True).start()
+
+    def _read(self, worker: _Worker, connection):
+        """
+        Route the replies of a worker to its requests, and restart the worker when it exits.
+        """
+        while True:
+            try:
+                request_id, kind, value, stats = connection.recv()
+            except (EOFError, OSError):
+                break
+
+            # Copy the images out of the segments of the worker, and let the worker reuse the segments
+            if self.images is not None and kind != 'error':
+                handles = []
+                value = open_images(value, self.images, copy=True, handles=handles)
+                if handles:
+                    try:
+                        with worker.send_lock:
+                            connection.send((None, RELEASE_IMAGES, handles, None))
+                    except (OSError, ValueError):
+                        pass
+
+            with self._condition:
+                replies = worker.pending.get(request_id)
+            if replies is not None:
+                replies.put((kind, value, stats))
+
+        with self._condition:
+            if self._closed:
+                return
+
+            worker.state = _Worker.STARTING
+            pending, worker.pending = worker.pending, {}
+            worker.restarts += 1
+
+        # Fail the requests the worker was running, they may be the cause of the crash
+        for replies in pending.values():
+            replies.put(('error', WorkerCrashedError(f'The worker of Model ({self.model_name}) exited'), None))
+
+        if self.verbose:
+            print(f'Restarting a worker of Model ({self.model_name}) (exit code {worker.process.exitcode})...')
+
+        worker.process.join(timeout=30)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join()
+        connection.close()
+        try:
+            self._spawn(worker)
+            self._wait_ready(worker)
+        except Exception as error:
+            if self.verbose:
+                print(f'Failed to restart a worker of Model ({self.model_name}): {error}')
+
+            with self._condition:
+                worker.state = _Worker.FAILED
+                self._condition.notify_all()
@@ -0,0 +1,318 @@
+import time
+import queue
+import inspect
+import threading
+import torch
+from concurrent.futures import Future
+
+from multihugginggradio.utils.batching.micro_batcher import MicroBatcher
+from multihugginggradio.utils.metrics.histogram import Histogram
+
+
+class _Sequence(object):
+    def __init__(self, input_ids, past_key_values, max_new_tokens, logits_processor, eos_token_ids, streamer):
+        """
+        State of a sequence decoded by a ContinuousBatcher.
+        """
+        self.tokens = input_ids.tolist()
+        self.num_prompt_tokens = len(self.tokens)
+        self.past_key_values = past_key_values
+        self.max_new_tokens = max_new_tokens
+        self.logits_processor = logits_processor
+        self.eos_token_ids = eos_token_ids
+        self.streamer = streamer
+        self.future = Future()
+        self.submit_time = time.time()
+
+    @property
+    def num_cached(self) -> int:
+        """
+        int: The number of tokens whose keys and values are cached, all the tokens but the last one.
+        """
+        return len(self.tokens) - 1
+
+    @property
+    def finished(self) -> bool:
+        """
+        bool: Whether the sequence generated its maximum number of tokens or an end of sequence token.
+        """
+        num_generated = len(self.tokens) - self.num_prompt_tokens
+        return num_generated >= self.max_new_tokens or (num_generated > 0 and self.tokens[-1] in self.eos_token_ids)
+
+
+class ContinuousBatcher(object):
+    # Histogram buckets of the number of sequences decoded per step and of the queue delays (in seconds)
+    BATCH_SIZE_BUCKETS = MicroBatcher.BATCH_SIZE_BUCKETS
+    QUEUE_DELAY_BUCKETS = MicroBatcher.QUEUE_DELAY_BUCKETS
+
+    def __init__(self, model, max_batch_size: int = 8):
+        """
+        Initialize a ContinuousBatcher that decodes concurrent generations of a causal language model together.
+
+        Parameters:
+            model (PreTrainedModel): The causal language model. Its forward pass must accept `position_ids`, and
+                                     its cached keys and values must have the sequence length as their
+                                     second-to-last dimension, like the GPT-NeoX, GPT-2 and Llama models.
+            max_batch_size (int): Maximum number of sequences decoded in one forward pass. Defaults to 8.
+
+        The batch is formed at every decoding step instead of once per request: a single background worker
+        runs one forward pass per step on the last token of every running sequence, admits the submitted
+        sequences into the running batch before each step, and returns each sequence as soon as it generates
+        an end of sequence token or its own maximum number of tokens, without waiting for the other sequences.
+
+        Each sequence is submitted with the cached keys and values of its prompt, all tokens but the last one,
+        which its caller computes beforehand (reusing the cache of its conversation). The caches of the running
+        sequences are left-padded to the same length, the padding is masked out and each token is given its
+        position in its own sequence, so a sequence gets the same tokens as when it is decoded alone. The
+        padding columns no running sequence needs are dropped whenever a sequence leaves the batch.
+
+        The number of sequences of each step and the time sequences wait to join the batch are recorded in
+        histograms.
+
+        Example usage:
+        ```
+        batcher = ContinuousBatcher(model, max_batch_size=8)
+        sequence = batcher.submit(input_ids[0], past_key_values, max_new_tokens=50, eos_token_ids=[0]).result()
+        ```
+        """
+        if 'position_ids' not in inspect.signature(model.forward).parameters:
+            raise ValueError(f'Model {type(model).__name__} does not accept position ids, it cannot be batched')
+
+        self.model = model
+        self.max_batch_size = max_batch_size
+
+        self.batch_sizes = Histogram(self.BATCH_SIZE_BUCKETS)
+        self.queue_delays = Histogram(self.QUEUE_DELAY_BUCKETS)
+
+        # Running sequences, with their cached keys and values left-padded to the same length and its mask
+        self._running = []
+        self._past_key_values = None
+        self._attention_mask = None
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        input_ids: torch.Tensor,
+        past_key_values=None,
+        max_new_tokens: int = 100,
+        logits_processor=None,
+        eos_token_ids: list = (),
+        streamer=None,
+    ) -> Future:
+        """
+        Add a sequence to the running batch.
+
+        Parameters:
+            input_ids (torch.Tensor): The token ids of the prompt, with shape (sequence length,).
+            past_key_values: The cached keys and values of all the prompt tokens but the last one, or None for
+                             a prompt of a single token.
+            max_new_tokens (int): The maximum number of tokens generated for the sequence. Defaults to 100.
+            logits_processor (LogitsProcessorList): Optional processor of the scores of the next token of the
+                                                    sequence, whose highest score is selected. Defaults to None.
+            eos_token_ids (list): The tokens ending the sequence. Defaults to ().
+            streamer (BaseStreamer): Optional streamer receiving the prompt, then the tokens of the sequence as they
+                                     are generated. Defaults to None.
+
+        Returns:
+            Future: A future holding the token ids of the prompt followed by the generated tokens, with shape
+                    (1, sequence length), once the sequence is finished.
+        """
+        sequence = _Sequence(input_ids.cpu(), past_key_values, max_new_tokens, logits_processor, set(eos_token_ids), streamer)
+        if streamer is not None:
+            streamer.put(input_ids[None].cpu())
+        self._queue.put(sequence)
+
+        return sequence.future
+
+    def stats(self) -> dict:
+        """
+        Report the batch size and queue delay histograms.
+
+        Returns:
+            dict: The snapshots of the 'batch_size' (sequences decoded per step) and 'queue_delay' histograms.
+        """
+        return {
+            'batch_size': self.batch_sizes.snapshot(),
+            'queue_delay': self.queue_delays.snapshot(),
+        }
+
+    def close(self):
+        """
+        Stop the background worker once the submitted sequences are finished.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        """
+        Admit the submitted sequences and decode the running batch until the batcher is closed.
+        """
+        closed = False
+        while True:
+            # Wait for a sequence when none is running, then admit the waiting sequences that fit in the batch
+            sequences = []
+            if not self._running and not closed:
+                sequences.append(self._queue.get())
+            while len(self._running) + len(sequences) < self.max_batch_size:
+                try:
+                    sequences.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if None in sequences:
+                closed = True
+                sequences.remove(None)
+
+            if sequences:
+                try:
+                    self._admit(sequences)
+                except Exception as error:
+                    self._fail(sequences, error)
+
+            if not self._running:
+                if closed:
+                    return
+                continue
+
+            try:
+                self._step()
+            except Exception as error:
+                running, self._running = self._running, []
+                self._past_key_values = self._attention_mask = None
+                self._fail(running, error)
+
+    def _admit(self, sequences: list):
+        """
+        Add sequences to the running batch, left-padding the cached keys and values to the same length.
+        """
+        start_time = time.time()
+        for sequence in sequences:
+            self.queue_delays.observe(start_time - sequence.submit_time)
+
+        # All the caches are padded to the longest one
+        past_length = max([self._attention_mask.shape[1] if self._running else 0]
+                          + [sequence.num_cached for sequence in sequences])
+        parts = [(self._past_key_values, self._attention_mask)] if self._running else []
+        for sequence in sequences:
+            parts.append((sequence.past_key_values, torch.ones(1, sequence.num_cached, dtype=torch.long)))
+
+        attention_mask = torch.cat([
+            torch.cat([torch.zeros(mask.shape[0], past_length - mask.shape[1], dtype=torch.long), mask], dim=1)
+            for _, mask in parts
+        ])
+
+        # The shape of the cached tensors is taken from any sequence with a cache
+        reference = next((past for past, _ in parts if past is not None), None)
+        if reference is None:
+            past_key_values = None
+        else:
+            past_key_values = tuple(
+                tuple(
+                    torch.cat([
+                        self._left_pad(past[layer][index] if past is not None else None, mask.shape[0], past_length,
+                                       reference[layer][index])
+                        for past, mask in parts
+                    ])
+                    for index in range(len(reference[layer]))
+                )
+                for layer in range(len(reference))
+            )
+
+        self._past_key_values = past_key_values
+        self._attention_mask = attention_mask
+        self._running.extend(sequences)
+
+        # The keys and values of the sequences are now kept in the batch
+        for sequence in sequences:
+            sequence.past_key_values = None
+
+    @staticmethod
+    def _left_pad(tensor, num_rows: int, length: int, reference: torch.Tensor) -> torch.Tensor:
+        """
+        Left-pad a cached tensor with zeros to a sequence length, or create the padding of a sequence without one.
+        """
+        if reference.dim() != 4:
+            raise ValueError(f'Cached tensors of shape {tuple(reference.shape)} cannot be batched')
+
+        num_cached = tensor.shape[-2] if tensor is not None else 0
+        padding = reference.new_zeros(num_rows, reference.shape[1], length - num_cached, reference.shape[3])
+
+        return torch.cat([padding, tensor], dim=-2) if tensor is not None else padding
+
+    def _step(self):
+        """
+        Generate the next token of every running sequence, then remove the finished sequences from the batch.
+        """
+        self.batch_sizes.observe(len(self._running))
+        device = self.model.device
+
+        # Each sequence feeds its last token at its own position, the padding is masked out
+        input_ids = torch.tensor([[sequence.tokens[-1]] for sequence in self._running], device=device)
+        position_ids = torch.tensor([[sequence.num_cached] for sequence in self._running], device=device)
+        attention_mask = torch.cat([self._attention_mask, torch.ones(len(self._running), 1, dtype=torch.long)], dim=1)
+
+        with torch.inference_mode():
+            outputs = self.model(
+                input_ids,
+                attention_mask=attention_mask.to(device),
+                position_ids=position_ids,
+                past_key_values=self._past_key_values,
+                use_cache=True,
+            )
+        self._past_key_values = outputs.past_key_values
+        self._attention_mask = attention_mask
+
+        # Select the next token of each sequence from its own processed scores
+        scores = outputs.logits[:, -1, :]
+        for row, sequence in enumerate(self._running):
+            sequence_scores = scores[row:row + 1]
+            if sequence.logits_processor:
+                sequence_input_ids = torch.tensor([sequence.tokens], device=device)
+                sequence_scores = sequence.logits_processor(sequence_input_ids, sequence_scores)
+            next_token = int(sequence_scores.argmax(dim=-1))
+
+            sequence.tokens.append(next_token)
+            if sequence.streamer is not None:
+                sequence.streamer.put(torch.tensor([next_token]))
+
+        finished = [sequence for sequence in self._running if sequence.finished]
+        if finished:
+            self._remove(finished)
+
+            for sequence in finished:
+                if sequence.streamer is not None:
+                    sequence.streamer.end()
+                sequence.future.set_result(torch.tensor([sequence.tokens]))
+
+    def _remove(self, sequences: list):
+        """
+        Remove sequences from the running batch, with the padding columns no remaining sequence needs.
+        """
+        keep = [row for row, sequence in enumerate(self._running) if sequence not in sequences]
+        self._running = [self._running[row] for row in keep]
+        if not self._running:
+            self._past_key_values = self._attention_mask = None
+            return
+
+        # The remaining sequences only need the columns of their longest cache
+        attention_mask = self._attention_mask[keep]
+        first_column = attention_mask.shape[1] - max(sequence.num_cached for sequence in self._running)
+        self._attention_mask = attention_mask[:, first_column:]
+
+        rows = torch.tensor(keep, device=self.model.device)
+        self._past_key_values = tuple(
+            tuple(tensor.index_select(0, rows)[:, :, first_column:] for tensor in layer)
+            for layer in self._past_key_values
+        )
+
+    def _fail(self, sequences: list, error: Exception):
+        """
+        Send an error to the callers of sequences.
+        """
+        for sequence in sequences:
+            if sequence.streamer is not None:
+                sequence.streamer.end()
+            sequence.future.set_exception(error)
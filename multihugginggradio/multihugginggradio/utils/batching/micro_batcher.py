@@ -0,0 +1,147 @@
+import time
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from multihugginggradio.utils.metrics.histogram import Histogram
+
+
+class MicroBatcher(object):
+    # Histogram buckets of the batch sizes and of the queue delays (in seconds)
+    BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64]
+    QUEUE_DELAY_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+
+    def __init__(
+        self,
+        process_batch,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10,
+        batch_key=None,
+    ):
+        """
+        Initialize a MicroBatcher that groups concurrent requests into batches.
+
+        Parameters:
+            process_batch (callable): Function called with a list of items that returns the list of their results,
+                                      in the same order.
+            max_batch_size (int): Maximum number of items processed in one batch. Defaults to 8.
+            max_wait_ms (float): Maximum number of milliseconds the first item of a batch waits for more items
+                                 before the batch is processed. Defaults to 10.
+            batch_key (callable): Optional function returning the key of an item. Only items with equal keys
+                                  are processed together, items collected at the same time with other keys
+                                  are processed in separate batches. Defaults to None, which batches any items.
+
+        Items are submitted from any thread and processed by a single background worker, which starts
+        a batch as soon as it is full or the oldest item has waited `max_wait_ms`. Each caller gets a
+        future with its own result. The sizes of the batches and the time items spend in the queue
+        are recorded in histograms.
+
+        Example usage:
+        ```
+        batcher = MicroBatcher(lambda items: [item * 2 for item in items], max_batch_size=4)
+        print(batcher.submit(21).result())
+        ```
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batch_key = batch_key
+
+        self.batch_sizes = Histogram(self.BATCH_SIZE_BUCKETS)
+        self.queue_delays = Histogram(self.QUEUE_DELAY_BUCKETS)
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        """
+        Add an item to the next batch.
+
+        Parameters:
+            item: The item to process.
+
+        Returns:
+            Future: A future holding the result of the item once its batch is processed.
+        """
+        future = Future()
+        self._queue.put((item, future, time.time()))
+
+        return future
+
+    def stats(self) -> dict:
+        """
+        Report the batch size and queue delay histograms.
+
+        Returns:
+            dict: The snapshots of the 'batch_size' and 'queue_delay' histograms.
+        """
+        return {
+            'batch_size': self.batch_sizes.snapshot(),
+            'queue_delay': self.queue_delays.snapshot(),
+        }
+
+    def close(self):
+        """
+        Stop the background worker once the submitted items are processed.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        """
+        Collect items into batches and process them until the batcher is closed.
+        """
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+
+            # Wait for more items until the batch is full or the first item waited long enough
+            batch = [request]
+            deadline = request[2] + self.max_wait
+            closed = False
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.time()
+                try:
+                    request = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if request is None:
+                    closed = True
+                    break
+
+                batch.append(request)
+
+            # Split the collected items into batches of compatible items, in their submission order
+            batches = OrderedDict()
+            for request in batch:
+                key = self.batch_key(request[0]) if self.batch_key is not None else None
+                batches.setdefault(key, []).append(request)
+
+            for compatible_batch in batches.values():
+                self._process(compatible_batch)
+
+            if closed:
+                return
+
+    def _process(self, batch: list):
+        """
+        Process a batch and send each caller its result.
+        """
+        start_time = time.time()
+        self.batch_sizes.observe(len(batch))
+        for _, _, submit_time in batch:
+            self.queue_delays.observe(start_time - submit_time)
+
+        try:
+            results = self.process_batch([item for item, _, _ in batch])
+        except Exception as error:
+            for _, future, _ in batch:
+                future.set_exception(error)
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,233 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+
+from collections import OrderedDict
+from PIL import Image
+
+
+def make_key(*parts) -> str:
+    """
+    Compute a content hash identifying a request.
+
+    Parameters:
+        *parts: The values the result depends on: strings, numbers, None, bytes, np.arrays or PIL images.
+
+    Returns:
+        str: The SHA-256 hex digest of the parts. Arrays and images are hashed by content, shape and type.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, Image.Image):
+            data = repr((part.mode, part.size)).encode() + part.tobytes()
+        elif isinstance(part, np.ndarray):
+            data = repr((str(part.dtype), part.shape)).encode() + np.ascontiguousarray(part).tobytes()
+        elif isinstance(part, bytes):
+            data = part
+        else:
+            data = repr(part).encode()
+
+        # Prefix each part with its type and length, so different splits of the same bytes do not collide
+        digest.update(f'{type(part).__name__}:{len(data)}:'.encode())
+        digest.update(data)
+
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    def __init__(
+        self,
+        max_items: int = 128,
+        disk_dir: str = None,
+        max_disk_bytes: int = None,
+    ):
+        """
+        Initialize a two-tier cache of inference results.
+
+        Parameters:
+            max_items (int): Maximum number of results kept in memory. The least recently used result is
+                             dropped from memory when it is exceeded. Defaults to 128.
+            disk_dir (str): Optional directory where results are also saved, PIL images as PNG files and
+                            other results as JSON files named by their key. None disables the disk tier.
+                            Defaults to None.
+            max_disk_bytes (int): Maximum number of bytes of the files in `disk_dir`. The oldest files are
+                                  deleted when it is exceeded. None disables the limit. Defaults to None.
+
+        Results are looked up by a content hash of the request (see `make_key`), first in memory and then on
+        disk. When an identical request is already being computed, new callers wait for its result instead
+        of starting a second computation.
+
+        Example usage:
+        ```
+        cache = ResultCache(max_items=64, disk_dir='cache')
+        key = make_key('CompVis/stable-diffusion-v1-4', prompt, guidance_scale, seed)
+        image = cache.get_or_compute(key, lambda: model.infer(prompt, guidance_scale, seed))
+        print(cache.stats())
+        ```
+        """
+        self.max_items = max_items
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+
+        # Results kept in memory, ordered from least to most recently used
+        self._results = OrderedDict()
+        # Computations in progress, with the event set when they finish and their outcome
+        self._pending = {}
+        self._lock = threading.Lock()
+
+        # Files of the disk tier by name, ordered from oldest to newest, with their sizes
+        self._files = OrderedDict()
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+            paths = [os.path.join(disk_dir, name) for name in os.listdir(disk_dir)]
+            for path in sorted(paths, key=os.path.getmtime):
+                self._files[os.path.basename(path)] = os.path.getsize(path)
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._results)
+
+    def get_or_compute(self, key: str, compute):
+        """
+        Return the cached result of a request, computing it first if it is not cached.
+
+        Parameters:
+            key (str): The content hash of the request.
+            compute (callable): Function without arguments that computes the result.
+
+        Returns:
+            The result of the request.
+        """
+        with self._lock:
+            if key in self._results:
+                self.hits += 1
+                self._results.move_to_end(key)
+                return self._results[key]
+
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = {'event': threading.Event()}
+                owner = True
+            else:
+                self.deduplicated += 1
+                owner = False
+
+        # An identical request is being computed, wait for its result instead of computing it twice
+        if not owner:
+            pending['event'].wait()
+            if 'error' in pending:
+                raise pending['error']
+
+            return pending['result']
+
+        try:
+            result = self._load(key)
+            if result is not None:
+                with self._lock:
+                    self.disk_hits += 1
+            else:
+                with self._lock:
+                    self.misses += 1
+                result = compute()
+                self._save(key, result)
+        except Exception as error:
+            with self._lock:
+                pending['error'] = error
+                self._pending.pop(key)['event'].set()
+            raise
+
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.max_items:
+                self._results.popitem(last=False)
+
+            pending['result'] = result
+            self._pending.pop(key)['event'].set()
+
+        return result
+
+    def stats(self) -> dict:
+        """
+        Report the usage of the cache.
+
+        Returns:
+            dict: The number of memory hits, disk hits, misses and deduplicated requests (that waited for an
+                  identical request in progress), the hit rate over all the requests, and the number of
+                  results in memory and of files on disk with their size in bytes.
+        """
+        with self._lock:
+            requests = self.hits + self.disk_hits + self.misses + self.deduplicated
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'deduplicated': self.deduplicated,
+                'hit_rate': (requests - self.misses) / requests if requests else 0.0,
+                'memory_items': len(self._results),
+                'disk_files': len(self._files),
+                'disk_bytes': sum(self._files.values()),
+            }
+
+    def clear(self):
+        """
+        Drop the results kept in memory. The files of the disk tier are kept.
+        """
+        with self._lock:
+            self._results.clear()
+
+    def _load(self, key: str):
+        """
+        Read a result from the disk tier, or return None if it is not there.
+        """
+        if self.disk_dir is None:
+            return None
+
+        for name in (f'{key}.png', f'{key}.json'):
+            path = os.path.join(self.disk_dir, name)
+            if not os.path.exists(path):
+                continue
+
+            if name.endswith('.png'):
+                with Image.open(path) as image:
+                    image.load()
+                    return image.copy()
+
+            with open(path) as file:
+                return json.load(file)
+
+        return None
+
+    def _save(self, key: str, result):
+        """
+        Write a result to the disk tier and delete the oldest files beyond the size limit.
+        """
+        if self.disk_dir is None:
+            return
+
+        name = f'{key}.png' if isinstance(result, Image.Image) else f'{key}.json'
+        path = os.path.join(self.disk_dir, name)
+
+        # Write to a temporary file first, so readers never see a partial result
+        temporary_path = f'{path}.{threading.get_ident()}.tmp'
+        if name.endswith('.png'):
+            result.save(temporary_path, format='PNG')
+        else:
+            with open(temporary_path, 'w') as file:
+                json.dump(result, file)
+        os.replace(temporary_path, path)
+
+        with self._lock:
+            self._files.pop(name, None)
+            self._files[name] = os.path.getsize(path)
+
+            if self.max_disk_bytes is not None:
+                while len(self._files) > 1 and sum(self._files.values()) > self.max_disk_bytes:
+                    oldest, _ = self._files.popitem(last=False)
+                    os.remove(os.path.join(self.disk_dir, oldest))
@@ -0,0 +1,89 @@
+import bisect
+import threading
+
+
+class Histogram(object):
+    def __init__(self, buckets: list):
+        """
+        Initialize a histogram with fixed bucket boundaries.
+
+        Parameters:
+            buckets (list): Upper bounds of the buckets. Values above the largest bound are counted in an
+                            extra overflow bucket.
+
+        The histogram only stores one counter per bucket, so its memory does not grow with the number
+        of observed values.
+
+        Example usage:
+        ```
+        histogram = Histogram(buckets=[1, 2, 4, 8])
+        histogram.observe(3)
+        print(histogram.snapshot())
+        ```
+        """
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        """
+        Record a value.
+
+        Parameters:
+            value (float): The observed value.
+        """
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile of the observed values.
+
+        Parameters:
+            q (float): The quantile, between 0 and 1 (e.g. 0.95 for the 95th percentile).
+
+        Returns:
+            float: The estimated quantile, interpolated linearly inside the bucket where it falls, or None if
+                   no value was observed. Quantiles falling in the overflow bucket are reported as the largest
+                   bucket bound.
+        """
+        with self._lock:
+            if not self.count:
+                return None
+
+            rank = q * self.count
+            cumulative = 0
+            for index, count in enumerate(self.counts):
+                if cumulative + count >= rank and count:
+                    if index == len(self.buckets):
+                        return self.buckets[-1]
+
+                    # Interpolate between the bounds of the bucket, the first bucket starts at 0
+                    lower = self.buckets[index - 1] if index > 0 else 0.0
+                    upper = self.buckets[index]
+                    return lower + (upper - lower) * (rank - cumulative) / count
+
+                cumulative += count
+
+            return self.buckets[-1]
+
+    def snapshot(self) -> dict:
+        """
+        Report the content of the histogram.
+
+        Returns:
+            dict: The number of values in each bucket by upper bound ('+Inf' for the overflow bucket),
+                  and the count, sum and mean of the observed values.
+        """
+        with self._lock:
+            bounds = self.buckets + ['+Inf']
+            return {
+                'buckets': dict(zip(bounds, self.counts)),
+                'count': self.count,
+                'sum': self.sum,
+                'mean': self.sum / self.count if self.count else 0.0,
+            }
@@ -0,0 +1,171 @@
+import time
+import threading
+import numpy as np
+from contextlib import contextmanager
+from PIL import Image
+
+from multihugginggradio.utils.metrics.histogram import Histogram
+
+# Histogram buckets of the durations (in seconds) and of the payload sizes (in bytes)
+SECONDS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 600]
+BYTES_BUCKETS = [4 ** exponent for exponent in range(4, 14)]  # 256 bytes to 64 MiB
+
+
+class RequestMetrics(object):
+    # Recorded metrics, with their histogram buckets and description
+    METRICS = {
+        'load_seconds': (SECONDS_BUCKETS, 'Seconds spent loading a model.'),
+        'demote_seconds': (SECONDS_BUCKETS, 'Seconds spent moving a model from its device to host memory.'),
+        'promote_seconds': (SECONDS_BUCKETS, 'Seconds spent moving a model from host memory back to its device.'),
+        'queue_wait_seconds': (SECONDS_BUCKETS, 'Seconds a request waited for a scheduler slot.'),
+        'inference_seconds': (SECONDS_BUCKETS, 'Seconds spent running the model on a request.'),
+        'payload_bytes': (BYTES_BUCKETS, 'Bytes of the input of a request.'),
+    }
+
+    # Quantiles reported by `summary`
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, namespace: str = 'multihugginggradio'):
+        """
+        Initialize a set of request metrics kept in fixed-size histograms per task and model.
+
+        Parameters:
+            namespace (str): Prefix of the metric names in the text exposition. Defaults to 'multihugginggradio'.
+
+        Each metric of `METRICS` has one histogram per task and model, so the memory used only grows with the
+        number of models served, not with the number of requests. The quantiles are estimated from the
+        histogram buckets.
+
+        Example usage:
+        ```
+        metrics = RequestMetrics()
+        with metrics.timer('inference_seconds', 'Chat', 'databricks/dolly-v2-3b'):
+            response = model.infer(prompt)
+        print(metrics.summary())
+        print(metrics.export_text())
+        ```
+        """
+        self.namespace = namespace
+
+        # Histograms by metric name, then by task and model name
+        self._histograms = {name: {} for name in self.METRICS}
+        self._lock = threading.Lock()
+
+    def observe(self, metric: str, task: str, model_name: str, value: float):
+        """
+        Record a value of a metric.
+
+        Parameters:
+            metric (str): The name of the metric, one of `METRICS`.
+            task (str): The task of the request.
+            model_name (str): The model used by the request.
+            value (float): The observed value.
+        """
+        if metric not in self.METRICS:
+            raise ValueError(f'Unknown metric {metric}, expected one of {list(self.METRICS)}')
+
+        with self._lock:
+            histogram = self._histograms[metric].get((task, model_name))
+            if histogram is None:
+                histogram = self._histograms[metric][(task, model_name)] = Histogram(self.METRICS[metric][0])
+
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, metric: str, task: str, model_name: str):
+        """
+        Context manager recording the seconds spent in its block, if it does not raise.
+
+        Parameters:
+            metric (str): The name of the metric, one of `METRICS`.
+            task (str): The task of the request.
+            model_name (str): The model used by the request.
+        """
+        start_time = time.perf_counter()
+        yield
+        self.observe(metric, task, model_name, time.perf_counter() - start_time)
+
+    def summary(self) -> dict:
+        """
+        Report the quantiles of the metrics.
+
+        Returns:
+            dict: For each task and model with observations, the 'count', 'mean', 'p50', 'p95' and 'p99' of each
+                  metric recorded for them.
+        """
+        with self._lock:
+            histograms = {metric: dict(series) for metric, series in self._histograms.items()}
+
+        summary = {}
+        for metric, series in histograms.items():
+            for (task, model_name), histogram in series.items():
+                snapshot = histogram.snapshot()
+                metric_summary = {'count': snapshot['count'], 'mean': snapshot['mean']}
+                for q in self.QUANTILES:
+                    metric_summary[f'p{round(q * 100)}'] = histogram.quantile(q)
+
+                summary.setdefault((task, model_name), {})[metric] = metric_summary
+
+        return summary
+
+    def export_text(self) -> str:
+        """
+        Export the histograms in the Prometheus text exposition format.
+
+        Returns:
+            str: One histogram family per metric, with cumulative bucket counts, sum and count per task and model.
+        """
+        with self._lock:
+            histograms = {metric: dict(series) for metric, series in self._histograms.items()}
+
+        lines = []
+        for metric, series in histograms.items():
+            name = f'{self.namespace}_{metric}'
+            lines.append(f'# HELP {name} {self.METRICS[metric][1]}')
+            lines.append(f'# TYPE {name} histogram')
+
+            for (task, model_name), histogram in series.items():
+                labels = f'task="{_escape_label(task)}",model="{_escape_label(model_name)}"'
+                snapshot = histogram.snapshot()
+
+                # Prometheus buckets count the values below or equal to their bound, so they are cumulative
+                cumulative = 0
+                for bound, count in snapshot['buckets'].items():
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+
+                lines.append(f'{name}_sum{{{labels}}} {snapshot["sum"]}')
+                lines.append(f'{name}_count{{{labels}}} {snapshot["count"]}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label(value: str) -> str:
+    """
+    Escape a label value of the text exposition format.
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def payload_size(value) -> int:
+    """
+    Compute the size in bytes of the input of a request.
+
+    Parameters:
+        value: The input: a string, bytes, a np.array, a PIL image or None.
+
+    Returns:
+        int: The number of bytes of the encoded string, of the bytes, of the array data, or of the decoded image pixels.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value.encode())
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, Image.Image):
+        return value.width * value.height * len(value.getbands())
+
+    raise TypeError(f'Unsupported payload type {type(value).__name__}')
@@ -0,0 +1,233 @@
+import os
+import re
+import time
+import threading
+import torch
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+from multihugginggradio.utils.metrics.histogram import Histogram
+
+# Histogram buckets of the stage durations, in seconds
+STAGE_SECONDS_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100]
+
+# Only one torch profiler can record at a time in a process
+_TRACE_LOCK = threading.Lock()
+
+
+class StageProfiler(object):
+    # Quantiles reported by `stats`
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, name: str):
+        """
+        Initialize a profiler timing the stages of the runs of a model.
+
+        Parameters:
+            name (str): The name of the profiled model, used in the names of the trace files.
+
+        A run is one call of the model, wrapped in `run`, such as a forward pass over a batch of merged
+        requests. Inside a run, each stage (tokenization, forward pass, denoising loop, ...) is timed with
+        `stage` or with the forward hooks added by `time_module`. The durations are kept in fixed-size
+        histograms per stage, and the hooks added with `add_hook` receive the stage durations of each run.
+
+        `capture_trace` records the next runs with `torch.profiler`, with each stage labelled, and writes
+        a Chrome trace file per run that can be opened in chrome://tracing or Perfetto.
+
+        Example usage:
+        ```
+        profiler = StageProfiler('google/vit-base-patch16-224')
+        profiler.add_hook(lambda timings: print(timings))
+        profiler.capture_trace(2, 'traces')
+        with profiler.run():
+            with profiler.stage('preprocess'):
+                pixel_values = processor(images)
+            with profiler.stage('forward'):
+                logits = model(pixel_values)
+        print(profiler.stats())
+        ```
+        """
+        self.name = name
+        self.hooks = []
+        # Paths of the trace files written so far
+        self.trace_files = []
+
+        self._histograms = OrderedDict()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._traces_left = 0
+        self._trace_dir = None
+
+    def add_hook(self, hook):
+        """
+        Add a function called after each run.
+
+        Parameters:
+            hook (callable): Function receiving a dictionary with the seconds spent in each stage of the run,
+                             and in the whole run as 'total'.
+        """
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """
+        Remove a function added with `add_hook`.
+        """
+        self.hooks.remove(hook)
+
+    def capture_trace(self, num_runs: int, trace_dir: str = 'traces'):
+        """
+        Record the next runs with the torch profiler.
+
+        Parameters:
+            num_runs (int): Number of runs to record, 0 cancels the runs not recorded yet.
+            trace_dir (str): Directory where a Chrome trace file is written per run. Defaults to 'traces'.
+
+        Runs that start while another run of the process is recorded are not recorded and do not count.
+        """
+        with self._lock:
+            self._traces_left = num_runs
+            self._trace_dir = trace_dir
+
+    @contextmanager
+    def run(self):
+        """
+        Context manager timing one run of the model, and recording it if a trace was requested.
+        """
+        timings = OrderedDict()
+        parent_timings = getattr(self._local, 'timings', None)
+        self._local.timings = timings
+
+        trace = self._start_trace()
+        start_time = time.perf_counter()
+        try:
+            yield
+            timings['total'] = time.perf_counter() - start_time
+        finally:
+            self._local.timings = parent_timings
+            if trace is not None:
+                self._stop_trace(trace)
+
+        for stage, seconds in timings.items():
+            self._observe(stage, seconds)
+
+        for hook in list(self.hooks):
+            hook(dict(timings))
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Context manager timing a stage of the current run. Stages run several times in a run are summed.
+
+        Parameters:
+            name (str): The name of the stage.
+        """
+        start_time = time.perf_counter()
+        with torch.profiler.record_function(name) if getattr(self._local, 'tracing', False) else nullcontext():
+            yield
+
+        self._add(name, time.perf_counter() - start_time)
+
+    def time_module(self, module: torch.nn.Module, name: str) -> list:
+        """
+        Time the forward passes of a module as a stage of the runs that call it.
+
+        Parameters:
+            module (torch.nn.Module): The module, such as the UNet of a diffusion pipeline.
+            name (str): The name of the stage.
+
+        Returns:
+            list: The handles of the forward hooks, whose `remove` method stops the timing.
+        """
+        def start(module, inputs):
+            starts = getattr(self._local, 'module_starts', None)
+            if starts is None:
+                starts = self._local.module_starts = {}
+            starts.setdefault(id(module), []).append(time.perf_counter())
+
+        def stop(module, inputs, outputs):
+            self._add(name, time.perf_counter() - self._local.module_starts[id(module)].pop())
+
+        return [module.register_forward_pre_hook(start), module.register_forward_hook(stop)]
+
+    def stats(self) -> dict:
+        """
+        Report the durations of the stages over the runs so far.
+
+        Returns:
+            dict: For each stage, the number of runs it was timed in ('count'), and the 'mean', 'p50', 'p95'
+                  and 'p99' of its seconds per run.
+        """
+        with self._lock:
+            histograms = dict(self._histograms)
+
+        stats = {}
+        for stage, histogram in histograms.items():
+            snapshot = histogram.snapshot()
+            stats[stage] = {'count': snapshot['count'], 'mean': snapshot['mean']}
+            for q in self.QUANTILES:
+                stats[stage][f'p{round(q * 100)}'] = histogram.quantile(q)
+
+        return stats
+
+    def _add(self, stage: str, seconds: float):
+        """
+        Add the duration of a stage to the current run of the thread, if any.
+        """
+        timings = getattr(self._local, 'timings', None)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    def _observe(self, stage: str, seconds: float):
+        """
+        Record the duration of a stage in its histogram.
+        """
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(STAGE_SECONDS_BUCKETS)
+
+        histogram.observe(seconds)
+
+    def _start_trace(self):
+        """
+        Start the torch profiler if the run should be recorded.
+
+        Returns:
+            The running torch profiler with the directory of its trace, or None if the run is not recorded.
+        """
+        with self._lock:
+            if self._traces_left <= 0 or not _TRACE_LOCK.acquire(blocking=False):
+                return None
+
+            self._traces_left -= 1
+            trace_dir = self._trace_dir
+
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+
+        profiler = torch.profiler.profile(activities=activities, record_shapes=True)
+        profiler.__enter__()
+        self._local.tracing = True
+
+        return profiler, trace_dir
+
+    def _stop_trace(self, trace: tuple):
+        """
+        Stop the torch profiler of a recorded run and write its trace file.
+        """
+        profiler, trace_dir = trace
+        try:
+            profiler.__exit__(None, None, None)
+            self._local.tracing = False
+
+            os.makedirs(trace_dir, exist_ok=True)
+            file_name = f"{re.sub(r'[^A-Za-z0-9_.-]+', '_', self.name)}_{time.strftime('%Y%m%d-%H%M%S')}" \
+                f"_{len(self.trace_files)}.json"
+            path = os.path.join(trace_dir, file_name)
+            profiler.export_chrome_trace(path)
+
+            with self._lock:
+                self.trace_files.append(path)
+        finally:
+            _TRACE_LOCK.release()
@@ -0,0 +1,225 @@
+import math
+import time
+import itertools
+import threading
+from contextlib import contextmanager
+
+
+class Ticket(object):
+    """
+    A request waiting for, or holding, a slot of the RequestScheduler.
+    """
+    def __init__(self, task: str, model_name: str, session_id: str, priority: int, sequence: int, session_rank: int):
+        self.task = task
+        self.model_name = model_name
+        self.session_id = session_id
+        self.priority = priority
+        self.sequence = sequence
+        # Number of requests of the same session that were waiting or running when this one was submitted
+        self.session_rank = session_rank
+        self.started = threading.Event()
+        self.start_time = None
+
+    @property
+    def order(self) -> tuple:
+        """
+        tuple: The sort key of the waiting requests: priority class first, then the requests of the sessions
+               with fewer requests ahead, then the submission order.
+        """
+        return self.priority, self.session_rank, self.sequence
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Wait until the request is given a slot.
+
+        Parameters:
+            timeout (float): Maximum number of seconds to wait. Defaults to None, which waits indefinitely.
+
+        Returns:
+            bool: Whether the request was given a slot.
+        """
+        return self.started.wait(timeout)
+
+
+class RequestScheduler(object):
+    def __init__(
+        self,
+        max_running: int = None,
+        task_limits: dict = None,
+        model_limits: dict = None,
+        priorities: dict = None,
+        clock=time.monotonic,
+    ):
+        """
+        Initialize a scheduler that limits how many requests of each task and model run at once.
+
+        Parameters:
+            max_running (int): Maximum number of requests running at once over all the tasks. None disables
+                               the limit. Defaults to None.
+            task_limits (dict): Maximum number of requests running at once for each task. Tasks not listed
+                                (or set to None) are not limited. Defaults to None.
+            model_limits (dict): Maximum number of requests running at once for each model name. Models not
+                                 listed (or set to None) are only limited by their task. Defaults to None.
+            priorities (dict): Priority class of each task, lower classes are started first. Tasks not listed
+                               have the lowest priority. Defaults to None.
+            clock (callable): Function returning the current time in seconds. Defaults to time.monotonic.
+
+        Requests wait in a single queue ordered by priority class, then by the number of requests their
+        session already has waiting or running, so one session cannot monopolize a task, and then by
+        submission order. Whenever a slot frees up, the first waiting requests whose task and model have
+        a free slot are started, as long as fewer than `max_running` requests run. A request is never held
+        back by a request that is blocked on the limit of another task or model, so cheap tasks do not sit
+        behind expensive ones.
+
+        The durations of the finished requests are averaged per task and model to estimate the wait of
+        the queued requests.
+
+        Example usage:
+        ```
+        scheduler = RequestScheduler(max_running=4, task_limits={'Image Generation': 1}, priorities={'Chat': 0})
+        with scheduler.slot('Image Generation', 'CompVis/stable-diffusion-v1-4', session_id='abc'):
+            image = model.infer(prompt)
+        ```
+        """
+        self.max_running = max_running if max_running is not None else math.inf
+        self.task_limits = {task: limit for task, limit in (task_limits or {}).items() if limit is not None}
+        self.model_limits = {model_name: limit for model_name, limit in (model_limits or {}).items() if limit is not None}
+        self.priorities = priorities or {}
+        self.clock = clock
+
+        self._waiting = []
+        self._running = []
+        self._sequence = itertools.count()
+        # Moving average of the durations of the requests, by task and model
+        self._durations = {}
+        self._lock = threading.Lock()
+
+    def submit(self, task: str, model_name: str, session_id: str = None) -> Ticket:
+        """
+        Queue a request without waiting for its slot.
+
+        Parameters:
+            task (str): The task of the request.
+            model_name (str): The model used by the request.
+            session_id (str): The session the request comes from. Defaults to None.
+
+        Returns:
+            Ticket: The ticket of the request, started once a slot is free. It must be given back with `release`.
+        """
+        with self._lock:
+            session_rank = sum(ticket.session_id == session_id for ticket in self._waiting + self._running)
+            priority = self.priorities.get(task, max(self.priorities.values(), default=0) + 1)
+            ticket = Ticket(task, model_name, session_id, priority, next(self._sequence), session_rank)
+            self._waiting.append(ticket)
+            self._dispatch()
+
+        return ticket
+
+    def release(self, ticket: Ticket):
+        """
+        Free the slot of a finished request, or cancel a request that is still waiting.
+
+        Parameters:
+            ticket (Ticket): The ticket returned by `submit`.
+        """
+        with self._lock:
+            if ticket in self._running:
+                self._running.remove(ticket)
+
+                # Record the duration of the request for the wait estimates
+                duration = self.clock() - ticket.start_time
+                key = (ticket.task, ticket.model_name)
+                average = self._durations.get(key)
+                self._durations[key] = duration if average is None else 0.8 * average + 0.2 * duration
+            elif ticket in self._waiting:
+                self._waiting.remove(ticket)
+
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, task: str, model_name: str, session_id: str = None):
+        """
+        Context manager waiting for a slot and freeing it on exit.
+
+        Parameters:
+            task (str): The task of the request.
+            model_name (str): The model used by the request.
+            session_id (str): The session the request comes from. Defaults to None.
+        """
+        ticket = self.submit(task, model_name, session_id)
+        try:
+            ticket.wait()
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def position(self, ticket: Ticket) -> tuple:
+        """
+        Report the place of a waiting request in the queue of its task.
+
+        Parameters:
+            ticket (Ticket): The ticket returned by `submit`.
+
+        Returns:
+            tuple: The position of the request among the waiting requests of its task (1 is next, 0 if it is
+                   already running) and the estimated number of seconds before it starts (None while no
+                   request of the task and model has finished yet).
+        """
+        with self._lock:
+            if ticket not in self._waiting:
+                return 0, 0.0
+
+            position = 1 + sum(
+                other.task == ticket.task and other.order < ticket.order for other in self._waiting
+            )
+
+            duration = self._durations.get((ticket.task, ticket.model_name))
+            if duration is None:
+                return position, None
+
+            # Requests ahead are served in waves of the number of requests that can run at once
+            limit = min(
+                self.max_running,
+                self.task_limits.get(ticket.task, math.inf),
+                self.model_limits.get(ticket.model_name, math.inf),
+            )
+            waves = math.ceil(position / limit) if limit != math.inf else 1
+
+            return position, waves * duration
+
+    def stats(self) -> dict:
+        """
+        Report the requests waiting and running for each task.
+
+        Returns:
+            dict: For each task with requests, the number of 'waiting' and 'running' requests.
+        """
+        with self._lock:
+            stats = {}
+            for state, tickets in (('waiting', self._waiting), ('running', self._running)):
+                for ticket in tickets:
+                    task_stats = stats.setdefault(ticket.task, {'waiting': 0, 'running': 0})
+                    task_stats[state] += 1
+
+            return stats
+
+    def _dispatch(self):
+        """
+        Start the waiting requests, in queue order, whose task and model have a free slot.
+        """
+        for ticket in sorted(self._waiting, key=lambda ticket: ticket.order):
+            if len(self._running) >= self.max_running:
+                return
+
+            running_task = sum(other.task == ticket.task for other in self._running)
+            running_model = sum(other.model_name == ticket.model_name for other in self._running)
+
+            if running_task >= self.task_limits.get(ticket.task, math.inf):
+                continue
+            if running_model >= self.model_limits.get(ticket.model_name, math.inf):
+                continue
+
+            self._waiting.remove(ticket)
+            self._running.append(ticket)
+            ticket.start_time = self.clock()
+            ticket.started.set()
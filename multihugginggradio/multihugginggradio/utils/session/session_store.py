@@ -0,0 +1,155 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class SessionStore(object):
+    def __init__(
+        self,
+        factory,
+        ttl: float = 3600,
+        max_sessions: int = 100,
+        clock=time.monotonic,
+    ):
+        """
+        Initialize a bounded store of per-session state.
+
+        Parameters:
+            factory (callable): Function without arguments that creates the state of a new session.
+            ttl (float): Number of seconds a session may stay idle before it expires. None disables
+                         the expiration. Defaults to 3600.
+            max_sessions (int): Maximum number of sessions kept at once. When a new session exceeds it,
+                                the least recently used session is evicted. None disables the limit.
+                                Defaults to 100.
+            clock (callable): Function returning the current time in seconds. Defaults to time.monotonic.
+
+        Sessions are created on first access, and idle sessions are expired lazily whenever the store
+        is accessed, so no background thread is needed.
+
+        Example usage:
+        ```
+        sessions = SessionStore(factory=list, ttl=600, max_sessions=10)
+        history = sessions.get('session-id')
+        ```
+        """
+        self.factory = factory
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.clock = clock
+
+        # Session states and last access times, ordered from least to most recently used
+        self._sessions = OrderedDict()
+        self._last_access = {}
+        self._lock = threading.Lock()
+
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self):
+        with self._lock:
+            self._expire()
+            return len(self._sessions)
+
+    def __contains__(self, session_id: str):
+        with self._lock:
+            self._expire()
+            return session_id in self._sessions
+
+    def get(self, session_id: str):
+        """
+        Get the state of a session, creating it if it does not exist or has expired.
+
+        Parameters:
+            session_id (str): The identifier of the session.
+
+        Returns:
+            The state of the session.
+        """
+        with self._lock:
+            self._expire()
+
+            if session_id not in self._sessions:
+                self._sessions[session_id] = self.factory()
+                self.created += 1
+
+                # Evict the least recently used sessions above the limit
+                while self.max_sessions is not None and len(self._sessions) > self.max_sessions:
+                    evicted_id, _ = self._sessions.popitem(last=False)
+                    del self._last_access[evicted_id]
+                    self.evicted += 1
+
+            self._sessions.move_to_end(session_id)
+            self._last_access[session_id] = self.clock()
+
+            return self._sessions[session_id]
+
+    def set(self, session_id: str, state):
+        """
+        Replace the state of a session.
+
+        Parameters:
+            session_id (str): The identifier of the session.
+            state: The new state of the session.
+        """
+        self.get(session_id)
+
+        with self._lock:
+            self._sessions[session_id] = state
+
+    def values(self) -> list:
+        """
+        Get the states of the active sessions, without marking them as used.
+
+        Returns:
+            list: The states of the sessions, from the least to the most recently used.
+        """
+        with self._lock:
+            self._expire()
+            return list(self._sessions.values())
+
+    def discard(self, session_id: str):
+        """
+        Remove a session from the store if it exists.
+
+        Parameters:
+            session_id (str): The identifier of the session.
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._last_access.pop(session_id, None)
+
+    def stats(self) -> dict:
+        """
+        Report the number of sessions.
+
+        Returns:
+            dict: The number of active sessions and the number of sessions created, expired and evicted so far.
+        """
+        with self._lock:
+            self._expire()
+            return {
+                'active': len(self._sessions),
+                'created': self.created,
+                'expired': self.expired,
+                'evicted': self.evicted,
+            }
+
+    def _expire(self):
+        """
+        Remove the sessions that have been idle for longer than the TTL.
+        """
+        if self.ttl is None:
+            return
+
+        now = self.clock()
+
+        # Sessions are ordered by last access, so the idle ones are at the beginning
+        while self._sessions:
+            session_id = next(iter(self._sessions))
+            if now - self._last_access[session_id] <= self.ttl:
+                break
+
+            del self._sessions[session_id]
+            del self._last_access[session_id]
+            self.expired += 1
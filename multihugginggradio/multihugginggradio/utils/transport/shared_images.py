@@ -0,0 +1,305 @@
+import threading
+import numpy as np
+from collections import OrderedDict
+from multiprocessing import shared_memory
+from PIL import Image
+
+# Smallest segment created, smaller images share the same size class
+MIN_SEGMENT_BYTES = 64 * 1024
+
+# Modes of the PIL images whose pixels are uint8 arrays, the other images are not put in segments
+UINT8_MODES = ('L', 'LA', 'RGB', 'RGBA', 'RGBX', 'CMYK', 'YCbCr', 'HSV')
+
+
+class ImageHandle(object):
+    """
+    A picklable reference to an image stored in a shared memory segment.
+    """
+    __slots__ = ('name', 'shape', 'mode')
+
+    def __init__(self, name: str, shape: tuple, mode: str = None):
+        # Name of the segment, shape of the uint8 pixel array, and the mode of the PIL image it came from (if any)
+        self.name = name
+        self.shape = shape
+        self.mode = mode
+
+    def __getstate__(self):
+        return self.name, self.shape, self.mode
+
+    def __setstate__(self, state):
+        self.name, self.shape, self.mode = state
+
+    def __repr__(self):
+        return f'ImageHandle({self.name!r}, {self.shape}, {self.mode!r})'
+
+
+class SharedImagePool(object):
+    def __init__(self, max_free_segments: int = 16, max_attached: int = 64):
+        """
+        Initialize a pool of shared memory segments used to pass images between processes without pickling them.
+
+        Parameters:
+            max_free_segments (int): Number of released segments kept for reuse, the other ones are freed.
+                                     Defaults to 16.
+            max_attached (int): Number of segments of other processes kept attached, so reading the next image
+                                from a reused segment does not map it again. Defaults to 64.
+
+        The sender copies the decoded pixels of an image once into a segment with `put`, and sends the small
+        ImageHandle returned instead of the pixels. The receiver reads the pixels in place with `open`, or
+        copies them into a new image with `get`. Once the receiver is done, the sender gives the segment back
+        with `release`, and the next image of the same size class reuses it instead of creating a new segment.
+
+        Only the process that put an image releases its segment. Segments are created in size classes (powers of
+        two) so images of slightly different sizes reuse the same segments. The receivers must be processes
+        started by the sender or by the same parent, which share its resource tracker, so the segments are
+        only freed by their owner.
+
+        Example usage:
+        ```
+        pool = SharedImagePool()
+        handle = pool.put(image)
+        connection.send(handle)  # The receiver calls pool.open(handle) and replies once done
+        connection.recv()
+        pool.release(handle)
+        ```
+        """
+        self.max_free_segments = max_free_segments
+        self.max_attached = max_attached
+
+        # Segments created by this process, by name, and the free ones by size class
+        self._owned = {}
+        self._in_use = set()
+        self._free = OrderedDict()
+        # Segments of other processes attached for reading, least recently used first
+        self._attached = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.created = 0
+        self.reused = 0
+
+    def put(self, image) -> ImageHandle:
+        """
+        Copy an image into a shared memory segment.
+
+        Parameters:
+            image: A PIL image, or a np.array of uint8 pixels.
+
+        Returns:
+            ImageHandle: The handle of the image. Its segment stays reserved until it is released.
+        """
+        if not is_image(image):
+            raise TypeError(f'Expected a PIL image with uint8 pixels or a uint8 np.array, got {type(image).__name__}')
+
+        mode = None
+        if isinstance(image, Image.Image):
+            mode = image.mode
+            image = np.asarray(image)
+
+        segment = self._reserve(max(image.nbytes, 1))
+        np.ndarray(image.shape, dtype=np.uint8, buffer=segment.buf)[...] = image
+
+        return ImageHandle(segment.name, image.shape, mode)
+
+    def open(self, handle: ImageHandle) -> np.ndarray:
+        """
+        Read an image in place.
+
+        Parameters:
+            handle (ImageHandle): The handle of the image.
+
+        Returns:
+            np.array: A read-only view of the pixels in the shared memory segment, valid until the owner
+                      of the segment releases it.
+        """
+        with self._lock:
+            segment = self._owned.get(handle.name)
+            if segment is None:
+                segment = self._attached.pop(handle.name, None) or shared_memory.SharedMemory(handle.name)
+                self._attached[handle.name] = segment
+                self._detach_oldest()
+
+        view = np.ndarray(handle.shape, dtype=np.uint8, buffer=segment.buf)
+        view.flags.writeable = False
+
+        return view
+
+    def get(self, handle: ImageHandle):
+        """
+        Copy an image out of its segment.
+
+        Parameters:
+            handle (ImageHandle): The handle of the image.
+
+        Returns:
+            The image as it was put: a PIL image or a np.array, which no longer depends on the segment.
+        """
+        view = self.open(handle)
+        if handle.mode is not None:
+            # PIL maps the buffer of some modes (such as RGBA) instead of copying it
+            image = Image.fromarray(view, mode=handle.mode)
+            return image.copy() if image.readonly else image
+
+        return view.copy()
+
+    def release(self, handle: ImageHandle):
+        """
+        Give back the segment of an image put by this process, so the next image can reuse it.
+
+        Parameters:
+            handle (ImageHandle): The handle returned by `put`.
+        """
+        with self._lock:
+            if handle.name not in self._in_use:
+                raise ValueError(f'{handle} was not put by this pool or was already released')
+
+            self._in_use.remove(handle.name)
+            segment = self._owned[handle.name]
+            self._free.setdefault(segment.size, []).append(segment)
+            self._free.move_to_end(segment.size)
+
+            # Free the segments of the size classes released the longest ago beyond the segments kept for reuse
+            while sum(len(segments) for segments in self._free.values()) > self.max_free_segments:
+                size = next(iter(self._free))
+                self._unlink(self._free[size].pop(0))
+                if not self._free[size]:
+                    del self._free[size]
+
+    def stats(self) -> dict:
+        """
+        Report the use of the segments.
+
+        Returns:
+            dict: The number of segments 'owned', 'in_use' and 'attached', the bytes of the owned segments
+                  ('owned_bytes'), and the number of segments 'created' and 'reused' by `put`.
+        """
+        with self._lock:
+            return {
+                'owned': len(self._owned),
+                'in_use': len(self._in_use),
+                'attached': len(self._attached),
+                'owned_bytes': sum(segment.size for segment in self._owned.values()),
+                'created': self.created,
+                'reused': self.reused,
+            }
+
+    def close(self):
+        """
+        Detach the segments of other processes and free the segments of this process, even those in use.
+        """
+        with self._lock:
+            for segment in self._attached.values():
+                _close(segment)
+            for segment in list(self._owned.values()):
+                self._unlink(segment)
+
+            self._attached.clear()
+            self._in_use.clear()
+            self._free.clear()
+
+    def _reserve(self, nbytes: int) -> shared_memory.SharedMemory:
+        """
+        Take a free segment of the size class of an image, or create one.
+        """
+        size = max(MIN_SEGMENT_BYTES, 1 << (nbytes - 1).bit_length())
+
+        with self._lock:
+            segments = self._free.get(size)
+            if segments:
+                segment = segments.pop()
+                if not segments:
+                    del self._free[size]
+                self.reused += 1
+            else:
+                segment = shared_memory.SharedMemory(create=True, size=size)
+                self._owned[segment.name] = segment
+                self.created += 1
+
+            self._in_use.add(segment.name)
+
+        return segment
+
+    def _unlink(self, segment: shared_memory.SharedMemory):
+        """
+        Free a segment of this process.
+        """
+        del self._owned[segment.name]
+        self._in_use.discard(segment.name)
+        _close(segment)
+        segment.unlink()
+
+    def _detach_oldest(self):
+        """
+        Detach the segments of other processes read the longest ago, beyond `max_attached`.
+        """
+        while len(self._attached) > self.max_attached:
+            _close(self._attached.popitem(last=False)[1])
+
+
+def _close(segment: shared_memory.SharedMemory):
+    """
+    Unmap a segment, unless views of its pixels are still alive, in which case it is unmapped with them.
+    """
+    try:
+        segment.close()
+    except BufferError:
+        pass
+
+
+def is_image(value) -> bool:
+    """
+    Whether a value is an image sent through shared memory: a PIL image or a np.array of uint8 pixels.
+    """
+    if isinstance(value, Image.Image):
+        return value.mode in UINT8_MODES
+
+    return isinstance(value, np.ndarray) and value.dtype == np.uint8
+
+
+def put_images(value, pool: SharedImagePool, handles: list):
+    """
+    Replace the images of a value, and of the lists, tuples and dictionaries it contains, with handles.
+
+    Parameters:
+        value: The value, such as the arguments of a request.
+        pool (SharedImagePool): The pool the images are put in.
+        handles (list): List the new handles are appended to, to release them later.
+
+    Returns:
+        The value with an ImageHandle in place of each image.
+    """
+    if is_image(value):
+        handle = pool.put(value)
+        handles.append(handle)
+        return handle
+    if isinstance(value, (list, tuple)):
+        return type(value)(put_images(item, pool, handles) for item in value)
+    if isinstance(value, dict):
+        return {key: put_images(item, pool, handles) for key, item in value.items()}
+
+    return value
+
+
+def open_images(value, pool: SharedImagePool, copy: bool = False, handles: list = None):
+    """
+    Replace the handles of a value, and of the lists, tuples and dictionaries it contains, with their images.
+
+    Parameters:
+        value: The value with handles, as returned by `put_images`.
+        pool (SharedImagePool): The pool of the receiving process.
+        copy (bool): Whether to copy the images out of their segments (see `SharedImagePool.get`) instead of
+                     reading them in place (see `SharedImagePool.open`). Defaults to False.
+        handles (list): Optional list the handles found are appended to. Defaults to None.
+
+    Returns:
+        The value with the images in place of the handles.
+    """
+    if isinstance(value, ImageHandle):
+        if handles is not None:
+            handles.append(value)
+        return pool.get(value) if copy else pool.open(value)
+    if isinstance(value, (list, tuple)):
+        return type(value)(open_images(item, pool, copy, handles) for item in value)
+    if isinstance(value, dict):
+        return {key: open_images(item, pool, copy, handles) for key, item in value.items()}
+
+    return value
@@ -0,0 +1,39 @@
+import sys
+import pathlib
+import pytest
+
+# The tests import the package and the tiny models of the benchmarks from the project directory, which pytest
+# does not put first in the path when it runs from the parent directory of the project
+PROJECT_DIR = str(pathlib.Path(__file__).parents[1])
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+
+class MockClock:
+    """
+    Manually advanced clock used to test timeouts and estimated waits.
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    """
+    Fixture providing a clock starting at 0 that only advances when its `now` attribute is set.
+    """
+    return MockClock()
+
+
+@pytest.fixture(scope='module')
+def project_path():
+    """
+    Fixture putting the project directory first in the path the other processes import the package from,
+    since pytest puts the parent directory of the project first.
+    """
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.syspath_prepend(str(pathlib.Path(__file__).parents[1]))
+        yield
@@ -58,7 +58,7 @@ class TestGradioApp:
         assert hasattr(gradio_app, 'seed'), "GradioApp does not have 'seed' attribute."
         assert hasattr(gradio_app, 'verbose'), "GradioApp does not have 'verbose' attribute."
         assert hasattr(gradio_app, 'models'), "GradioApp does not have 'models' attribute."
-        assert hasattr(gradio_app, 'timers'), "GradioApp does not have 'timers' attribute."
+        assert hasattr(gradio_app, 'metrics'), "GradioApp does not have 'metrics' attribute."
 
     def test_available_models(self, gradio_app):
         """
@@ -0,0 +1,161 @@
+import io
+import base64
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from benchmarks.tiny_models import (
+    build_tiny_chat_model,
+    build_tiny_image_class_model,
+    build_tiny_image_gen_model,
+)
+from multihugginggradio.interface.gradio_ui import GradioApp
+from multihugginggradio.models.model_store import ModelStore
+
+
+@pytest.fixture(scope='module')
+def api_app(tmp_path_factory):
+    """
+    Fixture providing a GradioApp serving tiny local models, whose interface is not launched.
+    """
+    app = GradioApp(model_config='config.yaml')
+    app.available_models = {
+        'Chat': [build_tiny_chat_model(str(tmp_path_factory.mktemp('tiny_chat_model')))],
+        'Image Classification': [build_tiny_image_class_model(str(tmp_path_factory.mktemp('tiny_image_class_model')))],
+        'Image Generation': [build_tiny_image_gen_model(str(tmp_path_factory.mktemp('tiny_image_gen_model')))],
+    }
+    app.execution_modes = {model_names[0]: 'fp32' for model_names in app.available_models.values()}
+
+    # The models are converted into a store of their own, the store being disabled in the configuration
+    app.model_store = ModelStore(str(tmp_path_factory.mktemp('model_store')))
+    for model_kwargs in app.model_kwargs.values():
+        model_kwargs['store'] = app.model_store
+
+    yield app
+
+    app.release_models()
+
+
+@pytest.fixture(scope='module')
+def client(api_app):
+    """
+    Fixture providing a client of the HTTP API of the app.
+    """
+    with TestClient(api_app.api.fastapi) as client:
+        yield client
+
+
+def encode_image(seed: int) -> str:
+    """
+    Encode a random image as a base64 PNG file.
+    """
+    buffer = io.BytesIO()
+    Image.fromarray(np.random.default_rng(seed).integers(0, 256, (32, 32, 3), dtype=np.uint8)).save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+class TestHttpAPI:
+    """
+    Test class for the JSON HTTP API served next to the interface.
+    """
+    def test_models(self, api_app, client):
+        """
+        Test that the models of the enabled tasks are listed.
+        """
+        response = client.get('/v1/models')
+
+        assert response.status_code == 200, 'Failed! The models could not be listed'
+        assert response.json() == api_app.available_models, 'Failed! The listed models are not the available models'
+
+    def test_chat_batch(self, api_app, client):
+        """
+        Test that a batch of prompts is answered in one request, each prompt in a new conversation that is not kept.
+        """
+        prompts = ['Hello!', 'How are you?', 'Hello!']
+        response = client.post('/v1/chat', json={'prompts': prompts, 'max_tokens': 8})
+
+        assert response.status_code == 200, 'Failed! The chat request was rejected'
+        body = response.json()
+        assert len(body['responses']) == len(prompts), 'Failed! Expected one response per prompt'
+        assert body['session_ids'] == [None] * len(prompts), 'Failed! Expected no conversation to continue'
+        assert body['responses'][0] == body['responses'][2], 'Failed! The same prompt gave different responses'
+        assert len(api_app.models[body['model']].sessions) == 0, 'Failed! The conversations of the prompts were kept'
+
+        single = client.post('/v1/chat', json={'prompt': 'Hello!', 'max_tokens': 8}).json()
+        assert single['responses'] == body['responses'][:1], 'Failed! A single prompt differs from the same prompt in a batch'
+
+        counts = api_app.metrics.summary()[('Chat', body['model'])]
+        assert counts['payload_bytes']['count'] == len(prompts) + 1, 'Failed! Expected the payload of each prompt recorded'
+
+    def test_chat_session(self, api_app, client):
+        """
+        Test that the prompts of a request with a session identifier are asked in order in that conversation.
+        """
+        response = client.post('/v1/chat', json={'prompts': ['Hello!', 'How are you?'], 'session_id': 'api', 'max_tokens': 8})
+
+        assert response.status_code == 200, 'Failed! The chat request was rejected'
+        body = response.json()
+        assert body['session_ids'] == ['api', 'api'], 'Failed! Expected the conversation of the request'
+
+        history = api_app.models[body['model']].sessions.get('api').conversation_history
+        assert history == ['Hello!', body['responses'][0], 'How are you?', body['responses'][1]], \
+            'Failed! The prompts were not asked in order in the conversation'
+
+    def test_classify_batch(self, api_app, client):
+        """
+        Test that a batch of images is classified with the labels of the single image requests, which are cached.
+        """
+        images = [encode_image(seed) for seed in range(3)]
+        response = client.post('/v1/classify', json={'images': images})
+
+        assert response.status_code == 200, 'Failed! The classification request was rejected'
+        labels = response.json()['labels']
+        assert len(labels) == len(images), 'Failed! Expected one label per image'
+
+        hits = api_app.result_cache.stats()['hits']
+        for image, label in zip(images, labels):
+            assert client.post('/v1/classify', json={'image': image}).json()['labels'] == [label], \
+                'Failed! A single image was classified differently than in a batch'
+        assert api_app.result_cache.stats()['hits'] == hits + len(images), 'Failed! The batch labels were not cached'
+
+    def test_generate(self, api_app, client):
+        """
+        Test that a single image is returned as a PNG body and a batch as a multipart body with a PNG per image,
+        and that the images of a batch are cached.
+        """
+        response = client.post('/v1/generate', json={'prompt': 'A lighthouse', 'seed': 1, 'preset': 'draft'})
+
+        assert response.status_code == 200, 'Failed! The generation request was rejected'
+        assert response.headers['content-type'] == 'image/png', 'Failed! Expected a PNG body'
+        Image.open(io.BytesIO(response.content)).verify()
+
+        response = client.post('/v1/generate', json={'prompts': ['A lighthouse', 'A forest'], 'seeds': [1, 2],
+                                                     'preset': 'draft'})
+
+        assert response.status_code == 200, 'Failed! The batched generation request was rejected'
+        content_type = response.headers['content-type']
+        assert content_type.startswith('multipart/mixed; boundary='), 'Failed! Expected a multipart body'
+        boundary = content_type.split('boundary=')[1]
+        parts = response.content.split(f'--{boundary}'.encode())[1:-1]
+        assert len(parts) == 2, 'Failed! Expected one part per image'
+        assert all(b'Content-Type: image/png' in part for part in parts), 'Failed! Expected PNG parts'
+
+        hits = api_app.result_cache.stats()['hits']
+        response = client.post('/v1/generate', json={'prompt': 'A forest', 'seed': 2, 'preset': 'draft'})
+        assert response.status_code == 200, 'Failed! The generation request was rejected'
+        assert api_app.result_cache.stats()['hits'] == hits + 1, 'Failed! The batch images were not cached'
+
+    def test_invalid_requests(self, api_app, client):
+        """
+        Test that invalid requests are rejected without running a model.
+        """
+        assert client.post('/v1/chat', json={'prompt': 'Hi', 'model': 'unknown/model'}).status_code == 404, \
+            'Failed! A model that is not available was accepted'
+        assert client.post('/v1/chat', json={}).status_code == 422, 'Failed! A request without prompts was accepted'
+        assert client.post('/v1/chat', json={'prompts': ['Hi'] * (api_app.api.max_batch_items + 1)}).status_code == 413, \
+            'Failed! A batch larger than the limit was accepted'
+        assert client.post('/v1/classify', json={'image': 'not an image'}).status_code == 400, \
+            'Failed! An invalid image was accepted'
+        assert client.post('/v1/generate', json={'prompts': ['A', 'B'], 'seeds': [1]}).status_code == 422, \
+            'Failed! A batch with a missing seed was accepted'
@@ -0,0 +1,65 @@
+import pytest
+
+from benchmarks.tiny_models import (
+    build_tiny_chat_model,
+    build_tiny_image_class_model,
+    build_tiny_image_gen_model,
+    build_tiny_instruction_chat_model,
+    build_tiny_unclip_model,
+)
+
+
+@pytest.fixture(scope='session')
+def tiny_chat_model_path(tmp_path_factory):
+    """
+    Fixture providing the path to a tiny local chat model.
+    """
+    return build_tiny_chat_model(str(tmp_path_factory.mktemp('tiny_chat_model')))
+
+
+@pytest.fixture(scope='session')
+def tiny_sampling_chat_model_path(tmp_path_factory):
+    """
+    Fixture providing the path to a tiny local chat model that samples its responses.
+    """
+    return build_tiny_chat_model(str(tmp_path_factory.mktemp('tiny_sampling_chat_model')), do_sample=True)
+
+
+@pytest.fixture(scope='session')
+def tiny_draft_chat_model_path(tmp_path_factory):
+    """
+    Fixture providing the path to a smaller tiny local chat model with the same tokenizer, used as a draft model.
+    """
+    return build_tiny_chat_model(str(tmp_path_factory.mktemp('tiny_draft_chat_model')), num_layers=1, hidden_size=16)
+
+
+@pytest.fixture(scope='session')
+def tiny_instruction_chat_model_path(tmp_path_factory):
+    """
+    Fixture providing the path to a tiny local chat model with its own instruction text generation pipeline.
+    """
+    return build_tiny_instruction_chat_model(str(tmp_path_factory.mktemp('tiny_instruction_chat_model')))
+
+
+@pytest.fixture(scope='session')
+def tiny_image_class_model_path(tmp_path_factory):
+    """
+    Fixture providing the path to a tiny local image classification model.
+    """
+    return build_tiny_image_class_model(str(tmp_path_factory.mktemp('tiny_image_class_model')))
+
+
+@pytest.fixture(scope='session')
+def tiny_image_gen_model_path(tmp_path_factory):
+    """
+    Fixture providing the path to a tiny local image generation pipeline.
+    """
+    return build_tiny_image_gen_model(str(tmp_path_factory.mktemp('tiny_image_gen_model')))
+
+
+@pytest.fixture(scope='session')
+def tiny_unclip_model_path(tmp_path_factory):
+    """
+    Fixture providing the path to a tiny local unCLIP pipeline, which has no `scheduler` component.
+    """
+    return build_tiny_unclip_model(str(tmp_path_factory.mktemp('tiny_unclip_model')))
@@ -0,0 +1,75 @@
+from multihugginggradio.models.chat_context import ChatContext
+
+
+def count_words(text: str) -> int:
+    """
+    Count the words of a text, used as a simple stand-in for a tokenizer.
+    """
+    return len(text.split())
+
+
+class TestChatContext:
+    def test_token_counts_are_cached(self):
+        """
+        Test that each turn is counted once when it is added.
+        """
+        counted = []
+
+        def count_tokens(text):
+            counted.append(text)
+            return count_words(text)
+
+        context = ChatContext(count_tokens, separator=' ')
+        context.append("Hello there")
+        context.append("General Kenobi")
+        context.build_prompt()
+        context.build_prompt()
+
+        assert counted == [' ', "Hello there", "General Kenobi"], 'Failed! Turns were counted more than once!'
+        assert context.num_tokens == 4, 'Failed! Unexpected number of tokens!'
+
+    def test_prompt_fits_in_budget(self):
+        """
+        Test that the oldest turns are dropped until the prompt fits in the token budget.
+        """
+        context = ChatContext(count_words, max_tokens=20, separator=' ', low_water_ratio=1.0)
+        for turn in range(10):
+            context.append(f"turn {turn} has five words")
+
+        prompt = context.build_prompt(reserved_tokens=5)
+
+        assert count_words(prompt) <= 15, 'Failed! Prompt exceeds the token budget!'
+        assert prompt.endswith("turn 9 has five words"), 'Failed! Latest turn was dropped!'
+        assert context.history[0] == "turn 7 has five words", 'Failed! Unexpected oldest turn!'
+
+    def test_compaction_to_low_water_mark(self):
+        """
+        Test that an overflowing conversation is compacted below the low water mark.
+        """
+        context = ChatContext(count_words, max_tokens=100, separator=' ', low_water_ratio=0.5)
+        for turn in range(21):
+            context.append(f"turn {turn} has five words")
+
+        context.build_prompt()
+
+        assert context.num_tokens <= 50, 'Failed! Conversation was not compacted to the low water mark!'
+
+    def test_latest_turn_is_kept(self):
+        """
+        Test that the latest turn is kept even if it alone exceeds the budget.
+        """
+        context = ChatContext(count_words, max_tokens=2)
+        context.append("a prompt longer than the budget")
+
+        assert context.build_prompt() == "a prompt longer than the budget", 'Failed! Latest turn was dropped!'
+
+    def test_reset(self):
+        """
+        Test that resetting the context replaces its turns and token counts.
+        """
+        context = ChatContext(count_words, separator=' ')
+        context.append("Hello there")
+        context.reset(["General Kenobi"])
+
+        assert context.history == ["General Kenobi"], 'Failed! Unexpected history after reset!'
+        assert context.num_tokens == 2, 'Failed! Unexpected number of tokens after reset!'
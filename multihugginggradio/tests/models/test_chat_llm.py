@@ -1,7 +1,10 @@
+import threading
+import pytest
 import torch
 import sys
 import gc
 from multihugginggradio.models.chat_llm import ChatLLM
+from multihugginggradio.models.kv_cache import ConversationCache
 
 
 class TestChatLLM:
@@ -52,3 +55,341 @@ class TestChatLLM:
             self.model.release()  # This can be problematic with multiple tests using self.model. Change when that happen
             torch.cuda.empty_cache()
             gc.collect()
+
+
+class TestChatLLMStreaming:
+    @pytest.fixture
+    def model(self, tiny_chat_model_path):
+        """
+        Fixture creating a ChatLLM from a tiny local model and releasing it after the test.
+        """
+        model = ChatLLM(tiny_chat_model_path)
+        yield model
+        model.release()
+
+    def test_stream_matches_infer(self, model):
+        """
+        Test that the last value yielded by infer_stream matches the output of infer for the same seed.
+        """
+        expected = model.infer("Hello!", max_tokens=10, seed=33)
+        model.conversation_history = []
+
+        stats = {}
+        outputs = list(model.infer_stream("Hello!", max_tokens=10, seed=33, stats=stats))
+
+        assert outputs[-1] == expected, 'Failed! Streamed output differs from infer output!'
+        assert len(outputs) > 1, 'Failed! Output was not streamed incrementally!'
+        assert stats['num_tokens'] > 0, 'Failed! Generated tokens were not counted!'
+        assert stats['time_to_first_token'] <= stats['total_time'], 'Failed! Unexpected time to first token!'
+        assert stats['tokens_per_second'] > 0, 'Failed! Unexpected tokens per second!'
+
+    def test_stream_updates_history(self, model):
+        """
+        Test that the conversation history is updated once the stream finishes.
+        """
+        outputs = list(model.infer_stream("Hello!", max_tokens=5, seed=33))
+
+        assert model.conversation_history == ["Hello!", outputs[-1]], 'Failed! Unexpected conversation history!'
+
+    def test_abandoned_stream_releases_session(self, model):
+        """
+        Test that a stream whose consumer stops iterating without closing it does not keep its session locked.
+        """
+        stream = model.infer_stream("Hello!", max_tokens=8, seed=33, session_id='abandoned')
+        next(stream)
+
+        answer = []
+        thread = threading.Thread(
+            target=lambda: answer.append(model.infer("Hi!", max_tokens=5, session_id='abandoned')), daemon=True,
+        )
+        thread.start()
+        thread.join(timeout=30)
+
+        assert not thread.is_alive() and answer, 'Failed! The abandoned stream kept its session locked!'
+        assert len(model.sessions.get('abandoned').conversation_history) == 4, \
+            'Failed! The response of the abandoned stream was not added to the history!'
+        stream.close()
+
+
+class TestChatLLMKVCache:
+    @pytest.fixture
+    def model(self, tiny_chat_model_path):
+        """
+        Fixture creating a ChatLLM from a tiny local model and releasing it after the test.
+        """
+        model = ChatLLM(tiny_chat_model_path)
+        yield model
+        model.release()
+
+    def test_cache_reuse_matches_full_prefill(self, model):
+        """
+        Test that reusing the cached keys and values across turns gives the same answers as a full prefill.
+        """
+        prompts = ["Hello!", "The quick brown fox", "jumps over the lazy dog"]
+
+        cached_outputs = []
+        reused_tokens = []
+        for prompt in prompts:
+            cached_outputs.append(model.infer(prompt, max_tokens=8, seed=33))
+            reused_tokens.append(model.kv_cache.reused_tokens)
+
+        # Disable the cache and replay the conversation
+        model.conversation_history = []
+        model.kv_cache = ConversationCache(max_bytes=0)
+        uncached_outputs = [model.infer(prompt, max_tokens=8, seed=33) for prompt in prompts]
+
+        assert cached_outputs == uncached_outputs, 'Failed! Cached generation differs from full prefill!'
+        assert reused_tokens[0] == 0, 'Failed! First turn should not reuse cached tokens!'
+        assert all(tokens > 0 for tokens in reused_tokens[1:]), 'Failed! Warm turns did not reuse the cache!'
+        assert model.kv_cache.num_tokens == 0, 'Failed! Disabled cache kept tokens!'
+
+    def test_cache_dropped_on_history_edit(self, model):
+        """
+        Test that the cache is dropped when the conversation history is edited.
+        """
+        model.infer("Hello!", max_tokens=8, seed=33)
+        model.conversation_history = ["The quick brown fox"]
+        model.infer("jumps over the lazy dog", max_tokens=8, seed=33)
+
+        assert model.kv_cache.reused_tokens == 0, 'Failed! Stale cache was reused after editing the history!'
+
+    def test_cache_memory_cap(self, model):
+        """
+        Test that the cached keys and values stay within the configured memory limit.
+        """
+        model.kv_cache = ConversationCache(max_bytes=4096)
+        model.infer("The quick brown fox jumps over the lazy dog", max_tokens=8, seed=33)
+
+        assert 0 < model.kv_cache.nbytes <= 4096, 'Failed! Cache exceeds the memory limit!'
+
+    def test_total_cache_memory_cap(self, tiny_chat_model_path):
+        """
+        Test that the caches of the least recently used conversations are dropped to keep all the caches within
+        the total memory limit, which is counted in the memory footprint of the model.
+        """
+        model = ChatLLM(tiny_chat_model_path)
+        model.infer("The quick brown fox jumps over the lazy dog", max_tokens=8, seed=33, session_id='session_a')
+        cache_bytes = model.sessions.get('session_a').kv_cache.nbytes
+        weights_bytes = model.memory_footprint()
+        model.release()
+
+        model = ChatLLM(tiny_chat_model_path, kv_cache_total_bytes=cache_bytes * 3 // 2)
+        for session_id in ['session_a', 'session_b', 'session_c']:
+            model.infer("The quick brown fox jumps over the lazy dog", max_tokens=8, seed=33, session_id=session_id)
+        caches = [model.sessions.get(session_id).kv_cache for session_id in ['session_a', 'session_b', 'session_c']]
+
+        assert [cache.nbytes for cache in caches] == [0, 0, cache_bytes], \
+            'Failed! The caches of the least recently used conversations were not dropped first!'
+        assert model.memory_footprint() == weights_bytes + cache_bytes * 3 // 2, \
+            'Failed! The total cache limit is not counted in the memory footprint!'
+        model.release()
+
+    def test_moving_caches_skips_running_sessions(self, model):
+        """
+        Test that moving the caches does not wait for the conversations with a running request.
+        """
+        model.infer("Hello!", max_tokens=8, seed=33, session_id='session_a')
+        session = model.sessions.get('session_a')
+
+        with session.lock:
+            thread = threading.Thread(target=model._move_kv_caches, args=('cpu',))
+            thread.start()
+            thread.join(timeout=10)
+
+            assert not thread.is_alive(), 'Failed! Moving the caches waited for a running request!'
+
+        assert model.infer("How are you?", max_tokens=8, seed=33, session_id='session_a'), 'Failed! Empty answer!'
+        assert session.kv_cache.reused_tokens > 0, 'Failed! The cache was not reused after the move!'
+
+
+class TestChatLLMSessions:
+    @pytest.fixture
+    def model(self, tiny_chat_model_path):
+        """
+        Fixture creating a ChatLLM from a tiny local model and releasing it after the test.
+        """
+        model = ChatLLM(tiny_chat_model_path, max_sessions=2)
+        yield model
+        model.release()
+
+    def test_sessions_do_not_share_history(self, model):
+        """
+        Test that conversations of different sessions are kept apart.
+        """
+        answer_a = model.infer("Hello!", max_tokens=5, seed=33, session_id='session_a')
+        model.infer("The quick brown fox", max_tokens=5, seed=33, session_id='session_b')
+        answer_c = model.infer("Hello!", max_tokens=5, seed=33, session_id='session_c')
+
+        assert answer_a == answer_c, 'Failed! Context of another session leaked into the answer!'
+        assert model.sessions.get('session_c').conversation_history == ["Hello!", answer_c], \
+            'Failed! Unexpected conversation history!'
+        assert model.sessions.stats()['active'] == 2, 'Failed! Number of sessions is not bounded!'
+
+
+class TestChatLLMContextWindow:
+    @pytest.fixture
+    def model(self, tiny_chat_model_path):
+        """
+        Fixture creating a ChatLLM with a small token budget from a tiny local model.
+        """
+        model = ChatLLM(tiny_chat_model_path, context_max_tokens=64)
+        yield model
+        model.release()
+
+    def test_history_stores_only_completions(self, model):
+        """
+        Test that the conversation history stores only the new completion of each turn.
+        """
+        answer = model.infer("Hello!", max_tokens=8, seed=33)
+
+        assert not answer.startswith("Hello!"), 'Failed! Completion contains the prompt!'
+        assert model.conversation_history == ["Hello!", answer], 'Failed! Unexpected conversation history!'
+
+    def test_prompt_tokens_stay_within_budget(self, model):
+        """
+        Test that the number of tokens sent to the model stays within the budget as the conversation grows.
+        """
+        prompt_tokens = []
+        for _ in range(10):
+            model.infer("The quick brown fox jumps over the lazy dog", max_tokens=8, seed=33)
+            prompt_tokens.append(model.sessions.get(ChatLLM.DEFAULT_SESSION).context.last_prompt_tokens)
+
+        assert max(prompt_tokens) <= 64 - 8, 'Failed! Prompt exceeds the token budget!'
+
+
+class TestChatLLMSpeculativeDecoding:
+    def test_same_greedy_output(self, tiny_chat_model_path, tiny_draft_chat_model_path):
+        """
+        Test that the responses of a conversation are the same with and without a draft model.
+        """
+        prompts = ["Hello!", "The quick brown fox", "jumps over the lazy dog"]
+
+        model = ChatLLM(tiny_chat_model_path)
+        expected = [model.infer(prompt, max_tokens=16) for prompt in prompts]
+        model.release()
+
+        model = ChatLLM(tiny_chat_model_path, draft_model_name=tiny_draft_chat_model_path)
+        for prompt, expected_output in zip(prompts, expected):
+            stats = {}
+            outputs = list(model.infer_stream(prompt, max_tokens=16, stats=stats))
+            assert outputs[-1] == expected_output, 'Failed! The draft model changed the response!'
+            assert stats['draft_tokens'] > 0, 'Failed! The draft model did not propose tokens!'
+            assert stats['target_passes'] + stats['accepted_tokens'] == stats['num_tokens'], \
+                'Failed! Unexpected number of accepted tokens!'
+
+        assert model.speculation_stats()['generations'] == len(prompts), 'Failed! Generations were not counted!'
+        model.release()
+
+    def test_accepted_draft_tokens(self, tiny_chat_model_path):
+        """
+        Test that the tokens proposed by a draft model that agrees with the model are accepted, so the model
+        runs fewer forward passes than it generates tokens.
+        """
+        model = ChatLLM(tiny_chat_model_path, draft_model_name=tiny_chat_model_path)
+        stats = {}
+        list(model.infer_stream("Hello!", max_tokens=16, stats=stats))
+
+        assert stats['acceptance_rate'] > 0.5, 'Failed! The tokens of the draft model were not accepted!'
+        assert stats['target_passes'] < stats['num_tokens'], 'Failed! The model ran a forward pass per token!'
+
+        speculation_stats = model.speculation_stats()
+        assert speculation_stats['tokens_per_pass'] > 1, 'Failed! Unexpected number of tokens per forward pass!'
+        model.release()
+
+    def test_sampling_skips_draft(self, tiny_sampling_chat_model_path):
+        """
+        Test that the generations sampling their tokens do not use the draft model.
+        """
+        model = ChatLLM(tiny_sampling_chat_model_path)
+        expected = model.infer("Hello!", max_tokens=16, seed=7)
+        model.release()
+
+        model = ChatLLM(tiny_sampling_chat_model_path, draft_model_name=tiny_sampling_chat_model_path)
+        stats = {}
+        outputs = list(model.infer_stream("Hello!", max_tokens=16, seed=7, stats=stats))
+
+        assert outputs[-1] == expected, 'Failed! The draft model changed the sampled response!'
+        assert 'draft_tokens' not in stats, 'Failed! The draft model proposed sampled tokens!'
+        assert model.speculation_stats()['generations'] == 0, 'Failed! Unexpected speculative generation!'
+        model.release()
+
+
+class TestChatLLMContinuousBatching:
+    PROMPTS = ["Hello!", "The quick brown fox", "jumps over the lazy dog", "a"]
+
+    def run_concurrently(self, model, turns: int, stream: bool = False) -> dict:
+        """
+        Run the turns of a conversation per prompt, the conversations in concurrent threads.
+        """
+        outputs = {}
+
+        def converse(index, prompt):
+            for turn in range(turns):
+                kwargs = {'max_tokens': 6 + 3 * index, 'seed': index, 'session_id': str(index)}
+                if stream:
+                    outputs[index, turn] = list(model.infer_stream(prompt, **kwargs))[-1]
+                else:
+                    outputs[index, turn] = model.infer(prompt, **kwargs)
+
+        threads = [threading.Thread(target=converse, args=item) for item in enumerate(self.PROMPTS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return outputs
+
+    @pytest.mark.parametrize('execution_mode', ['fp32', 'bf16'])
+    def test_same_responses_as_serial(self, tiny_chat_model_path, execution_mode):
+        """
+        Test that concurrent conversations decoded together get the responses of the serial conversations.
+        """
+        model = ChatLLM(tiny_chat_model_path, execution_mode=execution_mode)
+        expected = {}
+        for index, prompt in enumerate(self.PROMPTS):
+            for turn in range(2):
+                expected[index, turn] = model.infer(prompt, max_tokens=6 + 3 * index, seed=index, session_id=str(index))
+        model.release()
+
+        model = ChatLLM(tiny_chat_model_path, execution_mode=execution_mode, max_batch_size=4)
+        outputs = self.run_concurrently(model, turns=2)
+        batch_stats = model.stats()['batch_size']
+        model.release()
+
+        assert outputs == expected, 'Failed! The batched responses differ from the serial responses!'
+        assert batch_stats['mean'] > 1, 'Failed! The concurrent generations were not decoded together!'
+
+    def test_sampled_streams(self, tiny_sampling_chat_model_path):
+        """
+        Test that sampled responses streamed concurrently are the same as the serial responses with the same seeds.
+        """
+        model = ChatLLM(tiny_sampling_chat_model_path)
+        expected = {
+            (index, 0): model.infer(prompt, max_tokens=6 + 3 * index, seed=index, session_id=str(index))
+            for index, prompt in enumerate(self.PROMPTS)
+        }
+        model.release()
+
+        model = ChatLLM(tiny_sampling_chat_model_path, max_batch_size=8)
+        outputs = self.run_concurrently(model, turns=1, stream=True)
+        model.release()
+
+        assert outputs == expected, 'Failed! The batched sampled responses differ from the serial responses!'
+
+    def test_custom_pipeline(self, tiny_instruction_chat_model_path):
+        """
+        Test that the responses of a model with its own pipeline, which passes other keys than the stock text
+        generation pipeline between its steps, are the same when decoded together.
+        """
+        model = ChatLLM(tiny_instruction_chat_model_path)
+        expected = {
+            (index, 0): model.infer(prompt, max_tokens=6 + 3 * index, seed=index, session_id=str(index))
+            for index, prompt in enumerate(self.PROMPTS)
+        }
+        model.release()
+
+        model = ChatLLM(tiny_instruction_chat_model_path, max_batch_size=4)
+        outputs = self.run_concurrently(model, turns=1)
+        model.release()
+
+        assert outputs == expected, 'Failed! The batched responses of the custom pipeline differ from the serial responses!'
@@ -0,0 +1,78 @@
+import numpy as np
+import torch
+from concurrent.futures import ThreadPoolExecutor
+
+from multihugginggradio.models.chat_llm import ChatLLM
+from multihugginggradio.models.image_class_model import ImageClassModel
+from multihugginggradio.models.image_gen_model import ImageGenModel
+
+
+def run_concurrently(function, requests: list) -> list:
+    """
+    Run a function on every request in its own thread, starting them all at once.
+    """
+    with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+        return list(executor.map(function, requests))
+
+
+class TestConcurrentSeeding:
+    def test_chat_llm(self, tiny_sampling_chat_model_path):
+        """
+        Test that concurrent sampled chat responses are the same as serial ones for the same seeds.
+        """
+        chat_llm = ChatLLM(tiny_sampling_chat_model_path, execution_mode='fp32')
+        seeds = [1, 2, 3, 1]
+
+        def infer(request):
+            seed, session_id = request
+            return chat_llm.infer('Hello!', max_tokens=20, seed=seed, session_id=session_id)
+
+        # Every request has its own conversation, so the responses only depend on the seeds
+        serial = [infer((seed, f'serial_{index}')) for index, seed in enumerate(seeds)]
+        rng_state = torch.get_rng_state()
+        concurrent = run_concurrently(infer, [(seed, f'concurrent_{index}') for index, seed in enumerate(seeds)])
+        chat_llm.release()
+
+        assert concurrent == serial, 'Failed! Concurrent responses differ from serial ones!'
+        assert serial[0] == serial[3], 'Failed! Responses with the same seed differ!'
+        assert len(set(serial[:3])) > 1, 'Failed! Responses do not depend on the seed!'
+        assert torch.equal(torch.get_rng_state(), rng_state), 'Failed! Global random state was used!'
+
+    def test_image_class_model(self, tiny_image_class_model_path):
+        """
+        Test that concurrent classifications are the same as serial ones.
+        """
+        model = ImageClassModel(tiny_image_class_model_path)
+        images = [np.full((32, 32, 3), value, dtype=np.uint8) for value in (0, 60, 120, 180)]
+
+        def infer(image):
+            return model.infer(image, return_logits=True)
+
+        serial = [infer(image) for image in images]
+        concurrent = run_concurrently(infer, images)
+        model.release()
+
+        for (serial_class, serial_logits), (concurrent_class, concurrent_logits) in zip(serial, concurrent):
+            assert serial_class == concurrent_class, 'Failed! Concurrent class differs from the serial one!'
+            assert torch.equal(serial_logits, concurrent_logits), 'Failed! Concurrent scores differ from serial ones!'
+
+    def test_image_gen_model(self, tiny_image_gen_model_path):
+        """
+        Test that concurrent generations with a stochastic scheduler are the same as serial ones.
+        """
+        model = ImageGenModel(tiny_image_gen_model_path, execution_mode='fp32')
+        requests = [('A red car', 1), ('A red car', 2), ('A blue boat', 3)]
+
+        def infer(request):
+            prompt, seed = request
+            return np.asarray(model.infer(prompt, seed=seed, num_inference_steps=3, scheduler='euler-ancestral'))
+
+        serial = [infer(request) for request in requests]
+        rng_state = torch.get_rng_state()
+        concurrent = run_concurrently(infer, requests)
+        model.release()
+
+        for serial_image, concurrent_image in zip(serial, concurrent):
+            assert np.array_equal(serial_image, concurrent_image), 'Failed! Concurrent image differs from the serial one!'
+        assert not np.array_equal(serial[0], serial[1]), 'Failed! Images do not depend on the seed!'
+        assert torch.equal(torch.get_rng_state(), rng_state), 'Failed! Global random state was used!'
@@ -0,0 +1,66 @@
+import pytest
+import numpy as np
+import torch
+
+from multihugginggradio.models.chat_llm import ChatLLM
+from multihugginggradio.models.execution_mode import apply_execution_mode, get_torch_dtype, move_modules
+from multihugginggradio.models.image_class_model import ImageClassModel
+from multihugginggradio.models.model_registry import get_module_size
+
+
+class TestExecutionMode:
+    def test_int8_quantizes_linear_layers(self):
+        """
+        Test that the int8 mode replaces the Linear layers by smaller quantized layers in evaluation mode.
+        """
+        module = torch.nn.Sequential(torch.nn.Linear(64, 64), torch.nn.ReLU(), torch.nn.Linear(64, 8))
+        fp32_size = get_module_size(module)
+
+        module = apply_execution_mode(module, 'int8')
+
+        assert not module.training, 'Failed! Model is not in evaluation mode!'
+        assert not any(isinstance(layer, torch.nn.Linear) for layer in module), 'Failed! Linear layers were not quantized!'
+        assert 0 < get_module_size(module) < fp32_size / 2, 'Failed! Unexpected size of the quantized model!'
+
+    def test_move_modules(self):
+        """
+        Test that modules are only moved when they are not already on the device.
+        """
+        modules = [torch.nn.Linear(4, 4), torch.nn.Linear(4, 2)]
+
+        assert not move_modules(modules, 'cpu'), 'Failed! Modules already on the device were reported as moved'
+        assert move_modules(modules, 'meta'), 'Failed! The modules were not moved'
+        assert all(parameter.is_meta for module in modules for parameter in module.parameters()), \
+            'Failed! The parameters are not on the new device'
+
+    def test_unknown_execution_mode(self):
+        """
+        Test that an unknown execution mode is rejected.
+        """
+        with pytest.raises(ValueError):
+            get_torch_dtype('fp8')
+
+    @pytest.mark.parametrize('execution_mode', ['fp32', 'bf16', 'int8'])
+    def test_image_class_model(self, tiny_image_class_model_path, execution_mode):
+        """
+        Test that the image classification model runs in every execution mode without autograd.
+        """
+        model = ImageClassModel(tiny_image_class_model_path, execution_mode=execution_mode)
+        predicted_class, logits = model.infer(np.zeros((64, 64, 3), dtype=np.uint8), return_logits=True)
+        model.release()
+
+        assert predicted_class.startswith('label_'), 'Failed! Unexpected class prediction!'
+        assert logits.is_inference(), 'Failed! Inference did not run in inference mode!'
+
+    @pytest.mark.parametrize('execution_mode', ['fp32', 'int8'])
+    def test_chat_llm(self, tiny_chat_model_path, execution_mode):
+        """
+        Test that the chat model generates a response in fp32 and int8.
+        """
+        chat_llm = ChatLLM(tiny_chat_model_path, execution_mode=execution_mode)
+        response = chat_llm.infer('Hello!', max_tokens=5)
+        model_dtype = chat_llm.model.model.dtype
+        chat_llm.release()
+
+        assert isinstance(response, str), 'Failed! Unexpected response!'
+        assert model_dtype == torch.float32, 'Failed! Unexpected data type of the model!'
@@ -3,9 +3,11 @@ import os
 import sys
 import pathlib
 import gc
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from PIL import Image
 from multihugginggradio.models.image_class_model import ImageClassModel
+from multihugginggradio.utils.cache.result_cache import ResultCache
 
 
 class TestImageClassModel:
@@ -56,3 +58,96 @@ class TestImageClassModel:
         self.model.release()  # This can be problematic with multiple tests using self.model. Change when that happen
         torch.cuda.empty_cache()
         gc.collect()
+
+
+class TestImageClassModelBatching:
+    def test_batched_requests_match_single_requests(self, tiny_image_class_model_path):
+        """
+        Test that concurrent requests classified in one batch get the same results as single requests.
+        """
+        images = [np.full((64, 64, 3), value, dtype=np.uint8) for value in (0, 100, 200)]
+
+        single_model = ImageClassModel(tiny_image_class_model_path)
+        expected = [single_model.infer(image, return_logits=True) for image in images]
+        single_model.release()
+
+        batched_model = ImageClassModel(tiny_image_class_model_path, max_batch_size=3, max_wait_ms=500)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            results = list(executor.map(lambda image: batched_model.infer(image, return_logits=True), images))
+        stats = batched_model.stats()
+        batched_model.release()
+
+        for (expected_class, expected_logits), (predicted_class, logits) in zip(expected, results):
+            assert predicted_class == expected_class, 'Failed! Unexpected class prediction!'
+            assert logits.shape == expected_logits.shape, 'Failed! Unexpected logits shape!'
+            assert torch.allclose(logits, expected_logits, atol=1e-5), 'Failed! Unexpected class scores!'
+
+        assert stats['batch_size']['sum'] == 3, 'Failed! Requests were not processed!'
+        assert stats['batch_size']['count'] < 3, 'Failed! Concurrent requests were not batched!'
+
+
+class TestImageClassModelBulk:
+    def test_infer_batch(self, tiny_image_class_model_path):
+        """
+        Test that streamed batches return the same top label as single requests, with sorted probabilities.
+        """
+        images = [np.full((64, 64, 3), value, dtype=np.uint8) for value in range(0, 250, 25)]
+
+        model = ImageClassModel(tiny_image_class_model_path)
+        expected = [model.infer(image) for image in images]
+        results = list(model.infer_batch(iter(images), batch_size=4, top_k=3))
+        model.release()
+
+        assert len(results) == len(images), 'Failed! Unexpected number of results!'
+        for predictions, expected_class in zip(results, expected):
+            labels = [label for label, _ in predictions]
+            probabilities = [probability for _, probability in predictions]
+            assert len(predictions) == 3, 'Failed! Unexpected number of labels!'
+            assert labels[0] == expected_class, 'Failed! Unexpected class prediction!'
+            assert probabilities == sorted(probabilities, reverse=True), 'Failed! Labels are not sorted!'
+            assert sum(probabilities) <= 1 + 1e-6, 'Failed! Probabilities are not normalized!'
+
+    def test_classify_directory(self, tiny_image_class_model_path, tmp_path):
+        """
+        Test that the images of a directory are classified in order and other files are skipped.
+        """
+        for index in range(3):
+            Image.new('RGB', (32, 32), (index * 80, 0, 0)).save(tmp_path / f'image_{index}.png')
+        (tmp_path / 'notes.txt').write_text('not an image')
+
+        model = ImageClassModel(tiny_image_class_model_path)
+        results = list(model.classify_directory(str(tmp_path), batch_size=2, top_k=1))
+        model.release()
+
+        paths = [path for path, _ in results]
+        assert paths == [str(tmp_path / f'image_{index}.png') for index in range(3)], 'Failed! Unexpected images!'
+        assert all(len(predictions) == 1 for _, predictions in results), 'Failed! Unexpected number of labels!'
+
+
+class TestImageClassModelCache:
+    def test_repeated_images_are_cached(self, tiny_image_class_model_path):
+        """
+        Test that classifying the same image again reuses the cached label.
+        """
+        cache = ResultCache()
+        model = ImageClassModel(tiny_image_class_model_path, cache=cache)
+        image = np.full((64, 64, 3), 50, dtype=np.uint8)
+
+        first_class = model.infer(image)
+        second_class = model.infer(image.copy())
+        model.release()
+
+        assert first_class == second_class, 'Failed! Cached label differs!'
+        assert cache.stats()['hits'] == 1, 'Failed! Repeated image was classified again!'
+
+    def test_warmup_is_not_cached(self, tiny_image_class_model_path):
+        """
+        Test that the warm-up classification neither stores a result in the cache nor counts in its stats.
+        """
+        cache = ResultCache()
+        model = ImageClassModel(tiny_image_class_model_path, cache=cache)
+        model.warmup()
+        model.release()
+
+        assert len(cache) == 0, 'Failed! The warm-up image was cached!'
+        assert cache.stats()['misses'] == 0, 'Failed! The warm-up image counted in the cache stats!'
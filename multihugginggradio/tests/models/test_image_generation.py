@@ -3,6 +3,9 @@ import os
 import sys
 import pathlib
 import gc
+import pytest
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageChops
 from multihugginggradio.models.image_gen_model import ImageGenModel
 
@@ -54,3 +57,116 @@ class TestImageClassModel:
         self.model.release()  # This can be problematic with multiple tests using self.model. Change when that happen
         torch.cuda.empty_cache()
         gc.collect()
+
+
+class TestImageGenModelPresets:
+    def test_presets(self, tiny_image_gen_model_path):
+        """
+        Test that a preset generates the same image as its explicit steps and scheduler.
+        """
+        presets = {'draft': {'num_inference_steps': 2, 'scheduler': 'dpm-solver'}}
+        model = ImageGenModel(tiny_image_gen_model_path, execution_mode='fp32', presets=presets, default_preset='draft')
+        default_scheduler = model.model.scheduler
+
+        preset_image = model.infer('A red car', seed=1)
+        explicit_image = model.infer('A red car', seed=1, num_inference_steps=2, scheduler='dpm-solver')
+        other_image = model.infer('A red car', seed=1, num_inference_steps=2, scheduler='euler')
+        scheduler = model.model.scheduler
+        model.release()
+
+        assert not ImageChops.difference(preset_image, explicit_image).getbbox(), 'Failed! Preset settings differ!'
+        assert ImageChops.difference(preset_image, other_image).getbbox(), 'Failed! Scheduler was not changed!'
+        assert scheduler is default_scheduler, 'Failed! Scheduler of the loaded pipeline was modified!'
+
+    def test_unknown_preset_and_scheduler(self, tiny_image_gen_model_path):
+        """
+        Test that unknown presets and schedulers are rejected.
+        """
+        model = ImageGenModel(tiny_image_gen_model_path, execution_mode='fp32')
+
+        with pytest.raises(ValueError):
+            model.infer('A red car', preset='fastest')
+        with pytest.raises(ValueError):
+            model.infer('A red car', scheduler='unknown')
+
+        model.release()
+
+    def test_pipeline_without_scheduler(self, tiny_unclip_model_path):
+        """
+        Test that a pipeline with several schedulers ignores the preset settings and maps the explicit steps.
+        """
+        presets = {'draft': {'num_inference_steps': 2, 'scheduler': 'dpm-solver'}}
+        model = ImageGenModel(tiny_unclip_model_path, execution_mode='fp32', presets=presets, default_preset='draft')
+        model.warmup()
+
+        preset_image = model.infer('A red car', seed=1)
+        default_image = model.infer('A red car', seed=1, preset='draft', scheduler='default')
+        explicit_image = model.infer('A red car', seed=1, num_inference_steps=2)
+        kwargs = model._call_kwargs(model.model, guidance_scale=4.0, num_inference_steps=1)
+
+        with pytest.raises(ValueError):
+            model.infer('A red car', seed=1, scheduler='euler')
+
+        model.release()
+
+        assert preset_image.size == (64, 64), 'Failed! Unexpected generated image!'
+        assert not ImageChops.difference(preset_image, default_image).getbbox(), 'Failed! Preset settings were used!'
+        assert ImageChops.difference(preset_image, explicit_image).getbbox(), 'Failed! Steps were not changed!'
+        assert kwargs == {
+            'prior_num_inference_steps': 1,
+            'decoder_num_inference_steps': 1,
+            'super_res_num_inference_steps': 1,
+            'prior_guidance_scale': 4.0,
+            'decoder_guidance_scale': 4.0,
+        }, 'Failed! Unexpected pipeline arguments!'
+
+
+class TestImageGenModelBatching:
+    @staticmethod
+    def assert_images_match(image, expected_image):
+        """
+        Assert that two images are equal up to the rounding differences of batched computations.
+        """
+        difference = np.abs(np.asarray(image, dtype=np.int16) - np.asarray(expected_image, dtype=np.int16))
+        assert difference.max() <= 1, 'Failed! Image differs from the single request image!'
+
+    def test_infer_batch(self, tiny_image_gen_model_path):
+        """
+        Test that each image of a batch is the image generated for its prompt and seed alone.
+        """
+        model = ImageGenModel(tiny_image_gen_model_path, execution_mode='fp32')
+        settings = {'num_inference_steps': 2, 'scheduler': 'dpm-solver'}
+
+        variations = model.infer_batch('A red car', seeds=[1, 2], **settings)
+        images = model.infer_batch(['A red car', 'A blue boat'], seeds=[1, 5], **settings)
+        expected = [model.infer(prompt, seed=seed, **settings) for prompt, seed in [('A red car', 1), ('A red car', 2)]]
+        expected_boat = model.infer('A blue boat', seed=5, **settings)
+
+        with pytest.raises(ValueError):
+            model.infer_batch(['A red car', 'A blue boat'], seeds=[1])
+
+        model.release()
+
+        assert len(variations) == 2 and len(images) == 2, 'Failed! Unexpected number of images!'
+        self.assert_images_match(variations[0], expected[0])
+        self.assert_images_match(variations[1], expected[1])
+        self.assert_images_match(images[0], expected[0])
+        self.assert_images_match(images[1], expected_boat)
+
+    def test_concurrent_requests_are_merged(self, tiny_image_gen_model_path):
+        """
+        Test that concurrent requests with the same settings run in one batch and keep their own seeds.
+        """
+        settings = {'num_inference_steps': 2, 'scheduler': 'dpm-solver'}
+        requests = [('A red car', 1), ('A blue boat', 2), ('A green tree', 3)]
+
+        model = ImageGenModel(tiny_image_gen_model_path, execution_mode='fp32', max_batch_size=4, max_wait_ms=500)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            images = list(executor.map(lambda request: model.infer(request[0], seed=request[1], **settings), requests))
+        stats = model.stats()
+        expected = [model.infer(prompt, seed=seed, **settings) for prompt, seed in requests]
+        model.release()
+
+        assert stats['batch_size']['count'] == 1, 'Failed! Concurrent requests were not merged!'
+        for image, expected_image in zip(images, expected):
+            self.assert_images_match(image, expected_image)
@@ -0,0 +1,310 @@
+import pytest
+import threading
+from multihugginggradio.models.model_registry import ModelRegistry
+
+
+class MockModel:
+    """
+    Lightweight stand-in for a model wrapper that reports a fixed memory footprint.
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self.released = False
+
+    def memory_footprint(self) -> int:
+        return self.size
+
+    def release(self):
+        self.released = True
+
+
+class MockTieredModel(MockModel):
+    """
+    Stand-in for a model wrapper running on a GPU, which can be moved to host memory and back.
+    """
+    def __init__(self, size: int):
+        super().__init__(size)
+        self.on_device = True
+
+    def demote(self) -> bool:
+        self.on_device = False
+        return True
+
+    def promote(self):
+        self.on_device = True
+
+
+class TestModelRegistry:
+    def test_hits_and_misses(self):
+        """
+        Test that a loaded model is reused and that hits and misses are counted.
+        """
+        registry = ModelRegistry(memory_budget=100)
+
+        first = registry.get_or_load('model_a', lambda: MockModel(10))
+        second = registry.get_or_load('model_a', lambda: MockModel(10))
+
+        assert first is second, 'Failed! Loaded model was not reused!'
+        assert registry.hits == 1, 'Failed! Unexpected number of hits!'
+        assert registry.misses == 1, 'Failed! Unexpected number of misses!'
+        assert registry.memory_usage == 10, 'Failed! Unexpected memory usage!'
+
+    def test_lru_eviction(self):
+        """
+        Test that the least recently used model is released when the memory budget is exceeded.
+        """
+        registry = ModelRegistry(memory_budget=100, eviction_policy='lru')
+
+        model_a = registry.get_or_load('model_a', lambda: MockModel(40))
+        model_b = registry.get_or_load('model_b', lambda: MockModel(40))
+        registry.get_or_load('model_a', lambda: MockModel(40))  # model_b becomes the least recently used
+        registry.get_or_load('model_c', lambda: MockModel(40))
+
+        assert list(registry) == ['model_a', 'model_c'], 'Failed! Unexpected models after eviction!'
+        assert model_b.released and not model_a.released, 'Failed! Wrong model was released!'
+        assert registry.evictions == 1, 'Failed! Unexpected number of evictions!'
+
+    def test_lfu_eviction(self):
+        """
+        Test that the least frequently used model is released when the memory budget is exceeded.
+        """
+        registry = ModelRegistry(memory_budget=100, eviction_policy='lfu')
+
+        registry.get_or_load('model_a', lambda: MockModel(40))
+        registry.get_or_load('model_a', lambda: MockModel(40))
+        registry.get_or_load('model_b', lambda: MockModel(40))
+        registry.get_or_load('model_c', lambda: MockModel(40))
+
+        assert list(registry) == ['model_a', 'model_c'], 'Failed! Unexpected models after eviction!'
+
+    def test_pinned_models_are_kept(self):
+        """
+        Test that pinned models are never evicted, even when the budget is exceeded.
+        """
+        registry = ModelRegistry(memory_budget=50, pinned=['model_a'])
+
+        registry.get_or_load('model_a', lambda: MockModel(40))
+        registry.get_or_load('model_b', lambda: MockModel(40))
+
+        assert 'model_a' in registry, 'Failed! Pinned model was evicted!'
+        assert 'model_b' in registry, 'Failed! Most recent model was evicted!'
+
+        registry.unpin('model_a')
+
+        assert list(registry) == ['model_b'], 'Failed! Unpinned model was not evicted!'
+
+    def test_release_all(self):
+        """
+        Test that releasing all models empties the registry.
+        """
+        registry = ModelRegistry()
+
+        model = registry.get_or_load('model_a', lambda: MockModel(10))
+        registry.release_all()
+
+        assert registry == {}, 'Failed! Models were not released correctly!'
+        assert model.released, 'Failed! Model release method was not called!'
+
+    def test_unknown_eviction_policy(self):
+        """
+        Test that an unknown eviction policy raises a ValueError.
+        """
+        with pytest.raises(ValueError):
+            ModelRegistry(eviction_policy='fifo')
+
+    def test_warmup_and_status(self):
+        """
+        Test that the warm-up function runs before the model is reported as ready.
+        """
+        registry = ModelRegistry()
+        warmed_up = []
+
+        registry.get_or_load('model_a', lambda: MockModel(10), warmup=warmed_up.append)
+
+        assert len(warmed_up) == 1, 'Failed! Warm-up function was not called!'
+        assert registry.status() == {'model_a': ModelRegistry.READY}, 'Failed! Unexpected model status!'
+
+    def test_concurrent_load_waits(self):
+        """
+        Test that a request for a model that is still loading waits for that load instead of loading it twice.
+        """
+        registry = ModelRegistry()
+        loading = threading.Event()
+        finish_loading = threading.Event()
+        loads = []
+
+        def slow_loader():
+            loads.append(1)
+            loading.set()
+            finish_loading.wait()
+            return MockModel(10)
+
+        thread = threading.Thread(target=registry.get_or_load, args=('model_a', slow_loader))
+        thread.start()
+        loading.wait()
+
+        assert registry.status() == {'model_a': ModelRegistry.LOADING}, 'Failed! Model is not reported as loading!'
+
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(registry.get_or_load('model_a', slow_loader)))
+        waiter.start()
+        finish_loading.set()
+        thread.join()
+        waiter.join()
+
+        assert len(loads) == 1, 'Failed! Model was loaded more than once!'
+        assert results[0] is registry['model_a'], 'Failed! Waiting request did not get the loaded model!'
+
+    def test_failed_load(self):
+        """
+        Test that a failing load is reported and can be retried.
+        """
+        registry = ModelRegistry()
+
+        def failing_loader():
+            raise OSError('Mock load failure')
+
+        with pytest.raises(OSError):
+            registry.get_or_load('model_a', failing_loader)
+
+        assert registry.status() == {'model_a': ModelRegistry.FAILED}, 'Failed! Model is not reported as failed!'
+
+        registry.get_or_load('model_a', lambda: MockModel(10))
+
+        assert registry.status() == {'model_a': ModelRegistry.READY}, 'Failed! Model load was not retried!'
+
+    def test_demotion_to_host_memory(self):
+        """
+        Test that an evicted model is moved to host memory and moved back on its next request instead of reloaded.
+        """
+        transitions = []
+        registry = ModelRegistry(
+            memory_budget=100, host_memory_budget=100,
+            on_transition=lambda model_name, source, target, seconds: transitions.append((model_name, source, target)),
+        )
+
+        model_a = registry.get_or_load('model_a', lambda: MockTieredModel(60))
+        model_b = registry.get_or_load('model_b', lambda: MockTieredModel(60))
+
+        assert registry.residency() == {'model_a': 'warm', 'model_b': 'hot'}, 'Failed! The evicted model was not demoted'
+        assert not model_a.on_device and not model_a.released, 'Failed! The demoted model was not moved to host memory'
+        assert registry.memory_usage == 60 and registry.host_memory_usage == 60, 'Failed! Unexpected memory usage'
+
+        assert registry.get_or_load('model_a', lambda: MockTieredModel(60)) is model_a, 'Failed! The model was reloaded'
+        assert model_a.on_device and not model_b.on_device, 'Failed! The models did not swap tiers'
+        assert transitions == [('model_a', 'hot', 'warm'), ('model_b', 'hot', 'warm'), ('model_a', 'warm', 'hot')], \
+            'Failed! Unexpected transitions'
+        assert registry.stats()['transitions']['warm->hot']['count'] == 1, 'Failed! The promotion was not counted'
+        assert registry.misses == 2, 'Failed! A promotion was counted as a load'
+
+    def test_host_memory_budget(self):
+        """
+        Test that the warm models beyond the host memory budget, and the models that cannot be demoted, are released
+        and loaded again from the cold tier.
+        """
+        registry = ModelRegistry(memory_budget=100, host_memory_budget=60)
+
+        model_a = registry.get_or_load('model_a', lambda: MockTieredModel(60))
+        registry.get_or_load('model_b', lambda: MockTieredModel(60))
+        registry.get_or_load('model_c', lambda: MockTieredModel(60))
+
+        assert model_a.released, 'Failed! The warm model beyond the host memory budget was not released'
+        assert registry.residency() == {'model_a': 'cold', 'model_b': 'warm', 'model_c': 'hot'}, 'Failed! Unexpected tiers'
+
+        model_d = registry.get_or_load('model_d', lambda: MockModel(60))
+        registry.get_or_load('model_a', lambda: MockTieredModel(60))
+
+        assert model_d.released, 'Failed! The model that cannot be demoted was not released'
+        assert registry.stats()['transitions']['cold->hot']['count'] == 1, 'Failed! The reload was not counted'
+
+    def test_idle_demotion(self):
+        """
+        Test that the unused models move down one tier after each period of `idle_seconds`, except pinned models.
+        """
+        now = [0.0]
+        registry = ModelRegistry(host_memory_budget=None, idle_seconds=10, pinned=['model_c'], clock=lambda: now[0])
+
+        registry.get_or_load('model_a', lambda: MockTieredModel(10))
+        registry.get_or_load('model_c', lambda: MockTieredModel(10))
+        now[0] = 5.0
+        registry.get_or_load('model_b', lambda: MockTieredModel(10))
+
+        now[0] = 12.0
+        registry.get_or_load('model_b', lambda: MockTieredModel(10))
+        assert registry.residency() == {'model_a': 'warm', 'model_b': 'hot', 'model_c': 'hot'}, \
+            'Failed! The idle model was not demoted'
+
+        now[0] = 30.0
+        registry.get_or_load('model_b', lambda: MockTieredModel(10))
+        assert registry.residency() == {'model_a': 'cold', 'model_b': 'hot', 'model_c': 'hot'}, \
+            'Failed! The idle warm model was not released'
+
+    def test_leased_models_are_kept(self):
+        """
+        Test that a model used by a request is neither released nor demoted, and that its deferred eviction
+        happens once its last lease ends.
+        """
+        registry = ModelRegistry(memory_budget=100)
+
+        with registry.lease('model_a'):
+            model_a = registry.get_or_load('model_a', lambda: MockModel(60))
+            with registry.lease('model_a'):
+                model_b = registry.get_or_load('model_b', lambda: MockModel(60))
+
+            assert registry.in_use('model_a'), 'Failed! The model is no longer in use with a lease left'
+            assert not model_a.released and not model_b.released, 'Failed! A model was released while in use'
+            assert registry.memory_usage == 120, 'Failed! Unexpected memory usage'
+
+        assert not registry.in_use('model_a'), 'Failed! The model is still in use after its last lease'
+        assert model_a.released and 'model_a' not in registry, 'Failed! The deferred eviction did not happen'
+        assert not model_b.released and registry.memory_usage == 60, 'Failed! Unexpected models after the lease'
+
+    def test_leased_models_are_not_demoted(self):
+        """
+        Test that a model used by a request is not moved to host memory, even when it is idle for longer than
+        `idle_seconds`.
+        """
+        now = [0.0]
+        registry = ModelRegistry(memory_budget=100, host_memory_budget=None, idle_seconds=10, clock=lambda: now[0])
+
+        with registry.lease('model_a'):
+            model_a = registry.get_or_load('model_a', lambda: MockTieredModel(60))
+            now[0] = 20.0
+            registry.get_or_load('model_b', lambda: MockTieredModel(60))
+
+            assert model_a.on_device, 'Failed! The model was demoted while in use'
+
+        assert not model_a.on_device and registry.residency()['model_a'] == 'warm', \
+            'Failed! The model was not demoted once its lease ended'
+
+    def test_release_waits_for_leases(self):
+        """
+        Test that releasing a model waits for the requests using it, and that a release timing out keeps it.
+        """
+        registry = ModelRegistry()
+        model = registry.get_or_load('model_a', lambda: MockModel(10))
+        lease_started = threading.Event()
+        lease_ends = threading.Event()
+
+        def request():
+            with registry.lease('model_a'):
+                lease_started.set()
+                lease_ends.wait()
+
+        thread = threading.Thread(target=request)
+        thread.start()
+        lease_started.wait()
+
+        with pytest.raises(TimeoutError):
+            registry.release_all(timeout=0.05)
+        assert not model.released and 'model_a' in registry, 'Failed! A model was released while in use'
+
+        release = threading.Thread(target=registry.release, args=('model_a',))
+        release.start()
+        release.join(0.05)
+        assert release.is_alive() and not model.released, 'Failed! The release did not wait for the lease'
+
+        lease_ends.set()
+        thread.join()
+        release.join()
+        assert model.released and 'model_a' not in registry, 'Failed! The model was not released after its lease'
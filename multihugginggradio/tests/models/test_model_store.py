@@ -0,0 +1,121 @@
+import os
+import numpy as np
+import pytest
+import torch
+
+from multihugginggradio.models.chat_llm import ChatLLM
+from multihugginggradio.models.image_class_model import ImageClassModel
+from multihugginggradio.models.image_gen_model import ImageGenModel
+from multihugginggradio.models.model_store import ModelStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    """
+    Fixture providing an empty ModelStore.
+    """
+    return ModelStore(str(tmp_path / 'model_store'), load_threads=4)
+
+
+class TestModelStore:
+    """
+    Test class for the models converted into a local store.
+    """
+    @pytest.mark.parametrize('execution_mode', ['fp32', 'bf16'])
+    def test_chat_llm(self, store, tiny_chat_model_path, execution_mode):
+        """
+        Test that a chat model is converted once to the data type of its execution mode, and answers like the
+        model loaded from its checkpoint once loaded from the store.
+        """
+        model = ChatLLM(tiny_chat_model_path, execution_mode=execution_mode)
+        expected = model.infer('Hello!', max_tokens=8)
+        model.release()
+
+        for index in range(2):
+            model = ChatLLM(tiny_chat_model_path, execution_mode=execution_mode, store=store)
+            assert model.infer('Hello!', max_tokens=8) == expected, 'Failed! The stored model answered differently'
+            assert model.model.model.dtype == (torch.float32 if execution_mode == 'fp32' else torch.bfloat16), \
+                'Failed! The stored model was not loaded with the data type of its execution mode'
+            model.release()
+
+            manifest = store.manifest(tiny_chat_model_path, execution_mode)
+            assert manifest is not None and manifest['metadata']['task'] == 'text-generation', \
+                'Failed! The manifest of the converted model was not written'
+            if index == 0:
+                created = manifest['created']
+
+        assert manifest['created'] == created, 'Failed! The model was converted again'
+        assert 'model.safetensors' in manifest['files'], 'Failed! The weights were not converted to safetensors'
+
+    def test_custom_pipeline(self, store, tiny_instruction_chat_model_path):
+        """
+        Test that a chat model defining its own pipeline is loaded from the store with that pipeline, its prompt
+        template and its default generation settings.
+        """
+        model = ChatLLM(tiny_instruction_chat_model_path, execution_mode='fp32')
+        expected = model.infer('Hello!', max_tokens=8)
+        model.release()
+
+        for _ in range(2):
+            model = ChatLLM(tiny_instruction_chat_model_path, execution_mode='fp32', store=store)
+            assert type(model.model).__name__ == 'InstructionTextGenerationPipeline', \
+                'Failed! The stored model was not loaded with its own pipeline'
+            assert model.model._forward_params['top_p'] == 0.92, 'Failed! The default settings of the pipeline were lost'
+            assert model.infer('Hello!', max_tokens=8) == expected, 'Failed! The stored model answered differently'
+            model.release()
+
+        manifest = store.manifest(tiny_instruction_chat_model_path, 'fp32')
+        assert manifest['metadata']['pipeline_class'] == 'instruct_pipeline.InstructionTextGenerationPipeline', \
+            'Failed! The pipeline class was not recorded in the manifest'
+        assert 'instruct_pipeline.py' in manifest['files'], 'Failed! The code of the pipeline was not copied'
+
+    def test_image_models(self, store, tiny_image_class_model_path, tiny_image_gen_model_path):
+        """
+        Test that the image classification and generation models loaded from the store give the same results
+        as the models loaded from their checkpoints.
+        """
+        image = np.random.default_rng(0).integers(0, 256, (32, 32, 3), dtype=np.uint8)
+        results = []
+        for model_store in (None, store, store):
+            model = ImageClassModel(tiny_image_class_model_path, execution_mode='fp32', store=model_store)
+            results.append(model.infer(image, return_logits=True)[1])
+            model.release()
+        assert all(torch.equal(logits, results[0]) for logits in results), 'Failed! The stored model classified differently'
+
+        results = []
+        for model_store in (None, store, store):
+            model = ImageGenModel(tiny_image_gen_model_path, execution_mode='fp32', store=model_store)
+            results.append(np.asarray(model.infer('a red square', seed=3, num_inference_steps=2)))
+            model.release()
+        assert all(np.array_equal(result, results[0]) for result in results), \
+            'Failed! The stored pipeline generated a different image'
+
+        manifest = store.manifest(tiny_image_gen_model_path, 'fp32')
+        assert any(name.startswith('unet' + os.sep) for name in manifest['files']), \
+            'Failed! The models of the pipeline were not converted'
+
+    def test_corrupted_copy(self, store, tiny_image_class_model_path):
+        """
+        Test that an incomplete or corrupted copy of a model is detected and converted again.
+        """
+        ImageClassModel(tiny_image_class_model_path, execution_mode='fp32', store=store).release()
+        path = os.path.join(store.path(tiny_image_class_model_path, 'fp32'), 'model.safetensors')
+
+        # A truncated file is found from its size
+        with open(path, 'r+b') as file:
+            file.truncate(100)
+        assert store.manifest(tiny_image_class_model_path, 'fp32') is None, 'Failed! The truncated file was not detected'
+
+        ImageClassModel(tiny_image_class_model_path, execution_mode='fp32', store=store).release()
+        assert store.verify(tiny_image_class_model_path, 'fp32'), 'Failed! The model was not converted again'
+
+        # A modified file is found from its checksum
+        with open(path, 'r+b') as file:
+            file.seek(-4, os.SEEK_END)
+            file.write(b'\xff' * 4)
+        assert not store.verify(tiny_image_class_model_path, 'fp32'), 'Failed! The modified file was not detected'
+        assert store.manifest(tiny_image_class_model_path, 'fp32') is None, 'Failed! The corrupted copy was kept'
+
+        store.verify_checksums = True
+        ImageClassModel(tiny_image_class_model_path, execution_mode='fp32', store=store).release()
+        assert store.verify(tiny_image_class_model_path, 'fp32'), 'Failed! The corrupted copy was not converted again'
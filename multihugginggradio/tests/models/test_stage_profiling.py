@@ -0,0 +1,49 @@
+import numpy as np
+
+from multihugginggradio.models.chat_llm import ChatLLM
+from multihugginggradio.models.image_class_model import ImageClassModel
+from multihugginggradio.models.image_gen_model import ImageGenModel
+
+
+class TestStageProfiling:
+    def test_chat_llm(self, tiny_chat_model_path, tmp_path):
+        """
+        Test the stages timed for a chat response, and the trace of the next response.
+        """
+        chat_llm = ChatLLM(tiny_chat_model_path, execution_mode='fp32')
+        chat_llm.profiler.capture_trace(1, str(tmp_path))
+        chat_llm.infer('Hello!', max_tokens=5)
+        chat_llm.infer('Hello again!', max_tokens=5)
+
+        stats = chat_llm.profiler.stats()
+        trace_files = chat_llm.profiler.trace_files
+        chat_llm.release()
+
+        assert set(stats) == {'tokenize', 'prefill', 'generate', 'decode', 'total'}, 'Failed! Unexpected stages!'
+        assert stats['total']['count'] == 2, 'Failed! Unexpected number of runs!'
+        assert len(trace_files) == 1, 'Failed! Unexpected number of traces!'
+
+    def test_image_class_model(self, tiny_image_class_model_path):
+        """
+        Test the stages timed for an image classification.
+        """
+        model = ImageClassModel(tiny_image_class_model_path)
+        model.infer(np.zeros((32, 32, 3), dtype=np.uint8))
+
+        stats = model.profiler.stats()
+        model.release()
+
+        assert set(stats) == {'preprocess', 'forward', 'postprocess', 'total'}, 'Failed! Unexpected stages!'
+
+    def test_image_gen_model(self, tiny_image_gen_model_path):
+        """
+        Test the stages timed for an image generation, including the models of the pipeline.
+        """
+        model = ImageGenModel(tiny_image_gen_model_path, execution_mode='fp32')
+        model.infer('A red car', num_inference_steps=2)
+
+        stats = model.profiler.stats()
+        model.release()
+
+        assert {'pipeline', 'text_encoder', 'unet', 'vae_decode', 'total'} <= set(stats), 'Failed! Missing stages!'
+        assert stats['unet']['mean'] <= stats['pipeline']['mean'], 'Failed! Denoising loop longer than the pipeline!'
@@ -0,0 +1,57 @@
+import sys
+import json
+import pytest
+import subprocess
+
+from multihugginggradio.models.model_registry import ModelRegistry
+from multihugginggradio.models.task_registry import TASKS, TaskPlugin, TaskRegistry
+
+
+class TestTaskRegistry:
+    def test_import_is_lazy(self):
+        """
+        Test that importing the interface does not import the heavy libraries of the model wrappers.
+        """
+        code = (
+            'import sys, json\n'
+            'import multihugginggradio.interface.gradio_ui\n'
+            'print(json.dumps([name for name in ("torch", "transformers", "diffusers") if name in sys.modules]))\n'
+        )
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+
+        assert json.loads(output.splitlines()[-1]) == [], 'Failed! Heavy libraries imported with the interface!'
+
+    def test_plugin_imports_on_first_use(self):
+        """
+        Test that a plugin imports its model wrapper on the first use only.
+        """
+        plugin = TaskPlugin('Registry', 'multihugginggradio.models.model_registry', 'ModelRegistry')
+        assert not plugin.loaded, 'Failed! Plugin imported before its first use!'
+
+        assert plugin.get_model_class() is ModelRegistry, 'Failed! Wrong model class!'
+        assert plugin.loaded, 'Failed! Plugin not marked as imported!'
+
+    def test_enabled_tasks(self):
+        """
+        Test the selection of the enabled tasks.
+        """
+        tasks = TASKS.enabled(['Image Generation', 'Chat'])
+
+        assert list(tasks) == ['Image Generation', 'Chat'], 'Failed! Wrong enabled tasks!'
+        assert tasks['Chat'] is TASKS['Chat'], 'Failed! Plugins not shared with the full registry!'
+
+        with pytest.raises(ValueError):
+            tasks.get_model_class('Image Classification')
+
+        with pytest.raises(ValueError):
+            TASKS.enabled(['Translation'])
+
+    def test_register(self):
+        """
+        Test the registration of a new task.
+        """
+        tasks = TaskRegistry()
+        tasks.register('Registry', 'multihugginggradio.models.model_registry', 'ModelRegistry')
+
+        assert len(tasks) == 1, 'Failed! Task not registered!'
+        assert tasks.get_model_class('Registry') is ModelRegistry, 'Failed! Wrong model class!'
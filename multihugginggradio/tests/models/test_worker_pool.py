@@ -0,0 +1,141 @@
+import time
+import numpy as np
+import pytest
+from PIL import Image
+
+from multihugginggradio.models.chat_llm import ChatLLM
+from multihugginggradio.models.image_class_model import ImageClassModel
+from multihugginggradio.models.worker_pool import ModelWorkerPool
+
+
+# The worker processes import the package from the project directory
+pytestmark = pytest.mark.usefixtures('project_path')
+
+
+@pytest.fixture(scope='module')
+def image_class_pool(tiny_image_class_model_path):
+    """
+    Fixture providing two worker processes running a tiny image classification model.
+    """
+    pool = ModelWorkerPool(
+        'multihugginggradio.models.image_class_model', 'ImageClassModel', tiny_image_class_model_path,
+        model_kwargs={'execution_mode': 'fp32'}, replicas=2,
+    )
+
+    yield pool
+
+    pool.release()
+
+
+class TestModelWorkerPool:
+    """
+    Test class for the models run in worker processes.
+    """
+    def test_classification(self, image_class_pool, tiny_image_class_model_path):
+        """
+        Test that the workers classify images like a model loaded in the test process.
+        """
+        images = [np.random.default_rng(seed).integers(0, 256, (32, 32, 3), dtype=np.uint8) for seed in range(4)]
+        model = ImageClassModel(tiny_image_class_model_path, execution_mode='fp32', max_batch_size=1)
+        expected = [model.infer(image) for image in images]
+        model.release()
+
+        assert [image_class_pool.infer(image) for image in images] == expected, \
+            'Failed! The workers classified the images differently'
+        assert [label for label, _ in image_class_pool.infer_many(images)] == expected, \
+            'Failed! The workers classified the batch differently'
+
+        stats = image_class_pool.worker_stats()
+        assert stats['replicas'] == 2 and stats['ready'] == 2, 'Failed! Expected two ready workers'
+        assert image_class_pool.memory_footprint() > 0, 'Failed! The memory of the workers was not reported'
+
+        segments = image_class_pool.images.stats()
+        assert segments['in_use'] == 0, 'Failed! The shared memory segments of the images were not released'
+        assert segments['reused'] > 0, 'Failed! The shared memory segments of the images were not reused'
+
+    def test_bulk_classification(self, image_class_pool, tiny_image_class_model_path, tmp_path):
+        """
+        Test that the predictions of a stream of images and of the images of a directory are streamed back from
+        the workers like the predictions of a model loaded in the test process.
+        """
+        images = [np.random.default_rng(seed).integers(0, 256, (32, 32, 3), dtype=np.uint8) for seed in range(5)]
+        for index, image in enumerate(images):
+            Image.fromarray(image).save(tmp_path / f'image_{index}.png')
+
+        model = ImageClassModel(tiny_image_class_model_path, execution_mode='fp32', max_batch_size=1)
+        expected = list(model.infer_batch(images, batch_size=2, top_k=3))
+        expected_directory = list(model.classify_directory(str(tmp_path), batch_size=2, top_k=3))
+        model.release()
+
+        predictions = list(image_class_pool.infer_batch(iter(images), batch_size=2, top_k=3))
+        assert len(predictions) == len(images), 'Failed! Expected the predictions of every image'
+        for labels, expected_labels in zip(predictions, expected):
+            assert [label for label, _ in labels] == [label for label, _ in expected_labels], \
+                'Failed! The workers classified the stream of images differently'
+
+        directory = list(image_class_pool.classify_directory(str(tmp_path), batch_size=2, top_k=3))
+        assert [path for path, _ in directory] == [path for path, _ in expected_directory], \
+            'Failed! The workers did not classify the images of the directory'
+        assert [[label for label, _ in labels] for _, labels in directory] == \
+            [[label for label, _ in labels] for _, labels in expected_directory], \
+            'Failed! The workers classified the images of the directory differently'
+
+    def test_model_errors(self, image_class_pool):
+        """
+        Test that an exception raised by the model is raised in the calling process, and the worker keeps running.
+        """
+        with pytest.raises(AttributeError):
+            image_class_pool.call('missing_method')
+
+        assert image_class_pool.worker_stats()['restarts'] == 0, 'Failed! A model error restarted the worker'
+
+    def test_restart_after_crash(self, image_class_pool):
+        """
+        Test that a worker that exits is restarted and the pool keeps answering.
+        """
+        image = np.zeros((32, 32, 3), dtype=np.uint8)
+        expected = image_class_pool.infer(image)
+
+        image_class_pool._workers[0].process.kill()
+
+        deadline = time.time() + 120
+        while image_class_pool.worker_stats()['restarts'] < 1 or image_class_pool.worker_stats()['ready'] < 2:
+            assert time.time() < deadline, 'Failed! The crashed worker was not restarted'
+            time.sleep(0.1)
+
+        assert [image_class_pool.infer(image) for _ in range(4)] == [expected] * 4, \
+            'Failed! The restarted workers classified the image differently'
+
+    def test_chat_stream(self, tiny_chat_model_path):
+        """
+        Test that a streamed chat response and its statistics are sent back from the worker, and that the
+        conversation stays in the worker of its session.
+        """
+        model = ChatLLM(tiny_chat_model_path, execution_mode='fp32')
+        expected = [model.infer(prompt, max_tokens=8, session_id='session') for prompt in ('Hello!', 'How are you?')]
+        model.release()
+
+        pool = ModelWorkerPool(
+            'multihugginggradio.models.chat_llm', 'ChatLLM', tiny_chat_model_path,
+            model_kwargs={'execution_mode': 'fp32'}, replicas=2,
+        )
+        try:
+            stats = {}
+            responses = list(pool.infer_stream('Hello!', max_tokens=8, stats=stats, session_id='session'))
+            assert responses and responses[-1] == expected[0], 'Failed! The streamed response differs'
+            assert stats['num_tokens'] > 0, 'Failed! The statistics of the stream were not sent back'
+
+            assert pool.infer('How are you?', max_tokens=8, session_id='session') == expected[1], \
+                'Failed! The conversation was not continued in the worker of its session'
+        finally:
+            pool.release()
+
+        with pytest.raises(RuntimeError):
+            pool.infer('Hello!')
+
+    def test_load_error(self):
+        """
+        Test that a model that fails to load raises its error instead of starting the pool.
+        """
+        with pytest.raises(OSError):
+            ModelWorkerPool('multihugginggradio.models.chat_llm', 'ChatLLM', '/nonexistent/model')
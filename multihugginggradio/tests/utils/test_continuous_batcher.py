@@ -0,0 +1,123 @@
+import threading
+import pytest
+import torch
+from transformers import AutoTokenizer, GPTNeoXForCausalLM
+from transformers.generation.streamers import BaseStreamer
+
+from benchmarks.tiny_models import build_tiny_chat_model
+from multihugginggradio.utils.batching.continuous_batcher import ContinuousBatcher
+
+
+class TokenEventStreamer(BaseStreamer):
+    """
+    Streamer setting an event once a number of tokens are generated.
+    """
+    def __init__(self, num_tokens: int):
+        self.num_tokens = num_tokens
+        self.tokens = []
+        self.event = threading.Event()
+        self.ended = False
+
+    def put(self, value):
+        self.tokens.append(value)
+        if len(self.tokens) > self.num_tokens:  # The first value is the prompt
+            self.event.set()
+
+    def end(self):
+        self.ended = True
+
+
+@pytest.fixture(scope='module')
+def model_and_tokenizer(tmp_path_factory):
+    """
+    Fixture providing a tiny local causal language model and its tokenizer.
+    """
+    path = build_tiny_chat_model(str(tmp_path_factory.mktemp('tiny_chat_model')))
+    model = GPTNeoXForCausalLM.from_pretrained(path).eval()
+
+    return model, AutoTokenizer.from_pretrained(path)
+
+
+def submit(batcher, model, tokenizer, prompt: str, max_new_tokens: int, streamer=None):
+    """
+    Compute the cached keys and values of a prompt and submit it to the batcher.
+    """
+    input_ids = tokenizer(prompt, return_tensors='pt')['input_ids']
+    past_key_values = None
+    if input_ids.shape[1] > 1:
+        with torch.inference_mode():
+            past_key_values = model(input_ids[:, :-1], use_cache=True).past_key_values
+
+    return batcher.submit(input_ids[0], past_key_values, max_new_tokens, eos_token_ids=[-1], streamer=streamer)
+
+
+def generate(model, tokenizer, prompt: str, max_new_tokens: int) -> torch.Tensor:
+    """
+    Generate the greedy continuation of a prompt alone, without stopping at the end of sequence token.
+    """
+    input_ids = tokenizer(prompt, return_tensors='pt')['input_ids']
+    with torch.inference_mode():
+        return model.generate(input_ids, max_new_tokens=max_new_tokens, min_new_tokens=max_new_tokens, do_sample=False,
+                              pad_token_id=tokenizer.pad_token_id)
+
+
+class TestContinuousBatcher:
+    def test_same_tokens_as_alone(self, model_and_tokenizer):
+        """
+        Test that sequences of different lengths decoded together get the tokens they get when decoded alone,
+        each one with its own maximum number of tokens.
+        """
+        model, tokenizer = model_and_tokenizer
+        requests = [('Hello!', 5), ('The quick brown fox jumps over the lazy dog', 12), ('a', 8), ('xyz', 1)]
+
+        batcher = ContinuousBatcher(model, max_batch_size=4)
+        futures = [submit(batcher, model, tokenizer, prompt, max_new_tokens) for prompt, max_new_tokens in requests]
+        results = [future.result() for future in futures]
+        batcher.close()
+
+        for (prompt, max_new_tokens), result in zip(requests, results):
+            assert torch.equal(result, generate(model, tokenizer, prompt, max_new_tokens)), \
+                f'Failed! The batched sequence of {prompt!r} differs from the sequence decoded alone!'
+
+        assert batcher.stats()['batch_size']['sum'] == sum(max_new_tokens for _, max_new_tokens in requests), \
+            'Failed! Expected one decoding step per generated token of each sequence!'
+
+    def test_join_and_leave_running_batch(self, model_and_tokenizer):
+        """
+        Test that a sequence joins a running batch and leaves it as soon as it is finished.
+        """
+        model, tokenizer = model_and_tokenizer
+        batcher = ContinuousBatcher(model, max_batch_size=4)
+
+        streamer = TokenEventStreamer(num_tokens=3)
+        long_future = submit(batcher, model, tokenizer, 'The quick brown fox', 150, streamer)
+        streamer.event.wait()
+
+        short_future = submit(batcher, model, tokenizer, 'Hello there, how are you?', 4)
+        short_result = short_future.result()
+        assert not long_future.done(), 'Failed! The short sequence waited for the long sequence!'
+
+        long_result = long_future.result()
+        batcher.close()
+
+        assert torch.equal(short_result, generate(model, tokenizer, 'Hello there, how are you?', 4)), \
+            'Failed! The sequence that joined the batch differs from the sequence decoded alone!'
+        assert torch.equal(long_result, generate(model, tokenizer, 'The quick brown fox', 150)), \
+            'Failed! The running sequence changed when another sequence joined the batch!'
+        assert streamer.ended and len(streamer.tokens) == 151, 'Failed! Unexpected streamed tokens!'
+        assert batcher.stats()['batch_size']['buckets'][2] > 0, 'Failed! The sequences were not decoded together!'
+
+    def test_max_batch_size(self, model_and_tokenizer):
+        """
+        Test that the sequences beyond the maximum batch size wait for a running sequence to finish.
+        """
+        model, tokenizer = model_and_tokenizer
+        batcher = ContinuousBatcher(model, max_batch_size=2)
+        futures = [submit(batcher, model, tokenizer, 'Hello!', 6) for _ in range(5)]
+        results = [future.result() for future in futures]
+        batcher.close()
+
+        assert all(torch.equal(result, results[0]) for result in results), 'Failed! Identical prompts got different tokens!'
+        stats = batcher.stats()['batch_size']
+        assert stats['buckets'][1] + stats['buckets'][2] == stats['count'], \
+            'Failed! More sequences than the maximum batch size were decoded together!'
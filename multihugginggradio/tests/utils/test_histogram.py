@@ -0,0 +1,31 @@
+from multihugginggradio.utils.metrics.histogram import Histogram
+
+
+class TestHistogram:
+    def test_observe(self):
+        """
+        Test that values are counted in the bucket of their upper bound.
+        """
+        histogram = Histogram(buckets=[1, 2, 4])
+        for value in [0.5, 1, 3, 10]:
+            histogram.observe(value)
+
+        snapshot = histogram.snapshot()
+
+        assert snapshot['buckets'] == {1: 2, 2: 0, 4: 1, '+Inf': 1}, 'Failed! Unexpected bucket counts!'
+        assert snapshot['count'] == 4, 'Failed! Unexpected number of values!'
+        assert snapshot['sum'] == 14.5, 'Failed! Unexpected sum of values!'
+
+    def test_quantile(self):
+        """
+        Test that quantiles are interpolated inside the bucket where they fall.
+        """
+        histogram = Histogram(buckets=[1, 2, 4])
+        assert histogram.quantile(0.5) is None, 'Failed! Quantile of an empty histogram!'
+
+        for value in [0.5, 1.5, 1.5, 3, 10]:
+            histogram.observe(value)
+
+        assert histogram.quantile(0.2) == 1, 'Failed! Unexpected 20th percentile!'
+        assert histogram.quantile(0.5) == 1.75, 'Failed! Unexpected median!'
+        assert histogram.quantile(0.99) == 4, 'Failed! Overflow quantile not reported as the largest bound!'
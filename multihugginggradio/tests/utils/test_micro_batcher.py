@@ -0,0 +1,95 @@
+import threading
+import pytest
+
+from multihugginggradio.utils.batching.micro_batcher import MicroBatcher
+
+
+class TestMicroBatcher:
+    def test_concurrent_requests_are_batched(self):
+        """
+        Test that concurrent requests are processed together and each caller gets its own result.
+        """
+        batches = []
+
+        def process_batch(items):
+            batches.append(list(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(process_batch, max_batch_size=4, max_wait_ms=200)
+        futures = [batcher.submit(item) for item in range(4)]
+        results = [future.result() for future in futures]
+        batcher.close()
+
+        assert results == [0, 2, 4, 6], 'Failed! Callers did not get their own results!'
+        assert batches == [[0, 1, 2, 3]], 'Failed! Requests were not processed in a single batch!'
+
+    def test_max_batch_size(self):
+        """
+        Test that batches never exceed the maximum batch size.
+        """
+        batches = []
+        release = threading.Event()
+
+        def process_batch(items):
+            release.wait()
+            batches.append(len(items))
+            return items
+
+        batcher = MicroBatcher(process_batch, max_batch_size=3, max_wait_ms=50)
+        futures = [batcher.submit(item) for item in range(7)]
+        release.set()
+        for future in futures:
+            future.result()
+        batcher.close()
+
+        assert max(batches) <= 3, 'Failed! Batch exceeds the maximum batch size!'
+        assert sum(batches) == 7, 'Failed! Some requests were not processed!'
+
+    def test_histograms(self):
+        """
+        Test that the batch sizes and queue delays are recorded.
+        """
+        batcher = MicroBatcher(lambda items: items, max_batch_size=2, max_wait_ms=100)
+        futures = [batcher.submit(item) for item in range(2)]
+        for future in futures:
+            future.result()
+        batcher.close()
+
+        stats = batcher.stats()
+
+        assert stats['batch_size']['count'] == 1, 'Failed! Unexpected number of batches!'
+        assert stats['batch_size']['buckets'][2] == 1, 'Failed! Batch size was not recorded!'
+        assert stats['queue_delay']['count'] == 2, 'Failed! Queue delays were not recorded!'
+
+    def test_errors_reach_callers(self):
+        """
+        Test that an error while processing a batch is raised to every caller of the batch.
+        """
+        def process_batch(items):
+            raise ValueError('Mock batch failure')
+
+        batcher = MicroBatcher(process_batch, max_batch_size=2, max_wait_ms=0)
+        future = batcher.submit(1)
+
+        with pytest.raises(ValueError):
+            future.result()
+
+        batcher.close()
+
+    def test_batch_key(self):
+        """
+        Test that only items with the same key are processed in the same batch.
+        """
+        batches = []
+
+        def process_batch(items):
+            batches.append(list(items))
+            return items
+
+        batcher = MicroBatcher(process_batch, max_batch_size=4, max_wait_ms=200, batch_key=lambda item: item % 2)
+        futures = [batcher.submit(item) for item in range(4)]
+        results = [future.result() for future in futures]
+        batcher.close()
+
+        assert results == [0, 1, 2, 3], 'Failed! Callers did not get their own results!'
+        assert batches == [[0, 2], [1, 3]], 'Failed! Items with different keys were batched together!'
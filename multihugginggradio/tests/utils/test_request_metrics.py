@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from multihugginggradio.utils.metrics.request_metrics import RequestMetrics, payload_size
+
+
+class TestRequestMetrics:
+    def test_summary(self):
+        """
+        Test that the metrics are kept separately per task and model.
+        """
+        metrics = RequestMetrics()
+        for value in [0.02, 0.02, 0.2, 3]:
+            metrics.observe('inference_seconds', 'Chat', 'model-a', value)
+        metrics.observe('load_seconds', 'Chat', 'model-a', 30)
+        metrics.observe('inference_seconds', 'Image Classification', 'model-b', 0.01)
+
+        summary = metrics.summary()
+
+        assert set(summary) == {('Chat', 'model-a'), ('Image Classification', 'model-b')}, 'Failed! Wrong series!'
+        assert set(summary[('Chat', 'model-a')]) == {'inference_seconds', 'load_seconds'}, 'Failed! Wrong metrics!'
+
+        inference = summary[('Chat', 'model-a')]['inference_seconds']
+        assert inference['count'] == 4, 'Failed! Wrong number of observations!'
+        assert 0.01 < inference['p50'] <= 0.025, 'Failed! Unexpected median!'
+        assert 2.5 < inference['p99'] <= 5, 'Failed! Unexpected 99th percentile!'
+
+        with pytest.raises(ValueError):
+            metrics.observe('unknown', 'Chat', 'model-a', 1)
+
+    def test_timer(self):
+        """
+        Test that the timer records the blocks that finish and skips the ones that raise.
+        """
+        metrics = RequestMetrics()
+        with metrics.timer('inference_seconds', 'Chat', 'model-a'):
+            pass
+
+        with pytest.raises(RuntimeError):
+            with metrics.timer('inference_seconds', 'Chat', 'model-a'):
+                raise RuntimeError
+
+        assert metrics.summary()[('Chat', 'model-a')]['inference_seconds']['count'] == 1, 'Failed! Wrong count!'
+
+    def test_export_text(self):
+        """
+        Test the Prometheus text exposition of the histograms.
+        """
+        metrics = RequestMetrics()
+        metrics.observe('payload_bytes', 'Chat', 'org/"model"', 300)
+        metrics.observe('payload_bytes', 'Chat', 'org/"model"', 100000000)
+
+        lines = metrics.export_text().splitlines()
+        labels = 'task="Chat",model="org/\\"model\\""'
+
+        assert '# TYPE multihugginggradio_payload_bytes histogram' in lines, 'Failed! Missing metric type!'
+        assert f'multihugginggradio_payload_bytes_bucket{{{labels},le="256"}} 0' in lines, 'Failed! Wrong bucket!'
+        assert f'multihugginggradio_payload_bytes_bucket{{{labels},le="1024"}} 1' in lines, 'Failed! Not cumulative!'
+        assert f'multihugginggradio_payload_bytes_bucket{{{labels},le="+Inf"}} 2' in lines, 'Failed! Wrong overflow!'
+        assert f'multihugginggradio_payload_bytes_count{{{labels}}} 2' in lines, 'Failed! Wrong count!'
+
+    def test_payload_size(self):
+        """
+        Test the size of the request inputs.
+        """
+        assert payload_size('héllo') == 6, 'Failed! Wrong size of a string!'
+        assert payload_size(np.zeros((4, 4, 3), dtype=np.uint8)) == 48, 'Failed! Wrong size of an array!'
+        assert payload_size(Image.new('RGB', (4, 4))) == 48, 'Failed! Wrong size of an image!'
+        assert payload_size(None) == 0, 'Failed! Wrong size of a missing input!'
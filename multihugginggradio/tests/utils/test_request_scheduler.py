@@ -0,0 +1,101 @@
+from multihugginggradio.utils.scheduling.request_scheduler import RequestScheduler
+
+
+class TestRequestScheduler:
+    def test_task_limit(self):
+        """
+        Test that requests over the limit of their task wait for a running request to finish.
+        """
+        scheduler = RequestScheduler(task_limits={'Image Generation': 1})
+        first = scheduler.submit('Image Generation', 'sd')
+        second = scheduler.submit('Image Generation', 'sd')
+
+        assert first.wait(0) and not second.wait(0), 'Failed! Task limit was not enforced!'
+
+        scheduler.release(first)
+        assert second.wait(0), 'Failed! Waiting request was not started!'
+
+    def test_model_limit(self):
+        """
+        Test that the limit of a model only holds back the requests of that model.
+        """
+        scheduler = RequestScheduler(model_limits={'sd': 1})
+        scheduler.submit('Image Generation', 'sd')
+        same_model = scheduler.submit('Image Generation', 'sd')
+        other_model = scheduler.submit('Image Generation', 'karlo')
+
+        assert not same_model.wait(0), 'Failed! Model limit was not enforced!'
+        assert other_model.wait(0), 'Failed! Request of another model was held back!'
+
+    def test_cheap_tasks_do_not_wait_for_expensive_ones(self):
+        """
+        Test that a request blocked on the limit of its task does not hold back the requests of other tasks.
+        """
+        scheduler = RequestScheduler(task_limits={'Image Generation': 1})
+        scheduler.submit('Image Generation', 'sd')
+        waiting_generation = scheduler.submit('Image Generation', 'sd')
+        classification = scheduler.submit('Image Classification', 'vit')
+
+        assert not waiting_generation.wait(0), 'Failed! Task limit was not enforced!'
+        assert classification.wait(0), 'Failed! Classification waited behind the generation!'
+
+    def test_priorities(self):
+        """
+        Test that the freed slot goes to the waiting request with the highest priority class.
+        """
+        scheduler = RequestScheduler(max_running=1, priorities={'Image Classification': 0, 'Image Generation': 1})
+        running = scheduler.submit('Chat', 'dolly')
+        generation = scheduler.submit('Image Generation', 'sd')
+        classification = scheduler.submit('Image Classification', 'vit')
+
+        scheduler.release(running)
+
+        assert classification.wait(0), 'Failed! Higher priority request was not started first!'
+        assert not generation.wait(0), 'Failed! Lower priority request was started first!'
+
+    def test_fairness_between_sessions(self):
+        """
+        Test that a session with several queued requests does not delay the first request of another session.
+        """
+        scheduler = RequestScheduler(task_limits={'Chat': 1})
+        first = scheduler.submit('Chat', 'dolly', session_id='a')
+        session_a = [scheduler.submit('Chat', 'dolly', session_id='a') for _ in range(2)]
+        session_b = scheduler.submit('Chat', 'dolly', session_id='b')
+
+        assert scheduler.position(session_b)[0] == 1, 'Failed! Other session is not next in the queue!'
+
+        scheduler.release(first)
+
+        assert session_b.wait(0), 'Failed! Other session waited behind the queued requests!'
+        assert not any(ticket.wait(0) for ticket in session_a), 'Failed! Task limit was not enforced!'
+
+    def test_position_and_estimated_wait(self, clock):
+        """
+        Test the queue position and the wait estimated from the durations of the finished requests.
+        """
+        scheduler = RequestScheduler(task_limits={'Image Generation': 1}, clock=clock)
+        running = scheduler.submit('Image Generation', 'sd')
+        waiting = [scheduler.submit('Image Generation', 'sd') for _ in range(3)]
+
+        assert scheduler.position(waiting[1]) == (2, None), 'Failed! Unexpected position without durations!'
+
+        clock.now = 10.0
+        scheduler.release(running)
+
+        assert scheduler.position(waiting[0]) == (0, 0.0), 'Failed! Running request has a position!'
+        assert scheduler.position(waiting[2]) == (2, 20.0), 'Failed! Unexpected estimated wait!'
+
+    def test_cancel_waiting_request(self):
+        """
+        Test that releasing a waiting request removes it from the queue.
+        """
+        scheduler = RequestScheduler(task_limits={'Chat': 1})
+        running = scheduler.submit('Chat', 'dolly')
+        cancelled = scheduler.submit('Chat', 'dolly')
+        waiting = scheduler.submit('Chat', 'dolly')
+
+        scheduler.release(cancelled)
+        assert scheduler.stats() == {'Chat': {'waiting': 1, 'running': 1}}, 'Failed! Request was not cancelled!'
+
+        scheduler.release(running)
+        assert waiting.wait(0), 'Failed! Next request was not started!'
@@ -0,0 +1,112 @@
+import threading
+import time
+import numpy as np
+import pytest
+from PIL import Image
+
+from multihugginggradio.utils.cache.result_cache import ResultCache, make_key
+
+
+class TestMakeKey:
+    def test_content_hash(self):
+        """
+        Test that keys depend on the content of the request, not on the identity of the objects.
+        """
+        image = np.zeros((4, 4, 3), dtype=np.uint8)
+
+        assert make_key('model', image) == make_key('model', image.copy()), 'Failed! Equal images have different keys!'
+        assert make_key('model', image) != make_key('model', image + 1), 'Failed! Different images have the same key!'
+        assert make_key('model', 'ab', 'c') != make_key('model', 'a', 'bc'), 'Failed! Different requests collide!'
+        assert make_key(Image.fromarray(image)) == make_key(Image.fromarray(image)), 'Failed! Equal PIL images differ!'
+
+
+class TestResultCache:
+    def test_memory_hits_and_lru(self):
+        """
+        Test that results are reused from memory and the least recently used result is dropped.
+        """
+        cache = ResultCache(max_items=2)
+        calls = []
+
+        def compute(value):
+            calls.append(value)
+            return value
+
+        for key in ['a', 'b', 'a', 'c', 'b']:
+            cache.get_or_compute(key, lambda: compute(key))
+
+        stats = cache.stats()
+        assert calls == ['a', 'b', 'c', 'b'], 'Failed! Unexpected computations!'
+        assert stats['hits'] == 1 and stats['misses'] == 4, 'Failed! Unexpected hits and misses!'
+        assert stats['hit_rate'] == 0.2, 'Failed! Unexpected hit rate!'
+        assert len(cache) == 2, 'Failed! Unexpected number of results in memory!'
+
+    def test_disk_tier(self, tmp_path):
+        """
+        Test that images and JSON results are saved on disk and reused by a new cache.
+        """
+        image = Image.new('RGB', (8, 8), (255, 0, 0))
+        cache = ResultCache(disk_dir=str(tmp_path))
+        cache.get_or_compute('image', lambda: image)
+        cache.get_or_compute('label', lambda: 'tabby cat')
+
+        assert sorted(path.name for path in tmp_path.iterdir()) == ['image.png', 'label.json'], 'Failed! Files not saved!'
+
+        new_cache = ResultCache(disk_dir=str(tmp_path))
+        cached_image = new_cache.get_or_compute('image', lambda: pytest.fail('Image was computed again'))
+        cached_label = new_cache.get_or_compute('label', lambda: pytest.fail('Label was computed again'))
+
+        assert np.array_equal(np.array(cached_image), np.array(image)), 'Failed! Unexpected cached image!'
+        assert cached_label == 'tabby cat', 'Failed! Unexpected cached label!'
+        assert new_cache.stats()['disk_hits'] == 2, 'Failed! Disk hits were not counted!'
+
+    def test_disk_size_limit(self, tmp_path):
+        """
+        Test that the oldest files are deleted when the disk tier exceeds its size limit.
+        """
+        cache = ResultCache(disk_dir=str(tmp_path), max_disk_bytes=30)
+        for key in ['a', 'b', 'c']:
+            cache.get_or_compute(key, lambda: 'x' * 10)  # 12 bytes of JSON per result
+
+        assert sorted(path.name for path in tmp_path.iterdir()) == ['b.json', 'c.json'], 'Failed! Oldest file was kept!'
+        assert cache.stats()['disk_bytes'] <= 30, 'Failed! Disk tier exceeds its size limit!'
+
+    def test_identical_requests_are_deduplicated(self):
+        """
+        Test that concurrent identical requests wait for a single computation.
+        """
+        cache = ResultCache()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            release.wait()
+            return 'result'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('key', compute))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1, 'Failed! Identical requests were computed several times!'
+        assert results == ['result'] * 3, 'Failed! Callers did not get the result!'
+        assert cache.stats()['deduplicated'] == 2, 'Failed! Deduplicated requests were not counted!'
+
+    def test_errors_are_not_cached(self):
+        """
+        Test that a failed computation is raised and computed again by the next request.
+        """
+        cache = ResultCache()
+
+        def compute():
+            raise ValueError('Mock failure')
+
+        with pytest.raises(ValueError):
+            cache.get_or_compute('key', compute)
+
+        assert cache.get_or_compute('key', lambda: 'result') == 'result', 'Failed! Failed result was cached!'
@@ -0,0 +1,57 @@
+from multihugginggradio.utils.session.session_store import SessionStore
+
+
+class TestSessionStore:
+    def test_sessions_are_isolated(self):
+        """
+        Test that each session gets its own state.
+        """
+        sessions = SessionStore(factory=list)
+
+        sessions.get('session_a').append('Hello!')
+
+        assert sessions.get('session_a') == ['Hello!'], 'Failed! Session state was not kept!'
+        assert sessions.get('session_b') == [], 'Failed! Session states are shared!'
+        assert len(sessions) == 2, 'Failed! Unexpected number of sessions!'
+
+    def test_idle_sessions_expire(self, clock):
+        """
+        Test that sessions idle for longer than the TTL are removed.
+        """
+        sessions = SessionStore(factory=list, ttl=10, clock=clock)
+
+        sessions.get('session_a').append('Hello!')
+        clock.now = 5
+        sessions.get('session_b')
+        clock.now = 12
+
+        assert 'session_a' not in sessions, 'Failed! Idle session did not expire!'
+        assert 'session_b' in sessions, 'Failed! Active session expired!'
+        assert sessions.get('session_a') == [], 'Failed! Expired session kept its state!'
+        assert sessions.stats()['expired'] == 1, 'Failed! Unexpected number of expired sessions!'
+
+    def test_max_sessions(self):
+        """
+        Test that the least recently used session is evicted when the limit is exceeded.
+        """
+        sessions = SessionStore(factory=list, max_sessions=2)
+
+        sessions.get('session_a')
+        sessions.get('session_b')
+        sessions.get('session_a')
+        sessions.get('session_c')
+
+        assert 'session_b' not in sessions, 'Failed! Least recently used session was not evicted!'
+        assert sessions.stats() == {'active': 2, 'created': 3, 'expired': 0, 'evicted': 1}, \
+            'Failed! Unexpected session statistics!'
+
+    def test_discard(self):
+        """
+        Test that a discarded session is removed from the store.
+        """
+        sessions = SessionStore(factory=list)
+
+        sessions.get('session_a')
+        sessions.discard('session_a')
+
+        assert len(sessions) == 0, 'Failed! Discarded session was kept!'
@@ -0,0 +1,114 @@
+import multiprocessing
+import numpy as np
+import pytest
+from PIL import Image
+
+from multihugginggradio.utils.transport.shared_images import SharedImagePool, ImageHandle, put_images, open_images
+
+
+def read_checksum(connection):
+    """
+    Read the images sent as handles by the parent process and reply with the sum of their pixels.
+    """
+    pool = SharedImagePool()
+    while True:
+        handle = connection.recv()
+        if handle is None:
+            break
+        connection.send(int(pool.open(handle).sum()))
+    pool.close()
+
+
+@pytest.fixture
+def pool():
+    """
+    Fixture providing a SharedImagePool that is closed after the test.
+    """
+    pool = SharedImagePool(max_free_segments=2)
+    yield pool
+    pool.close()
+
+
+class TestSharedImagePool:
+    """
+    Test class for the shared memory transport of the images.
+    """
+    def test_round_trip(self, pool):
+        """
+        Test that arrays and PIL images are read back unchanged, in place or as copies.
+        """
+        array = np.random.default_rng(0).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+        handle = pool.put(array)
+
+        assert np.array_equal(pool.open(handle), array), 'Failed! The image read in place differs'
+        assert not pool.open(handle).flags.writeable, 'Failed! The image read in place can be modified'
+        copy = pool.get(handle)
+        assert isinstance(copy, np.ndarray) and np.array_equal(copy, array), 'Failed! The copied array differs'
+
+        for mode in ('RGB', 'RGBA', 'L'):
+            image = Image.fromarray(array).convert(mode)
+            copy = pool.get(pool.put(image))
+            assert copy.mode == mode and np.array_equal(np.asarray(copy), np.asarray(image)), \
+                f'Failed! The copied {mode} image differs'
+
+    def test_segment_reuse(self, pool):
+        """
+        Test that released segments are reused by images of the same size class, and that at most
+        `max_free_segments` released segments are kept.
+        """
+        handles = [pool.put(np.zeros((100, 100, 3), dtype=np.uint8)) for _ in range(4)]
+        assert pool.stats()['created'] == 4, 'Failed! Expected a segment per image in use'
+
+        for handle in handles:
+            pool.release(handle)
+        stats = pool.stats()
+        assert stats['owned'] == 2 and stats['in_use'] == 0, 'Failed! Expected two free segments kept'
+
+        handle = pool.put(np.ones((101, 99, 3), dtype=np.uint8))
+        assert pool.stats()['reused'] == 1, 'Failed! An image of the same size class did not reuse a segment'
+        assert handle.name in {h.name for h in handles}, 'Failed! The reused segment is not a released one'
+
+        pool.release(handle)
+        with pytest.raises(ValueError):
+            pool.release(handle)
+
+    def test_nested_values(self, pool):
+        """
+        Test that the images of nested arguments are replaced with handles and back.
+        """
+        image = Image.new('RGB', (8, 8), (10, 20, 30))
+        array = np.full((4, 4), 7, dtype=np.uint8)
+        value = ([image, 'prompt'], {'images': (array,), 'scores': np.zeros(3, dtype=np.float32)})
+
+        handles = []
+        shared = put_images(value, pool, handles)
+        assert len(handles) == 2 and isinstance(shared[0][0], ImageHandle), 'Failed! Expected two images put'
+        assert shared[0][1] == 'prompt' and shared[1]['scores'].dtype == np.float32, \
+            'Failed! Values that are not uint8 images were changed'
+
+        restored = open_images(shared, pool, copy=True)
+        assert restored[0][0].tobytes() == image.tobytes(), 'Failed! The PIL image was not restored'
+        assert np.array_equal(restored[1]['images'][0], array), 'Failed! The array was not restored'
+
+    def test_other_process(self, pool, project_path):
+        """
+        Test that another process reads the images in place from their handles.
+        """
+        context = multiprocessing.get_context('spawn')
+        connection, child_connection = context.Pipe()
+        process = context.Process(target=read_checksum, args=(child_connection,))
+        process.start()
+        child_connection.close()
+
+        try:
+            for seed in range(3):
+                array = np.random.default_rng(seed).integers(0, 256, (224, 224, 3), dtype=np.uint8)
+                handle = pool.put(array)
+                connection.send(handle)
+                assert connection.recv() == int(array.sum()), 'Failed! The other process read different pixels'
+                pool.release(handle)
+        finally:
+            connection.send(None)
+            process.join()
+
+        assert pool.stats()['created'] == 1, 'Failed! The segment was not reused across the requests'
@@ -0,0 +1,69 @@
+import os
+import json
+import torch
+
+from multihugginggradio.utils.profiling.stage_profiler import StageProfiler
+
+
+class TestStageProfiler:
+    def test_stages(self):
+        """
+        Test that the stages of a run are timed, summed and passed to the hooks.
+        """
+        profiler = StageProfiler('model')
+        runs = []
+        profiler.add_hook(runs.append)
+
+        with profiler.run():
+            for _ in range(2):
+                with profiler.stage('forward'):
+                    pass
+            with profiler.stage('decode'):
+                pass
+
+        # Stages outside of a run are not recorded
+        with profiler.stage('ignored'):
+            pass
+
+        assert len(runs) == 1, 'Failed! Hooks not called once per run!'
+        assert list(runs[0]) == ['forward', 'decode', 'total'], 'Failed! Unexpected stages!'
+        assert runs[0]['forward'] + runs[0]['decode'] <= runs[0]['total'], 'Failed! Stages longer than the run!'
+        assert set(profiler.stats()) == {'forward', 'decode', 'total'}, 'Failed! Unexpected stage statistics!'
+        assert profiler.stats()['forward']['count'] == 1, 'Failed! Repeated stage not summed in its run!'
+
+    def test_time_module(self):
+        """
+        Test that the forward passes of a module are timed as a stage.
+        """
+        profiler = StageProfiler('model')
+        module = torch.nn.Linear(4, 4)
+        handles = profiler.time_module(module, 'linear')
+
+        with profiler.run():
+            module(torch.zeros(1, 4))
+            module(torch.zeros(1, 4))
+
+        for handle in handles:
+            handle.remove()
+
+        assert 'linear' in profiler.stats(), 'Failed! Module forward passes not timed!'
+
+    def test_capture_trace(self, tmp_path):
+        """
+        Test that only the requested number of runs are recorded to trace files.
+        """
+        profiler = StageProfiler('org/model')
+        profiler.capture_trace(2, str(tmp_path))
+
+        for _ in range(3):
+            with profiler.run():
+                with profiler.stage('matmul'):
+                    torch.ones(8, 8) @ torch.ones(8, 8)
+
+        assert len(profiler.trace_files) == 2, 'Failed! Unexpected number of traces!'
+        assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for path in profiler.trace_files), \
+            'Failed! Trace files not written to the trace directory!'
+
+        with open(profiler.trace_files[0]) as file:
+            events = json.load(file)['traceEvents']
+        assert any(event.get('name') == 'matmul' for event in events), 'Failed! Stage not labelled in the trace!'